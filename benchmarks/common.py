@@ -0,0 +1,55 @@
+"""Helpers shared by the benchmark scripts in this directory."""
+import importlib.util
+import os
+import random
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONSOLE_PATH = os.path.join(REPO_ROOT, 'modules', 'rvc-console.py')
+DEFAULT_SPEC = os.path.join(REPO_ROOT, 'config', 'rvc', 'rvc.json')
+DEFAULT_MAPPING = os.path.join(REPO_ROOT, 'config', 'rvc', 'device_mapping.yml')
+
+def load_console(spec_path=DEFAULT_SPEC, mapping_path=DEFAULT_MAPPING):
+    """Imports rvc-console.py as a module and loads its config tables."""
+    spec = importlib.util.spec_from_file_location('rvc_console', CONSOLE_PATH)
+    console = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(console)
+    console.apply_config(console.ConfigSnapshot(*console.load_config_data(spec_path, mapping_path)))
+    return console
+
+def repeating_traffic(can_ids, count, change_rate, seed=1):
+    """
+    Returns count (id, payload) frames cycling through can_ids like periodic
+    status DGNs: each ID keeps its last payload and changes it with
+    probability change_rate.
+    """
+    rng = random.Random(seed)
+    payloads = {i: bytes(rng.randrange(256) for _ in range(8)) for i in can_ids}
+    frames = []
+    for n in range(count):
+        can_id = can_ids[n % len(can_ids)]
+        if rng.random() < change_rate:
+            payloads[can_id] = bytes(rng.randrange(256) for _ in range(8))
+        frames.append((can_id, payloads[can_id]))
+    return frames
+
+def light_status_frames(console, seed=1):
+    """
+    Returns one (id, payload) status frame per mapped light, with the instance
+    signal set so process_frame updates that light's state.
+    """
+    rng = random.Random(seed)
+    by_dgn = {}
+    for can_id, decoder in console.decoder_map.by_id.items():
+        by_dgn.setdefault(decoder.spec.get('dgn_hex', '').upper(), (can_id, decoder))
+    frames = []
+    for (dgn_hex, instance), config in console.status_lookup.items():
+        if config.get('entity_id') not in console.light_entity_ids or dgn_hex not in by_dgn or not instance.isdigit():
+            continue
+        can_id, decoder = by_dgn[dgn_hex]
+        raw = int.from_bytes(bytes(rng.randrange(256) for _ in range(8)), 'little')
+        for sig in decoder.spec.get('signals', []):
+            if sig['name'] == 'instance':
+                mask = ((1 << sig['length']) - 1) << sig['start_bit']
+                raw = (raw & ~mask) | (int(instance) << sig['start_bit'])
+        frames.append((can_id, raw.to_bytes(8, 'little')))
+    return frames
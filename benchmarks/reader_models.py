@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Compare rvc-console reader models (event loop vs. thread per interface).
+
+Floods virtual CAN interfaces from a separate process with frames taken from
+rvc.json, runs each reader model for a fixed time and reports frames/s and
+reader CPU time per frame. Needs vcan interfaces, e.g.:
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+    sudo ip link add dev vcan1 type vcan && sudo ip link set up vcan1
+"""
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+
+import can # type: ignore
+
+from common import DEFAULT_MAPPING, DEFAULT_SPEC, load_console
+
+def sender(interface, can_ids, stop):
+    """Sends random payloads for the given IDs as fast as the interface accepts them."""
+    bus = can.interface.Bus(channel=interface, interface='socketcan')
+    rng = random.Random(interface)
+    msgs = [can.Message(arbitration_id=i, data=bytes(rng.randrange(256) for _ in range(8)), is_extended_id=True) for i in can_ids]
+    while not stop.is_set():
+        for msg in msgs:
+            try:
+                bus.send(msg)
+            except can.CanError:
+                time.sleep(0.0005) # TX queue full, let the reader catch up
+    bus.shutdown()
+
+def run_model(console, model, interfaces, duration):
+    """Runs one reader model against live traffic and returns (frames, wall, cpu)."""
+    console.stop_event.clear()
+    console.latest_raw_records = {iface: {} for iface in interfaces}
+    count = [0]
+    process_frame = console.process_frame
+    def counting_process_frame(interface, arbitration_id, extended, data):
+        count[0] += 1
+        process_frame(interface, arbitration_id, extended, data)
+    console.process_frame = counting_process_frame
+
+    if model == 'loop':
+        threads = [threading.Thread(target=console.event_loop_reader, args=(interfaces,))]
+    else:
+        threads = [threading.Thread(target=console.reader_thread, args=(iface,)) for iface in interfaces]
+    for t in threads:
+        t.start()
+    time.sleep(0.5) # Let the buses open and the queues fill
+
+    frames0, wall0, cpu0 = count[0], time.perf_counter(), time.process_time()
+    time.sleep(duration)
+    frames, wall, cpu = count[0] - frames0, time.perf_counter() - wall0, time.process_time() - cpu0
+
+    stop0 = time.perf_counter()
+    console.stop_readers()
+    for t in threads:
+        t.join()
+    shutdown = time.perf_counter() - stop0
+    console.process_frame = process_frame
+    return frames, wall, cpu, shutdown
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('-i', '--interfaces', nargs='+', default=['vcan0', 'vcan1'])
+    p.add_argument('-t', '--duration', type=float, default=10.0, help='Seconds to measure each model')
+    p.add_argument('-m', '--models', nargs='+', choices=['loop', 'threads'], default=['threads', 'loop'])
+    p.add_argument('-d', '--definitions', default=DEFAULT_SPEC)
+    p.add_argument('--mapping', default=DEFAULT_MAPPING)
+    args = p.parse_args()
+
+    console = load_console(args.definitions, args.mapping)
+    console.change_detection = False # The senders repeat payloads; measure the full decode path
+    can_ids = list(console.decoder_map.by_id)
+
+    stop = multiprocessing.Event()
+    senders = [multiprocessing.Process(target=sender, args=(iface, can_ids, stop), daemon=True) for iface in args.interfaces]
+    for s in senders:
+        s.start()
+    try:
+        print(f"{'model':<8} {'frames/s':>10} {'cpu %':>7} {'us cpu/frame':>13} {'shutdown s':>11}")
+        for model in args.models:
+            frames, wall, cpu, shutdown = run_model(console, model, args.interfaces, args.duration)
+            per_frame = (cpu / frames * 1e6) if frames else float('nan')
+            print(f"{model:<8} {frames / wall:>10.0f} {cpu / wall * 100:>7.1f} {per_frame:>13.1f} {shutdown:>11.3f}")
+    finally:
+        stop.set()
+        for s in senders:
+            s.join(timeout=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Benchmark the decode, reader, config-load, render and startup paths and save the results as JSON.
+
+Runs on synthetic RV-C traffic built from rvc.json and device_mapping.yml, so
+no CAN hardware or terminal is needed: the reader reads from a fake bus and
+the draw functions paint into a fake curses window. Each benchmark is run
+several times and the best time per operation is kept. Startup is timed by
+running the scripts with --help in a fresh interpreter, once plainly and once
+under -X importtime to see which imports the time goes to; before anything is
+timed, the suite fails if --help loads a module that is meant to be imported
+lazily (LAZY_IMPORTS). Compare two runs
+with --compare to spot regressions:
+
+    python3 suite.py -o before.json
+    python3 suite.py -o after.json --compare before.json
+"""
+import argparse
+import curses
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import can # type: ignore
+
+from common import (CONSOLE_PATH, DEFAULT_MAPPING, DEFAULT_SPEC, REPO_ROOT, light_status_frames, load_console,
+                    repeating_traffic)
+
+sys.path.insert(0, os.path.join(REPO_ROOT, 'modules'))
+import live_can_decoder # noqa: E402
+DECODER_PATH = live_can_decoder.__file__
+DEFAULT_OUTPUT = os.path.relpath(os.path.join(REPO_ROOT, 'benchmarks', 'bench-results.json')) # Ignored by git
+from rvc_decoder import DecoderIndex, MessageDecoder # noqa: E402
+
+# --- Fakes ---
+class FakeBus:
+    """ Stands in for a python-can Bus (or RawCanBus with batches) and stops the reader when drained. """
+    def __init__(self, console, messages, batch_size=64):
+        self.console = console
+        self.messages = messages
+        self.batch_size = batch_size
+        self.pos = 0
+
+    def recv(self, timeout=None):
+        if self.pos >= len(self.messages):
+            self.console.stop_event.set()
+            return None
+        msg = self.messages[self.pos]
+        self.pos += 1
+        return msg
+
+    def recv_batch(self, timeout=0):
+        if self.pos >= len(self.messages):
+            self.console.stop_event.set()
+            return []
+        batch = self.messages[self.pos:self.pos + self.batch_size]
+        self.pos += len(batch)
+        return [(0.0, msg.arbitration_id, msg.is_extended_id, memoryview(msg.data)) for msg in batch]
+
+class FakeWindow:
+    """ The subset of a curses window RowRenderer uses, writing into in-memory rows. """
+    def __init__(self, h, w):
+        self.h, self.w = h, w
+        self.clear()
+
+    def clear(self):
+        self.lines = [[' '] * self.w for _ in range(self.h)]
+
+    def move(self, y, x):
+        if not 0 <= y < self.h:
+            raise curses.error()
+
+    def clrtoeol(self):
+        pass
+
+    def addnstr(self, y, x, text, n, attr=0):
+        text = str(text)[:n]
+        self.lines[y][x:x + len(text)] = text[:self.w - x]
+
+# --- Benchmarks ---
+def best_per_op(fn, ops, repeat):
+    """Runs fn() repeat times; returns (best, all) seconds per operation."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) / ops)
+    return min(runs), runs
+
+def reset_state(console):
+    console.latest_raw_records = {'can0': {}}
+    console.raw_orders.clear()
+    console.invalidate_payload_cache()
+    console.light_device_states.clear()
+
+def bench_decode_payload(console, frames, repeat):
+    decode_payload = console.decode_payload
+    lookup = console.decoder_map.lookup
+    pairs = [(lookup(can_id)[0], payload) for can_id, payload in frames]
+    pairs = [(d, p) for d, p in pairs if d is not None]
+    def run():
+        for decoder, payload in pairs:
+            decode_payload(decoder, payload)
+    return best_per_op(run, len(pairs), repeat)
+
+def bench_decode_message(spec_path, frames, repeat):
+    with open(spec_path) as f:
+        jd = json.load(f)
+    msg_defs = DecoderIndex() # Built the way live_can_decoder.main() does
+    for msg in jd['messages']:
+        msg_defs.add(msg['id'], MessageDecoder(msg))
+    messages = [can.Message(arbitration_id=can_id, data=payload, is_extended_id=True) for can_id, payload in frames]
+    decode_message = live_can_decoder.decode_message
+    def run():
+        for msg in messages:
+            decode_message(msg, msg_defs)
+    return best_per_op(run, len(messages), repeat)
+
+def bench_reader(console, frames, repeat, backend):
+    """Runs reader_thread over a fake bus; one operation is one received frame."""
+    messages = [can.Message(arbitration_id=can_id, data=payload, is_extended_id=True) for can_id, payload in frames]
+    open_reader_bus, close_reader_bus = console.open_reader_bus, console.close_reader_bus
+    console.close_reader_bus = lambda interface, bus: None
+    def run():
+        reset_state(console)
+        console.stop_event.clear()
+        bus = FakeBus(console, messages)
+        console.open_reader_bus = lambda interface, backend='python-can': bus
+        console.reader_thread('can0', backend)
+    try:
+        return best_per_op(run, len(messages), repeat)
+    finally:
+        console.open_reader_bus, console.close_reader_bus = open_reader_bus, close_reader_bus
+        console.stop_event.clear()
+
+def bench_load_config(console, spec_path, mapping_path, repeat, cached=False):
+    """Times load_config_data, or with cached a load_config_cached hit (the cache is primed first)."""
+    logger = logging.getLogger()
+    level = logger.level
+    logger.setLevel(logging.WARNING) # load_config_data logs every step; keep that out of the timing
+    try:
+        if not cached:
+            return best_per_op(lambda: console.load_config_data(spec_path, mapping_path), 1, repeat)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            console.load_config_cached(spec_path, mapping_path, cache_dir)
+            return best_per_op(lambda: console.load_config_cached(spec_path, mapping_path, cache_dir), 1, repeat)
+    finally:
+        logger.setLevel(level)
+
+def bench_draw(console, frames, repeat, tab, iterations, repaint):
+    """
+    Draws one tab into a fake 50x200 window through RowRenderer. With repaint
+    every frame is invalidated first (full repaint); otherwise unchanged rows
+    are skipped as in the live UI.
+    """
+    reset_state(console)
+    for can_id, payload in frames:
+        console.process_frame('can0', can_id, True, payload)
+    h, w = 50, 200
+    screen = console.RowRenderer(FakeWindow(h, w))
+    max_rows = h - 6
+    state = {'selected_idx': 3, 'v_offset': 0, 'sort_mode': 0}
+    if tab == 'lights':
+        items = [console.light_device_states[e] for e in console.light_order.ids(0) if e in console.light_device_states]
+        draw = lambda: console.draw_lights_tab(screen, h, w, max_rows, state, items)
+    else:
+        recs = console.latest_raw_records['can0'].copy()
+        names = console.raw_orders['can0'].ids(0)
+        draw = lambda: console.draw_raw_can_tab(screen, h, w, max_rows, state, 'can0', names, recs)
+    def run():
+        for _ in range(iterations):
+            screen.begin(h, w)
+            if repaint:
+                screen.invalidate()
+            draw()
+            screen.flush()
+    return best_per_op(run, iterations, repeat)
+
+# -X importtime lines: "import time: <self us> | <cumulative us> | <indent><module>"
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+# Packages only the paths that use them import; --help must not load any of them
+LAZY_IMPORTS = ('can', 'yaml', 'curses', 'json', 'tempfile', 'hashlib', 'pickle', 'ctypes', 'mmap')
+
+def importtime(script):
+    """-X importtime output of `script --help`."""
+    return subprocess.run([sys.executable, '-X', 'importtime', script, '--help'], capture_output=True,
+                          text=True, check=True).stderr
+
+def check_lazy_imports(scripts):
+    """Exits with an error naming every LAZY_IMPORTS package that `--help` of one of the scripts loads."""
+    eager = []
+    for script in scripts:
+        loaded = {m.group(4).split('.')[0] for m in IMPORTTIME_LINE.finditer(importtime(script))}
+        names = [name for name in LAZY_IMPORTS if name in loaded]
+        if names:
+            eager.append(f"{os.path.basename(script)} --help imports {', '.join(names)}")
+    if eager:
+        sys.exit("Startup import check failed:\n  " + "\n  ".join(eager))
+
+def bench_startup(script, repeat):
+    """Wall time of `script --help` in a fresh interpreter; one operation is one start."""
+    command = [sys.executable, script, '--help']
+    return best_per_op(lambda: subprocess.run(command, capture_output=True, check=True), 1, repeat)
+
+def bench_imports(script, repeat, top=8):
+    """
+    Runs `script --help` under -X importtime; one operation is all top-level imports.
+    The costliest imports of the fastest run are kept in the result as 'top_imports_us'.
+    """
+    runs = []
+    for _ in range(repeat):
+        stderr = importtime(script)
+        times = {}
+        for m in IMPORTTIME_LINE.finditer(stderr):
+            if not m.group(3): # Imported by the script itself, not by another module
+                times[m.group(4)] = int(m.group(2))
+        runs.append((sum(times.values()) / 1e6, times))
+    best, times = min(runs, key=lambda run: run[0])
+    top_imports = {name: us for name, us in sorted(times.items(), key=lambda item: -item[1])[:top]}
+    return best, [run[0] for run in runs], {'top_imports_us': top_imports}
+
+# --- Results ---
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Prints the change against a previous results file; returns names slower by more than threshold."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"\nvs {baseline_path}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = result['us_per_op'] / old['us_per_op'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<34} {old['us_per_op']:>12.2f} -> {result['us_per_op']:>12.2f} us/op  {change:+7.1%}{flag}")
+    return regressions
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('-n', '--frames', type=int, default=50000, help='Synthetic frames per decode/reader run')
+    p.add_argument('-c', '--change-rate', type=float, default=0.05, help='Probability that a frame carries a new payload')
+    p.add_argument('-r', '--repeat', type=int, default=5, help='Runs per benchmark; the fastest is reported')
+    p.add_argument('--draw-iterations', type=int, default=200, help='Frames drawn per render run')
+    p.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='JSON file to write the results to (default: %(default)s)')
+    p.add_argument('--compare', metavar='BASELINE', help='Previous results file to compare against')
+    p.add_argument('--threshold', type=float, default=0.10, help='Slowdown (fraction) reported as a regression by --compare')
+    p.add_argument('-d', '--definitions', default=DEFAULT_SPEC)
+    p.add_argument('--mapping', default=DEFAULT_MAPPING)
+    args = p.parse_args()
+
+    check_lazy_imports([CONSOLE_PATH, DECODER_PATH])
+    curses.color_pair = lambda n: n << 8 # The real one needs initscr(); the draw code only passes it through
+    console = load_console(args.definitions, args.mapping)
+    console.curses = curses # Otherwise only imported when the UI starts
+    frames = repeating_traffic(list(console.decoder_map.by_id), args.frames, args.change_rate)
+    lights = light_status_frames(console)
+    frames = [f for pair in zip(frames, lights * (len(frames) // max(1, len(lights)) + 1)) for f in pair][:args.frames]
+
+    benchmarks = [
+        ('decode_payload', lambda: bench_decode_payload(console, frames, args.repeat)),
+        ('live_can_decoder.decode_message', lambda: bench_decode_message(args.definitions, frames, args.repeat)),
+        ('reader_thread', lambda: bench_reader(console, frames, args.repeat, 'python-can')),
+        ('reader_thread[raw]', lambda: bench_reader(console, frames, args.repeat, 'raw')),
+        ('load_config_data', lambda: bench_load_config(console, args.definitions, args.mapping, args.repeat)),
+        ('load_config_cached', lambda: bench_load_config(console, args.definitions, args.mapping, args.repeat, cached=True)),
+        ('draw_lights_tab', lambda: bench_draw(console, frames, args.repeat, 'lights', args.draw_iterations, False)),
+        ('draw_lights_tab[repaint]', lambda: bench_draw(console, frames, args.repeat, 'lights', args.draw_iterations, True)),
+        ('draw_raw_can_tab', lambda: bench_draw(console, frames, args.repeat, 'raw', args.draw_iterations, False)),
+        ('draw_raw_can_tab[repaint]', lambda: bench_draw(console, frames, args.repeat, 'raw', args.draw_iterations, True)),
+        ('startup[rvc-console --help]', lambda: bench_startup(CONSOLE_PATH, args.repeat)),
+        ('imports[rvc-console --help]', lambda: bench_imports(CONSOLE_PATH, args.repeat)),
+        ('startup[live_can_decoder --help]', lambda: bench_startup(DECODER_PATH, args.repeat)),
+        ('imports[live_can_decoder --help]', lambda: bench_imports(DECODER_PATH, args.repeat)),
+    ]
+    results = {}
+    print(f"{'benchmark':<34} {'us/op':>12} {'ops/s':>12}")
+    for name, bench in benchmarks:
+        best, runs, *extra = bench()
+        results[name] = {'us_per_op': best * 1e6, 'ops_per_s': 1 / best if best else None,
+                         'runs_us': [r * 1e6 for r in runs]}
+        for details in extra:
+            results[name].update(details)
+        print(f"{name:<34} {best * 1e6:>12.2f} {1 / best if best else 0:>12.0f}")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_rev': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'frames': args.frames,
+            'change_rate': args.change_rate,
+            'repeat': args.repeat,
+            'spec': os.path.relpath(args.definitions, REPO_ROOT),
+            'mapping': os.path.relpath(args.mapping, REPO_ROOT),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,38 @@
 #!/usr/bin/env python3
 import argparse
-import json
-import can
+import os
 import sys
+import time
 
-def extract_raw_value(data_int, start_bit, bit_length):
-    """Grab a little‐endian bitfield out of data_int."""
-    mask = (1 << bit_length) - 1
-    return (data_int >> start_bit) & mask
+# rvc_decoder.py / rvc_socketcan.py / rvc_recorder.py are deployed next to this script (see modules/rvc.nix)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from rvc_decoder import MessageDecoder, DecoderIndex
+# python-can (~100 ms), json, rvc_socketcan and rvc_recorder are imported by the paths that use them
 
-def decode_message(msg, msg_defs):
-    """If we know this ID, extract all its signals. Return dict or None."""
-    d = msg_defs.get(msg.arbitration_id)
+def decode_frame(arbitration_id, data, msg_defs):
+    """Same as decode_message, for (id, data) pairs from the raw backend."""
+    d, _ = msg_defs.lookup(arbitration_id)
     if not d:
         return None  # no definition
-    raw = int.from_bytes(msg.data, byteorder="little")
-    out = {}
-    for sig in d["signals"]:
-        val = extract_raw_value(raw, sig["start_bit"], sig["length"])
-        if "scale" in sig:
-            val = val * sig["scale"]
-        if "offset" in sig:
-            val = val + sig["offset"]
-        out[sig["name"]] = val
-    return out
+    return d.values(data)
+
+def decode_message(msg, msg_defs):
+    """If we know this ID, extract all its signals. Return dict or None."""
+    return decode_frame(msg.arbitration_id, msg.data, msg_defs)
+
+def python_can_frames(bus):
+    """Yield (id, data, extended) from python-can, one can.Message per frame."""
+    while True:
+        msg = bus.recv()
+        if msg is None:
+            continue
+        yield msg.arbitration_id, msg.data, msg.is_extended_id
+
+def raw_frames(bus):
+    """Yield (id, data, extended) from batched recvmmsg() reads, no can.Message."""
+    while True:
+        for _, arb, extended, data in bus.recv_batch(timeout=None):
+            yield arb, data, extended
 
 def main():
     p = argparse.ArgumentParser(description="Live CAN → JSON “DBC” decoder")
@@ -31,9 +40,18 @@ def main():
                    help="socketcan interface (e.g. can0)")
     p.add_argument("-j", "--json", default="rvc.json",
                    help="path to JSON message definition")
+    p.add_argument("--raw", action="store_true",
+                   help="read with batched recvmmsg() on a raw AF_CAN socket instead of python-can")
+    p.add_argument("--record", metavar="PATH",
+                   help="also record every frame to a binary ring of files at PATH (read back with rvc_recorder.py)")
+    p.add_argument("--record-size", type=int, default=16,
+                   help="size of each recording segment in MB")
+    p.add_argument("--record-keep", type=int, default=4,
+                   help="number of recording segments to keep, including the active one")
     args = p.parse_args()
 
     # load your JSON defs
+    import json
     try:
         with open(args.json) as f:
             jd = json.load(f)
@@ -41,36 +59,46 @@ def main():
         print(f"❌ failed to load JSON file '{args.json}': {e}", file=sys.stderr)
         sys.exit(1)
 
-    msg_defs = { msg["id"]: msg for msg in jd["messages"] }
+    # compile each definition once up front; unmatched source addresses fall back by PGN
+    msg_defs = DecoderIndex()
+    for msg in jd["messages"]:
+        msg_defs.add(msg["id"], MessageDecoder(msg))
 
     # keep track of which IDs we've already reported
     seen_unknown = set()
     seen_failed  = set()
 
-    bus = can.interface.Bus(channel=args.interface, interface="socketcan")
+    if args.raw:
+        from rvc_socketcan import RawCanBus
+        bus = RawCanBus(args.interface)
+        frames = raw_frames(bus)
+    else:
+        import can
+        bus = can.interface.Bus(channel=args.interface, interface="socketcan")
+        frames = python_can_frames(bus)
+    recorder = None
+    if args.record:
+        from rvc_recorder import FrameRecorder
+        recorder = FrameRecorder(args.record, [args.interface], args.record_size << 20, args.record_keep)
     print(f"🛰  Listening on {args.interface}, defs from '{args.json}'…")
 
     try:
-        while True:
-            msg = bus.recv()
-            if msg is None:
-                continue
-
-            arb = msg.arbitration_id
-            raw = msg.data.hex()
-            msg_def = msg_defs.get(arb)
+        for arb, data, is_extended_id in frames:
+            if recorder is not None:
+                recorder.record(time.time(), args.interface, arb, is_extended_id, data)
+            msg_def, _ = msg_defs.lookup(arb)
 
             if msg_def is None:
                 if arb not in seen_unknown:
-                    print(f"ID: {arb:08X}  ext={msg.is_extended_id}  data={raw}")
+                    print(f"ID: {arb:08X}  ext={is_extended_id}  data={data.hex()}")
                     print(f"[{arb:08X}]  Unknown ID (no definition in JSON)")
                     seen_unknown.add(arb)
                 continue
 
-            decoded = decode_message(msg, msg_defs)
+            decoded = decode_frame(arb, data, msg_defs)
             if decoded is None:
                 if arb not in seen_failed:
-                    print(f"ID: {arb:08X}  ext={msg.is_extended_id}  data={raw}")
+                    print(f"ID: {arb:08X}  ext={is_extended_id}  data={data.hex()}")
                     print(f"[{arb:08X}]  Definition found but failed to decode")
                     seen_failed.add(arb)
                 continue
@@ -81,6 +109,9 @@ def main():
     except KeyboardInterrupt:
         print("\nStopping listener…")
         bus.shutdown()
+        if recorder is not None:
+            recorder.close()
+            print(f"Recorded {recorder.recorded} frames to {args.record} ({recorder.dropped} lost)")
 
 if __name__ == "__main__":
     main()
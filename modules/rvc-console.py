@@ -1,18 +1,31 @@
-import json
+import bisect
 import threading
 import textwrap
-import curses
+import itertools
 import time
 import sys
 import base64
-from collections import defaultdict, deque
-import can # type: ignore
-import yaml # type: ignore
+from collections import defaultdict, deque, namedtuple
 import os
 import threading
 import logging
 import argparse
 import queue
+import re
+import select
+import signal
+import selectors
+
+# Shared modules are installed next to this script in rvcScripts (see modules/rvc.nix),
+# which puts them on sys.path when it is run; this covers importing it from benchmarks/.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from rvc_decoder import MessageDecoder, DecoderIndex, pgn_of
+from rvc_transport import TransportReassembler, TP_PFS, STAT_NAMES as TRANSPORT_STAT_NAMES
+from rvc_tx import TxQueue, STAT_NAMES as TX_STAT_NAMES
+# curses, json, python-can, yaml, the config cache's hashlib/pickle and rvc_socketcan,
+# rvc_recorder, rvc_profiler and rvc_watch (ctypes, mmap) are imported by the paths that
+# use them, so --help, a config error or --headless don't pay for them
+curses = None # Imported when the UI starts
 
 # --- Configuration ---
 # Defaults, can be overridden by args
@@ -23,6 +36,163 @@ DEFAULT_DEVICE_MAPPING_PATH = '/etc/nixos/files/device_mapping.yaml'
 DEFAULT_INTERFACES = ['can0', 'can1']
 
 # --- Logging Setup ---
+class LogEntry:
+    """ One Logs tab line plus the fields filters and colouring need, taken once from the LogRecord. """
+    __slots__ = ('text', 'level', 'levelno', 'thread', 'message', 'color', 'wrapped')
+
+    def __init__(self, text, levelno=logging.INFO, thread='', message=None):
+        self.text = text # Formatted line as displayed and copied
+        self.levelno = levelno
+        self.level = logging.getLevelName(levelno)
+        self.thread = thread
+        self.message = text if message is None else message
+        # Curses colour pair: errors red, warnings yellow, debug magenta, rest white
+        if levelno >= logging.ERROR:
+            self.color = 7
+        elif levelno >= logging.WARNING:
+            self.color = 5
+        elif levelno <= logging.DEBUG:
+            self.color = 6
+        else:
+            self.color = 3
+        self.wrapped = None # (width, lines) cached by WrapLayout
+
+class WrapLayout:
+    """ Screen rows of wrapped log entries at one width.
+
+    Each entry's wrapped lines are cached on the entry for the current width,
+    and row_ends holds cumulative row counts so a scroll row maps to an entry
+    with bisect. Entries are appended and dropped from the front as the buffer
+    rolls; row_base is the row count of the entries already dropped.
+    """
+    def __init__(self, width=None):
+        self.width = width
+        self.row_ends = [] # row_ends[i] - row_base = rows used by entries 0..i
+        self.row_base = 0
+
+    def lines(self, entry):
+        cached = entry.wrapped
+        if cached is None or cached[0] != self.width:
+            cached = (self.width, textwrap.wrap(entry.text, self.width) or [''])
+            entry.wrapped = cached
+        return cached[1]
+
+    def append(self, entry):
+        last = self.row_ends[-1] if self.row_ends else self.row_base
+        self.row_ends.append(last + len(self.lines(entry)))
+
+    def popleft(self):
+        self.row_base = self.row_ends.pop(0)
+
+    def rebuild(self, entries, width):
+        self.width = width
+        self.row_ends = []
+        self.row_base = 0
+        if width:
+            for entry in entries:
+                self.append(entry)
+
+    def total_rows(self):
+        return self.row_ends[-1] - self.row_base if self.row_ends else 0
+
+    def start_row(self, idx):
+        return (self.row_ends[idx - 1] if idx else self.row_base) - self.row_base
+
+    def end_row(self, idx):
+        return self.row_ends[idx] - self.row_base
+
+    def entry_at_row(self, row):
+        """Index of the entry that covers screen row `row` of the whole list."""
+        return min(bisect.bisect_right(self.row_ends, row + self.row_base), max(0, len(self.row_ends) - 1))
+
+class LogFilter:
+    """ A parsed Logs tab filter.
+
+    Space-separated 'level:NAME' (that level and above) and 'thread:TEXT'
+    (substring of the thread name) predicates; the remaining text matches the
+    line as a substring, or as a regex when written as /pattern/. Raises
+    ValueError or re.error for a bad level or pattern.
+    """
+    def __init__(self, text=''):
+        self.text = text
+        self.min_level = 0
+        self.thread = None
+        self.substring = None
+        self.regex = None
+        words = []
+        for token in text.split():
+            key, sep, value = token.partition(':')
+            if sep and value and key.lower() == 'level':
+                level = logging.getLevelName(value.upper())
+                if not isinstance(level, int):
+                    raise ValueError(f"unknown level '{value}'")
+                self.min_level = level
+            elif sep and value and key.lower() == 'thread':
+                self.thread = value
+            else:
+                words.append(token)
+        pattern = ' '.join(words)
+        if len(pattern) >= 2 and pattern.startswith('/') and pattern.endswith('/'):
+            self.regex = re.compile(pattern[1:-1])
+        elif pattern:
+            self.substring = pattern
+
+    def matches(self, entry):
+        if entry.levelno < self.min_level:
+            return False
+        if self.thread is not None and self.thread not in entry.thread:
+            return False
+        if self.regex is not None:
+            return self.regex.search(entry.text) is not None
+        return self.substring is None or self.substring in entry.text
+
+class LogView:
+    """ The Logs tab buffer: the newest max_entries entries and, kept alongside, those matching the filter.
+
+    New entries are tested once as they arrive, so a redraw only reads the
+    visible window of `matches`; only changing the filter rescans the buffer.
+    """
+    def __init__(self, max_entries=500):
+        self.entries = deque(maxlen=max_entries)
+        self.matches = deque() # Subsequence of entries, oldest first
+        self.filter = LogFilter()
+        self.layout = WrapLayout() # Row offsets of `matches` while wrapping is on
+
+    def extend(self, new_entries):
+        layout = self.layout if self.layout.width else None
+        for entry in new_entries:
+            if len(self.entries) == self.entries.maxlen:
+                # The oldest entry is about to fall off; drop it from the matches too
+                if self.matches and self.matches[0] is self.entries[0]:
+                    self.matches.popleft()
+                    if layout:
+                        layout.popleft()
+            self.entries.append(entry)
+            if self.filter.matches(entry):
+                self.matches.append(entry)
+                if layout:
+                    layout.append(entry)
+
+    def set_wrap_width(self, width):
+        """Lays matches out at this width (None = no wrapping); a new width drops the old layout."""
+        if width != self.layout.width:
+            self.layout.rebuild(self.matches, width)
+
+    def set_filter(self, text):
+        """Parses and applies a new filter; a bad filter raises and leaves the current one in place."""
+        self.apply_filter(LogFilter(text))
+
+    def apply_filter(self, log_filter):
+        """Applies an already parsed LogFilter (e.g. the one another view uses)."""
+        self.filter = log_filter
+        self.matches = deque(e for e in self.entries if log_filter.matches(e))
+        self.layout.rebuild(self.matches, self.layout.width)
+
+    def clear(self):
+        self.entries.clear()
+        self.matches = deque()
+        self.layout.rebuild(self.matches, self.layout.width)
+
 # Custom handler to capture logs for the UI
 class ListLogHandler(logging.Handler):
     """ A logging handler that stores messages in a thread-safe queue. """
@@ -38,6 +208,7 @@ class ListLogHandler(logging.Handler):
         log_entry = self.format(record)
         try:
             # Put the formatted message onto the queue (non-blocking put)
+            log_entry = LogEntry(log_entry, record.levelno, record.threadName, record.getMessage())
             self.log_queue.put_nowait(log_entry)
         except queue.Full:
             # Handle queue full scenario if necessary (e.g., drop oldest or log an error)
@@ -51,6 +222,7 @@ class ListLogHandler(logging.Handler):
                 pass # Should not happen if queue was full
             except queue.Full:
                 pass # Should not happen after removing one
+        mark_dirty('logs') # Wake the UI if the Logs tab is on screen
 
     def get_records(self):
         """ Retrieve all currently available log records from the queue. """
@@ -62,10 +234,66 @@ class ListLogHandler(logging.Handler):
                 break
         # If messages were dropped, add a notification
         if (self.dropped_messages > 0):
-            records.append(f"... {self.dropped_messages} log messages dropped due to queue overflow ...")
+            records.append(LogEntry(f"... {self.dropped_messages} log messages dropped due to queue overflow ...", logging.WARNING))
             self.dropped_messages = 0 # Reset counter after notifying
         return records
 
+# --- Reader Trace Ring ---
+class TraceRing:
+    """ A fixed-size, preallocated ring of sampled reader trace records.
+
+    Used to debug device mappings without flooding the log queue: the reader
+    only touches it when `enabled` is set, records at most one frame in every
+    `sample_every` per PGN, and the Logs tab reads new records with
+    `entries_since()` into a LogView of its own.
+    """
+    def __init__(self, size=2000, sample_every=10):
+        self.size = size
+        self.sample_every = max(1, sample_every)
+        self.enabled = False
+        self.entries = [None] * size # Preallocated slots, overwritten in place
+        self.next_idx = 0
+        self.total = 0 # Records written since last clear (may exceed size)
+        self._pgn_counts = {}
+        self._lock = threading.Lock() # Taken only while tracing is enabled
+
+    def should_sample(self, pgn):
+        """ Count a frame for this PGN and report whether it is the one to keep. """
+        count = self._pgn_counts.get(pgn, 0)
+        self._pgn_counts[pgn] = count + 1
+        return count % self.sample_every == 0
+
+    def record(self, ts, interface, pgn_hex, instance, source_address, entity_id):
+        with self._lock:
+            self.entries[self.next_idx] = (ts, interface, pgn_hex, instance, source_address, entity_id)
+            self.next_idx = (self.next_idx + 1) % self.size
+            self.total += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries = [None] * self.size
+            self.next_idx = 0
+            self.total = 0
+            self._pgn_counts = {}
+
+    def entries_since(self, seen):
+        """
+        LogEntry lines for the records written after the first `seen` (only the
+        newest `size` if more were written), oldest first, and the new total to
+        pass next time. After a clear() pass 0 again.
+        """
+        with self._lock:
+            total = self.total
+            n = min(total - seen, self.size) if total >= seen else 0
+            raw = [self.entries[(self.next_idx - n + i) % self.size] for i in range(n)]
+        lines = []
+        for ts, interface, pgn_hex, instance, source_address, entity_id in raw:
+            target = entity_id if entity_id else "no mapping"
+            message = f"PGN={pgn_hex}, inst={instance}, SA=0x{source_address:02X} -> {target}"
+            lines.append(LogEntry(f"{time.strftime('%H:%M:%S', time.localtime(ts))} - TRACE - reader:{interface} - {message}",
+                                  logging.DEBUG, f"reader:{interface}", message))
+        return lines, total
+
 # Configure root logger
 log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s', datefmt='%H:%M:%S')
 # Configure file handler (optional, keep if useful)
@@ -82,6 +310,9 @@ console_handler.setFormatter(log_formatter)
 list_handler = ListLogHandler(max_entries=1000) # Increased size slightly
 list_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s:%(message)s', datefmt='%H:%M:%S'))
 
+# Sampled mapping trace, toggled at runtime from the UI ('T') or with --trace
+trace_ring = TraceRing()
+
 # Set overall logging level
 logging.getLogger().setLevel(logging.DEBUG) # Or DEBUG for more verbosity # <-- Set to DEBUG
 
@@ -99,10 +330,18 @@ logging.root.addHandler(list_handler)
 # REMOVED the first load_definitions function
 
 # Renamed function to load both spec and mapping
-def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
-    """Loads RVC spec and device mappings, identifying light devices and command info."""
+def load_config_data(rvc_spec_path, device_mapping_path, problems=None): # Accept paths as args
+    """
+    Loads RVC spec and device mappings, identifying light devices and command info.
+    A spec without messages or a missing, broken or empty mapping only logs a
+    warning; pass a list as problems to also get those reasons appended to it.
+    """
+    import json
+    if problems is None:
+        problems = []
     # Load RVC Spec
-    decoder_map = {} # Initialize decoder_map
+    decoder_map = DecoderIndex() # Exact-ID table with PGN/source-address fallbacks
+    spec_render_cache.clear() # Rendered JSON belongs to the previous spec entries
 
     # --- Pre-check RVC Spec File --- START
     logging.info(f"  [load_config_data] Pre-checking RVC spec file path: {rvc_spec_path}")
@@ -130,6 +369,7 @@ def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
             specs = spec_content.get('messages', []) # Default to empty list
             if not specs:
                  logging.warning(f"No 'messages' key found or it's empty in {rvc_spec_path}")
+                 problems.append(f"{rvc_spec_path}: no 'messages'")
 
         # Key by decimal ID, ensure 'id' exists and is convertible to int
         logging.info(f"  [load_config_data] Processing {len(specs)} spec entries...")
@@ -146,11 +386,12 @@ def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
                         # Handle unexpected type
                         raise TypeError(f"Unexpected type for 'id': {type(spec_id).__name__}")
 
-                    decoder_map[dec_id] = entry
                     # Add DGN hex string for easier lookup later
                     # entry['dgn_hex'] = f"{(dec_id >> 8) & 0x1FFFF:X}" # Extract DGN (17 bits for PF+PS/DA
                     # Add DGN hex string for easier lookup later (include Data-Page bit)
                     entry['dgn_hex'] = f"{(dec_id >> 8) & 0x3FFFF:X}"  # Extract full 18-bit PGN (DP+PF+PS)
+                    # Compile once so the reader never re-walks the signal dicts
+                    decoder_map.add(dec_id, MessageDecoder(entry))
                 except (ValueError, TypeError) as e:
                     # Log warning if ID is invalid or has an unexpected type
                     logging.warning(f"Skipping spec entry with invalid or unexpected 'id' {entry.get('id')}: {e}")
@@ -187,10 +428,14 @@ def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
     # Use argument path
     logging.info(f"  [load_config_data] Attempting to load device mapping: {device_mapping_path}")
     if os.path.exists(device_mapping_path):
+        import yaml # type: ignore # Only needed here, and skipped entirely on a config cache hit
         try:
             # Use argument path
             with open(device_mapping_path) as f:
                 raw_mapping = yaml.safe_load(f) or {} # Ensure raw_mapping is a dict even if file is empty
+                if not raw_mapping:
+                    logging.warning(f"Device mapping {device_mapping_path} is empty.")
+                    problems.append(f"{device_mapping_path}: no device mappings")
                 # Process into a more direct lookup table
                 templates = raw_mapping.get('templates', {})
                 device_mapping = raw_mapping # Keep raw for potential future use
@@ -286,8 +531,10 @@ def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
             logging.info(f"Found command info for {len(light_command_info)} lights.")
         except yaml.YAMLError as e:
              logging.warning(f"Could not parse device mapping YAML ({device_mapping_path}): {e}") # Use arg path
+             problems.append(f"{device_mapping_path}: {e}")
         except Exception as e:
             logging.warning(f"Could not load or process device mapping ({device_mapping_path}): {e}") # Use arg path
+            problems.append(f"{device_mapping_path}: {e}")
             # Continue without device mapping if it fails, but initialize relevant vars
             device_mapping = {}
             device_lookup = {}
@@ -297,6 +544,7 @@ def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
             light_command_info = {}
     else:
         logging.warning(f"Device mapping file not found ({device_mapping_path}). Mapped Devices/Lights tabs will be empty.") # Use arg path
+        problems.append(f"{device_mapping_path}: not found")
         # Ensure vars are initialized even if file not found
         device_mapping = {}
         device_lookup = {}
@@ -309,32 +557,201 @@ def load_config_data(rvc_spec_path, device_mapping_path): # Accept paths as args
     # Return all relevant loaded/processed data, including status_lookup
     return decoder_map, device_mapping, device_lookup, status_lookup, light_entity_ids, entity_id_lookup, light_command_info
 
-# --- Decoding Helpers ---
-def get_bits(data_bytes, start_bit, length):
-    raw_int = int.from_bytes(data_bytes, byteorder='little')
-    mask = (1 << length) - 1
-    return (raw_int >> start_bit) & mask
-
-# Decode signals per spec entry
-def decode_payload(entry, data_bytes):
-    decoded = {}
-    raw_values = {}
-    for sig in entry.get('signals', []):
-        raw = get_bits(data_bytes, sig['start_bit'], sig['length'])
-        raw_values[sig['name']] = raw # Store raw integer value
-        val = raw * sig.get('scale', 1) + sig.get('offset', 0)
-        unit = sig.get('unit', '')
-        # Smart formatting based on type/scale
-        if 'enum' in sig:
-             formatted = sig['enum'].get(str(raw), f"UNKNOWN ({raw})")
-        elif sig.get('scale', 1) != 1 or sig.get('offset', 0) != 0 or isinstance(val, float):
-             formatted = f"{val:.2f}{unit}"
+# --- Config Cache ---
+# Bump when load_config_data's output changes shape; edits to this script or rvc_decoder.py also miss the cache
+CONFIG_CACHE_VERSION = '1'
+CONFIG_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'rvc-console')
+
+def config_cache_key(paths):
+    """Content hash of the given files plus the code that processes them."""
+    import hashlib
+    digest = hashlib.sha256(f"{CONFIG_CACHE_VERSION}:{sys.version_info[:2]}".encode())
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in (*paths, os.path.abspath(__file__), os.path.join(code_dir, 'rvc_decoder.py')):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+def load_config_cached(rvc_spec_path, device_mapping_path, cache_dir=CONFIG_CACHE_DIR, problems=None):
+    """
+    Same tables as load_config_data, read from a pickle in cache_dir when the spec,
+    mapping and code are unchanged since it was written. On a miss the files are
+    processed as usual and the result is cached for next time, unless
+    load_config_data reported problems (see its problems argument); cache_dir=None
+    or an unusable cache directory just loads without caching.
+    """
+    import pickle
+    if problems is None:
+        problems = []
+    if not cache_dir:
+        return load_config_data(rvc_spec_path, device_mapping_path, problems)
+    try:
+        key = config_cache_key([rvc_spec_path, device_mapping_path])
+    except OSError:
+        return load_config_data(rvc_spec_path, device_mapping_path, problems) # Missing file: let the loader report it
+    cache_path = os.path.join(cache_dir, f"config-{key}.pickle")
+    try:
+        with open(cache_path, 'rb') as f:
+            tables = pickle.load(f)
+        spec_render_cache.clear()
+        logging.info(f"Loaded config tables from cache {cache_path}")
+        return tables
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable config cache {cache_path}: {e}")
+
+    tables = load_config_data(rvc_spec_path, device_mapping_path, problems)
+    if problems:
+        # Cached, the degraded tables would load without the warnings on every later start
+        logging.warning(f"Not caching config tables: {'; '.join(problems)}")
+        return tables
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path) # Readers never see a partial file
+        # Only the current tables are worth keeping
+        for name in os.listdir(cache_dir):
+            if name.startswith('config-') and name.endswith('.pickle') and name != os.path.basename(cache_path):
+                os.remove(os.path.join(cache_dir, name))
+        logging.info(f"Cached config tables in {cache_path}")
+    except OSError as e:
+        logging.warning(f"Could not write config cache in {cache_dir}: {e}")
+    return tables
+
+# --- Config Hot Reload ---
+# The tables load_config_data returns, swapped in as one unit and never modified afterwards
+ConfigSnapshot = namedtuple('ConfigSnapshot', ['decoder_map', 'device_mapping', 'device_lookup', 'status_lookup',
+                                               'light_entity_ids', 'entity_id_lookup', 'light_command_info'])
+CONFIG_RELOAD_DEBOUNCE = 0.5 # Seconds of quiet after a file event before reloading
+config_sources = None # (spec path, mapping path, cache dir) the tables were loaded from
+config_key = None # config_cache_key of those files when they were loaded
+config_watcher = None # FileWatcher on the spec and mapping (disabled with --no-reload)
+
+def apply_config(snapshot):
+    """Installs a ConfigSnapshot: first the module-level tables the UI reads, then the snapshot the readers use."""
+    global decoder_map, device_mapping, device_lookup, status_lookup, light_entity_ids, entity_id_lookup
+    global light_command_info, config_snapshot
+    (decoder_map, device_mapping, device_lookup, status_lookup,
+     light_entity_ids, entity_id_lookup, light_command_info) = snapshot
+    # One reference store: a reader sees all of the old tables or all of the new ones
+    config_snapshot = snapshot
+
+def reload_config():
+    """
+    Rebuilds the tables from the spec and mapping files and swaps them in while the
+    readers keep running. Called on the watcher thread; if either file is missing,
+    empty or does not parse, the current tables stay in place.
+    """
+    global config_key
+    rvc_spec_path, device_mapping_path, cache_dir = config_sources
+    try:
+        key = config_cache_key([rvc_spec_path, device_mapping_path])
+    except OSError as e:
+        logging.warning(f"Config not reloaded, keeping the current tables: {e}")
+        return
+    if key == config_key:
+        return # Rewritten with the same content
+    problems = []
+    try:
+        snapshot = ConfigSnapshot(*load_config_cached(rvc_spec_path, device_mapping_path, cache_dir, problems))
+    except SystemExit as e: # load_config_data exits on errors it cannot recover from at startup
+        logging.warning(f"Config not reloaded, keeping the current tables: {e}")
+        return
+    except Exception:
+        logging.exception("Config not reloaded, keeping the current tables")
+        return
+    if problems:
+        logging.warning(f"Config not reloaded, keeping the current tables: {'; '.join(problems)}")
+        return
+    apply_config(snapshot)
+    config_key = key
+    invalidate_payload_cache() # Entries also carry their snapshot; this just frees the old ones
+    sync_light_states(snapshot)
+    refresh_kernel_filters()
+    logging.info(f"Reloaded config: {len(snapshot.decoder_map)} RVC message specs, "
+                 f"{len(snapshot.light_entity_ids)} lights")
+    mark_dirty('lights')
+
+def sync_light_states(snapshot):
+    """Adds placeholder states for newly mapped lights, drops unmapped ones and renames the rest."""
+    with light_states_lock:
+        for entity_id in [e for e in light_device_states if e not in snapshot.light_entity_ids]:
+            del light_device_states[entity_id]
+            light_order.remove(entity_id)
+        for entity_id, config in snapshot.entity_id_lookup.items():
+            if entity_id not in snapshot.light_entity_ids:
+                continue
+            names = {
+                'friendly_name': config.get('friendly_name', entity_id),
+                'suggested_area': config.get('suggested_area', 'Unknown'),
+                'mapping_config': config,
+            }
+            state = light_device_states.get(entity_id)
+            if state is not None:
+                renamed = any(state.get(k) != names[k] for k in ('friendly_name', 'suggested_area'))
+                state.update(names) # Keeps its last status
+                if renamed:
+                    light_order.rekey(entity_id, state)
+                continue
+            light_device_states[entity_id] = {
+                'entity_id': entity_id,
+                **names,
+                'last_updated': 0,
+                'last_interface': 'N/A',
+                'last_raw_values': {},
+                'last_decoded_data': {
+                    'state': 'OFF',        # start OFF
+                    'brightness': 0        # zero brightness
+                },
+            }
+            light_order.touch(entity_id, light_device_states[entity_id])
+
+def refresh_kernel_filters():
+    """Rebuilds the kernel filters for the current tables and installs them on the open buses."""
+    global kernel_filters
+    if kernel_filter_mode == 'all':
+        return
+    kernel_filters = build_kernel_filters(kernel_filter_mode)
+    with active_buses_lock:
+        buses = list(active_buses.items())
+    for interface, bus in buses:
+        try:
+            bus.set_filters(kernel_filters) # None receives everything again
+        except Exception as e:
+            logging.error(f"Could not update kernel filters on {interface}: {e}")
+            continue
+        if kernel_filters:
+            from rvc_socketcan import interface_rx_packets
+            filter_baseline[interface] = (interface_rx_packets(interface), frames_received[interface])
         else:
-             formatted = f"{int(val)}{unit}"
-        decoded[sig['name']] = formatted
-    return decoded, raw_values # Return both formatted and raw
+            filter_baseline.pop(interface, None)
+
+def start_config_watcher(rvc_spec_path, device_mapping_path):
+    global config_watcher
+    from rvc_watch import FileWatcher
+    config_watcher = FileWatcher([rvc_spec_path, device_mapping_path], reload_config, CONFIG_RELOAD_DEBOUNCE)
+    config_watcher.start()
+    logging.info(f"Watching {rvc_spec_path} and {device_mapping_path} for changes")
+
+# --- Decoding Helpers ---
+# Decode signals per compiled spec entry (see rvc_decoder.MessageDecoder)
+def decode_payload(decoder, data_bytes):
+    return decoder.decode(data_bytes) # Returns both formatted and raw
 
 # --- CAN Sending Helper ---
+def python_can():
+    """The python-can module, imported on first use: it adds ~100 ms to startup and the raw backend, replay and --help never need it."""
+    import can # type: ignore
+    return can
+
+def bus_errors(backend):
+    """Exceptions treated as CAN bus errors (rather than bugs) for this backend."""
+    return (OSError,) if backend == 'raw' else (python_can().CanError, OSError)
+
 # Modify send_can_command to accept a bus object
 def send_can_command(bus_object, can_id, data): # Takes bus object now
     """Sends a CAN message using a provided bus object."""
@@ -343,28 +760,258 @@ def send_can_command(bus_object, can_id, data): # Takes bus object now
          return False
     # Attempt to get the interface name for logging purposes
     interface_name = getattr(bus_object, 'channel_info', 'unknown_interface')
+    rvc_socketcan = sys.modules.get('rvc_socketcan') # Always loaded by then if the bus is a RawCanBus
+    backend = 'raw' if rvc_socketcan and isinstance(bus_object, rvc_socketcan.RawCanBus) else 'python-can'
     try:
         # Bus object is already created and passed in
         logging.debug(f"Preparing message for {interface_name}...")
-        msg = can.Message(arbitration_id=can_id, data=data, is_extended_id=True)
+        if backend == 'raw':
+            msg = rvc_socketcan.RawFrame(can_id, data)
+        else:
+            msg = python_can().Message(arbitration_id=can_id, data=data, is_extended_id=True)
         logging.debug(f"Message prepared: ID=0x{can_id:08X}, Data={data.hex().upper()}. Attempting send on {interface_name}...")
         bus_object.send(msg) # Use the passed bus object
         logging.debug(f"bus.send() completed for {interface_name}.")
         logging.info(f"Sent CAN msg on {interface_name}: ID=0x{can_id:08X}, Data={data.hex().upper()}")
         return True
-    except can.CanError as e:
+    except bus_errors(backend) as e:
         logging.error(f"CAN Error sending message on {interface_name}: {type(e).__name__} - {e}")
         return False
     except Exception as e:
         logging.error(f"Unexpected error sending CAN message on {interface_name}: {type(e).__name__} - {e}")
         return False
 
+# --- Transmit Queue ---
+# Commands go out on a TxQueue thread per interface so the UI never sleeps between a send and its retransmit
+TX_QUEUE_DEPTH = 64 # Transmissions (retransmits included) waiting per interface before commands are refused (--tx-queue-depth)
+COMMAND_REPEATS = 2 # Each light command is sent this many times...
+COMMAND_REPEAT_INTERVAL = 0.05 # ...this many seconds apart
+COALESCE_WINDOW = 0.15 # Brightness keys this close together become one SetLevel for the final level (--coalesce-window)
+COALESCE_MAX_WAIT = 0.5 # A held key still sends at least this often, so the light follows along
+BRIGHTNESS_TARGET_HOLD = 1.0 # Seconds +/- keep stepping from the last commanded level rather than a lagging status
+brightness_targets = {} # entity_id -> (last commanded brightness 0–100, time.monotonic())
+tx_queues = {} # interface -> TxQueue, created on first command
+tx_queues_lock = threading.Lock()
+
+def tx_queue(interface):
+    """The interface's TxQueue; it looks the bus up for every send, so a reconnected bus is picked up."""
+    with tx_queues_lock:
+        txq = tx_queues.get(interface)
+        if txq is None:
+            def send(can_id, data):
+                with active_buses_lock:
+                    bus = active_buses.get(interface)
+                return send_can_command(bus, can_id, data)
+            txq = tx_queues[interface] = TxQueue(interface, send, TX_QUEUE_DEPTH)
+        return txq
+
+def stop_tx_queues():
+    with tx_queues_lock:
+        queues = list(tx_queues.values())
+    for txq in queues:
+        txq.stop()
+
+def notify(message):
+    """Shows message in the notification line; safe to call from any thread."""
+    global copy_msg, copy_time
+    copy_msg = message
+    copy_time = time.time()
+    wake_ui()
+
+def command_can_id(dgn, priority=6, sa=0xF9, da=0xFF):
+    """29-bit ID for a command DGN sent from our source address (broadcast DA for PDU1)."""
+    dp = (dgn >> 16) & 1 # Data Page bit
+    pf = (dgn >> 8) & 0xFF # PDU Format
+    if pf < 0xF0: # PDU1: Prio | DP | PF | DA | SA
+        return (priority << 26) | (dp << 24) | (pf << 16) | (da << 8) | sa
+    return (priority << 26) | (dp << 24) | (pf << 16) | ((dgn & 0xFF) << 8) | sa # PDU2: PS in place of DA
+
+def queue_command(interface, can_id, data, label, key=None, delay=0.0):
+    """
+    Queues a command and its retransmits on the interface's TX thread and
+    returns at once. Progress shows in the notification as "label (n/2)".
+    A command with a key replaces an unsent one with the same key (see
+    TxQueue.submit). Returns False if the queue was full and nothing will be sent.
+    """
+    def sent(job, attempt):
+        notify(f"{label} ({len(job.sent_at)}/{job.repeats})")
+    def failed(job, attempt):
+        if not job.sent_at:
+            invalidate_payload_cache() # Nothing went out; let the next status frame undo the optimistic state
+        logging.error(f"Send {attempt + 1}/{job.repeats} failed for ID 0x{can_id:08X} on {interface}")
+        notify(f"{label} (send {attempt + 1}/{job.repeats} failed)")
+    logging.debug(f"→ Queueing CAN ID 0x{can_id:08X}: {data.hex().upper()} on {interface}")
+    job = tx_queue(interface).submit(can_id, data, COMMAND_REPEATS, COMMAND_REPEAT_INTERVAL, sent, failed,
+                                     key=key, delay=delay, max_delay=COALESCE_MAX_WAIT)
+    if job is None:
+        logging.warning(f"TX queue for {interface} is full; dropped ID 0x{can_id:08X}")
+        notify(f"{label}: TX queue for {interface} full, not sent")
+        return False
+    return True
+
+def tx_totals():
+    """TX counters summed over all interfaces, with queue depth and queue-to-wire latency in ms."""
+    totals = dict.fromkeys(TX_STAT_NAMES, 0)
+    totals['depth'] = totals['peak_depth'] = 0
+    latencies = []
+    press_latencies = []
+    with tx_queues_lock:
+        queues = list(tx_queues.values())
+    for txq in queues:
+        for name, count in txq.stats.items():
+            totals[name] += count
+        totals['depth'] += txq.depth
+        totals['peak_depth'] = max(totals['peak_depth'], txq.peak_depth)
+        latencies.extend(txq.latencies)
+        press_latencies.extend(txq.press_latencies)
+    totals['latency_avg_ms'] = round(sum(latencies) * 1000 / len(latencies), 2) if latencies else 0.0
+    totals['latency_max_ms'] = round(max(latencies) * 1000, 2) if latencies else 0.0
+    totals['keypress_avg_ms'] = round(sum(press_latencies) * 1000 / len(press_latencies), 2) if press_latencies else 0.0
+    totals['keypress_max_ms'] = round(max(press_latencies) * 1000, 2) if press_latencies else 0.0
+    return totals
+
+def format_tx(totals):
+    return (f"tx {totals['sent']} sent, {totals['failed']} failed, {totals['dropped']} dropped, "
+            f"queue {totals['depth']} (peak {totals['peak_depth']}), "
+            f"latency {totals['latency_avg_ms']:.1f} ms avg / {totals['latency_max_ms']:.1f} ms max, "
+            f"{totals['coalesced']} frames saved by coalescing, keypress to send "
+            f"{totals['keypress_avg_ms']:.0f} ms avg / {totals['keypress_max_ms']:.0f} ms max")
+
+# --- Spec Rendering Cache ---
+# id(spec entry) -> (entry, JSON text, ((line, curses attr), ...)); cleared when the config is (re)loaded
+spec_render_cache = {}
+
+def render_spec(spec):
+    """Returns (text, lines) for a spec entry: its indented JSON and per-line attributes, built once per entry."""
+    cached = spec_render_cache.get(id(spec))
+    if cached is None or cached[0] is not spec: # Keeping the entry alive means its id is never reused
+        import json
+        text = json.dumps(spec, indent=2)
+        lines = []
+        for ln in text.splitlines():
+            # Highlight DGN if present
+            if '"dgn_hex":' in ln:
+                lines.append((ln, curses.color_pair(5) | curses.A_BOLD))
+            else:
+                lines.append((ln, curses.color_pair(3)))
+        cached = (spec, text, tuple(lines))
+        spec_render_cache[id(spec)] = cached
+    return cached[1], cached[2]
+
 # OSC52 copy to clipboard
 def copy_to_clipboard(text):
     payload = base64.b64encode(text.encode()).decode()
     sys.stdout.write(f"\x1b]52;c;{payload}\x07")
     sys.stdout.flush()
 
+# --- Display Orders ---
+class RecordOrder:
+    """ Every sort order of one tab, kept current as records are updated.
+
+    modes has one entry per sort mode: a key function (item_id, item) -> key,
+    whose (key, id) pairs are kept sorted with bisect as ids first appear, or
+    'newest' / 'oldest'. 'newest' is a dict used as a move-to-end recency list
+    and 'oldest' is the order ids were first seen in. ids() and position() are
+    cached per mode until that order changes, so drawing never sorts. Every
+    method holds _lock, since the reader updates the orders the UI reads.
+    """
+    def __init__(self, modes):
+        self.modes = modes
+        self._sorted = {i: [] for i, mode in enumerate(modes) if callable(mode)}
+        self._recent = {} # id -> None, least recently updated first
+        self._first_seen = []
+        self._added = 0 # Bumped when an id appears, is removed or is re-keyed
+        self._touched = 0 # Bumped on every update
+        self._views = {} # mode -> (stamp, ids, {id: position} or None)
+        self._lock = threading.Lock()
+
+    def touch(self, item_id, item=None):
+        """Records an update of item_id as the newest; item supplies the sort keys on first sight."""
+        with self._lock: # The reader calls this while the UI copies the orders in ids()
+            recent = self._recent
+            if item_id in recent:
+                # Hot path (every repeated frame): just move it to the end
+                del recent[item_id]
+                recent[item_id] = None
+                self._touched += 1
+                return
+            for i, pairs in self._sorted.items():
+                bisect.insort(pairs, (self.modes[i](item_id, item), item_id))
+            self._first_seen.append(item_id)
+            self._added += 1
+            recent[item_id] = None
+            self._touched += 1
+
+    def _unsort(self, item_id):
+        for pairs in self._sorted.values():
+            for i, (_, pair_id) in enumerate(pairs):
+                if pair_id == item_id:
+                    del pairs[i]
+                    break
+
+    def remove(self, item_id):
+        """Drops item_id from every order (e.g. a light no longer in the mapping)."""
+        with self._lock:
+            if item_id not in self._recent:
+                return
+            self._unsort(item_id)
+            self._first_seen.remove(item_id)
+            self._recent.pop(item_id, None)
+            self._added += 1
+
+    def rekey(self, item_id, item):
+        """Recomputes item_id's sort keys from item (e.g. after a rename); unknown ids are added."""
+        with self._lock:
+            if item_id not in self._recent:
+                self._first_seen.append(item_id)
+                self._recent[item_id] = None
+                self._touched += 1
+            else:
+                self._unsort(item_id)
+            for i, pairs in self._sorted.items():
+                bisect.insort(pairs, (self.modes[i](item_id, item), item_id))
+            self._added += 1
+
+    def ids(self, mode):
+        """Ids in the given sort mode; the same list object is returned until that order changes."""
+        with self._lock:
+            kind = self.modes[mode]
+            stamp = (self._added, self._touched) if kind == 'newest' else self._added
+            view = self._views.get(mode)
+            if view is None or view[0] != stamp:
+                if kind == 'newest':
+                    ids = list(reversed(self._recent))
+                elif kind == 'oldest':
+                    ids = list(self._first_seen)
+                else:
+                    ids = [item_id for _, item_id in self._sorted[mode]]
+                view = (stamp, ids, None)
+                self._views[mode] = view
+            return view[1]
+
+    def position(self, mode, item_id):
+        """Index of item_id in the given sort mode, or None, from a cached id -> position map."""
+        ids = self.ids(mode)
+        with self._lock:
+            stamp, ids, positions = self._views[mode]
+            if positions is None:
+                positions = {item_id: i for i, item_id in enumerate(ids)}
+                self._views[mode] = (stamp, ids, positions)
+        return positions.get(item_id)
+
+# Sort keys, lowercased once when an id is first seen
+def raw_name_key(name, rec):
+    return name
+
+def light_area_key(entity_id, state):
+    return (state.get('suggested_area', 'zzz').lower(), state.get('friendly_name', 'zzz').lower())
+
+def light_name_key(entity_id, state):
+    return state.get('friendly_name', 'zzz').lower()
+
+RAW_ORDER_MODES = [raw_name_key, 'newest', 'oldest'] # Matches sort_labels
+LIGHT_ORDER_MODES = [light_area_key, light_name_key, 'newest'] # Matches light_sort_labels
+
 # --- Global State ---
 # Initialized after arg parsing
 decoder_map = None
@@ -373,6 +1020,8 @@ device_lookup = None
 light_entity_ids = set() # Renamed from light_ha_names
 light_command_info = {} # Added: Stores DGN/Instance for commanding lights
 status_lookup = {} # Added: Maps (Status_DGN, Instance) -> config for receiving
+entity_id_lookup = {} # entity_id -> mapped config
+config_snapshot = None # ConfigSnapshot of the tables above; what the readers decode with (see apply_config)
 latest_raw_records = {} # Initialized after interfaces are known
 # mapped_device_states = {} # REMOVED
 light_device_states = {} # Keyed by entity_id for lights (Changed from ha_name)
@@ -388,6 +1037,8 @@ copy_time = 0
 sort_labels = ['A→Z', 'Newest', 'Oldest']
 # mapped_sort_labels = ['Area→Name', 'Name', 'Newest'] # REMOVED
 light_sort_labels = ['Area→Name', 'Name', 'Newest'] # Sort options for lights tab
+raw_orders = defaultdict(lambda: RecordOrder(RAW_ORDER_MODES)) # interface -> Raw tab orders, updated by the reader
+light_order = RecordOrder(LIGHT_ORDER_MODES) # Lights tab orders, updated on every light state change
 is_paused = False # Pause state flag
 pause_lock = threading.Lock() # Lock for pause state
 # Store the data used for the last draw, to display when paused
@@ -395,117 +1046,393 @@ last_draw_data = {
     # "mapped": [], # REMOVED
     "lights": [],
     "logs": [], # <-- Restore logs cache entry
+    "stats": None, # (interface summaries, DGN/source rows) from bus_stats.report()
     "raw0": ([], {}), # (names, recs_copy)
     "raw1": ([], {}), # (names, recs_copy)
 }
 INTERFACES = [] # Will be populated by args
 
 # --- Reader Thread ---
-def reader_thread(interface):
-    """Reads CAN messages, decodes, and updates raw records, mapped device states, and light states."""
-    global active_buses, active_buses_lock, status_lookup # Add status_lookup to globals
-    bus = None # Initialize bus to None outside try
+READER_BATCH_SIZE = 64 # Max frames drained from one socket before servicing the next
+BUS_RETRY_INTERVAL = 10 # Seconds between attempts to open an interface that is down or missing
+reader_wake_fds = None # (read_fd, write_fd) self-pipe used to interrupt the event-loop reader
+kernel_filter_mode = 'all' # 'all', 'decoded' or 'mapped' (set from --kernel-filter)
+kernel_filters = None # python-can filter dicts installed on every reader socket, None = everything
+frames_received = defaultdict(int) # interface -> frames that reached process_frame
+CAN_EFF_FLAG = 0x80000000 # linux/can.h, as in rvc_socketcan, which the reader only needs for --backend raw
+CAN_EFF_MASK = 0x1FFFFFFF
+frames_by_id = defaultdict(lambda: defaultdict(int)) # interface -> {arbitration_id | CAN_EFF_FLAG if extended: frames}, for the Stats tab
+filter_baseline = {} # interface -> (rx_packets, frames_received) when the filter was installed
+change_detection = True # Skip decode/state updates for repeated payloads (--no-change-detection)
+last_payloads = defaultdict(dict) # interface -> {arbitration_id: (payload, raw record or None, record name, ConfigSnapshot)}
+payload_hits = defaultdict(int) # interface -> frames whose payload matched the previous one
+payload_misses = defaultdict(int) # interface -> frames that were decoded
+frame_recorder = None # FrameRecorder writing every received frame to disk (--record)
+TRANSPORT_SESSIONS = 32 # Concurrent multi-packet transfers tracked per interface (--tp-sessions)
+transports = defaultdict(lambda: TransportReassembler(TRANSPORT_SESSIONS)) # interface -> TP.CM/TP.DT reassembly
+dirty_views = set() # Interfaces / 'lights' / 'logs' whose state changed since the UI last fetched it
+
+# --- UI Wake-up ---
+MAX_FPS = 20 # Upper bound on redraws per second caused by bus traffic (--max-fps)
+IDLE_REDRAW_INTERVAL = 1.0 # Redraw at least this often so ages and notifications advance
+ui_wake_fds = None # (read_fd, write_fd) self-pipe written when the visible tab goes stale
+ui_wake_pending = False # A wake byte is in the pipe and draw_screen has not drained it yet
+visible_view = None # dirty_views key of what is on screen: 'lights', 'logs' or an interface
+
+def wake_ui():
+    """Wakes draw_screen; further calls are no-ops until it has drained the pipe."""
+    global ui_wake_pending
+    if ui_wake_fds and not ui_wake_pending:
+        ui_wake_pending = True
+        try:
+            os.write(ui_wake_fds[1], b'\0')
+        except OSError:
+            pass # Pipe full or closed; the UI is waking up anyway
+
+def mark_dirty(view):
+    """Flags a view as changed and wakes the UI if that view is on screen."""
+    dirty_views.add(view)
+    if view == visible_view:
+        wake_ui()
+
+def wait_for_ui_event(last_draw):
+    """
+    Blocks until a key is pressed, the visible view changes or the idle redraw is due.
+    Wake-ups from the reader are held back so redraws never exceed MAX_FPS; keys are not.
+    """
+    global ui_wake_pending
+    deadline = last_draw + IDLE_REDRAW_INTERVAL
+    watch = [sys.stdin, ui_wake_fds[0]]
+    while True:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return
+        ready, _, _ = select.select(watch, [], [], timeout)
+        if not ready or sys.stdin in ready:
+            return
+        # Re-arm before draining so a change arriving meanwhile is not lost
+        ui_wake_pending = False
+        try:
+            os.read(ui_wake_fds[0], 64)
+        except OSError:
+            pass
+        deadline = min(deadline, last_draw + 1.0 / MAX_FPS)
+        watch = [sys.stdin] # Only a key can cut the frame interval short now
+
+def invalidate_payload_cache():
+    """Forces the next frame of every ID to be decoded again (e.g. after an optimistic UI update)."""
+    for cache in list(last_payloads.values()):
+        cache.clear()
+
+def transport_totals():
+    """Multi-packet session counters summed over all interfaces, plus 'active' sessions in progress."""
+    totals = dict.fromkeys(TRANSPORT_STAT_NAMES, 0)
+    totals['active'] = 0
+    for reassembler in list(transports.values()):
+        for name, count in reassembler.stats.items():
+            totals[name] += count
+        totals['active'] += reassembler.active
+    return totals
+
+def format_transport(totals):
+    return (f"multi-packet {totals['completed']} done, {totals['active']} open, {totals['aborted']} aborted, "
+            f"{totals['timed_out']} timed out, {totals['no_memory']} no buffer, {totals['invalid']} invalid")
+
+def payload_hit_rate(interface):
+    """Percentage of frames on this interface that repeated their previous payload."""
+    total = payload_hits[interface] + payload_misses[interface]
+    return (payload_hits[interface] * 100.0 / total) if total else 0.0
+
+def build_kernel_filters(mode):
+    """Builds a compact CAN_RAW_FILTER set for the given mode from the loaded spec and mapping."""
+    if mode == 'decoded':
+        # Every PGN with a named decoder; the index decodes it from any source address
+        pgns = {pgn for pgn, decoder in decoder_map.by_pgn.items() if not decoder.name.startswith('UNKNOWN')}
+    elif mode == 'mapped':
+        # Only the status DGNs that mapped devices report on
+        pgns = {int(dgn_hex, 16) for dgn_hex, _ in status_lookup}
+    else:
+        return None
+    if not pgns:
+        logging.warning(f"Kernel filter mode '{mode}' matched no DGNs; receiving everything.")
+        return None
+    from rvc_socketcan import pgn_filters, pf_filters
+    # TP.CM/TP.DT always pass: the DGN they carry is only known after reassembly
+    filters = pgn_filters(pgns) + pf_filters(TP_PFS)
+    logging.info(f"Kernel filter '{mode}': {len(pgns)} DGNs plus multi-packet transport in {len(filters)} id/mask entries.")
+    return filters
+
+def kernel_filter_savings(interface):
+    """Returns (frames dropped in the kernel, percent of bus traffic) since the filter was installed, or None."""
+    baseline = filter_baseline.get(interface)
+    if baseline is None or baseline[0] is None:
+        return None
+    from rvc_socketcan import interface_rx_packets # Loaded already: the filter was installed with it
+    rx_packets = interface_rx_packets(interface)
+    if rx_packets is None:
+        return None
+    seen = rx_packets - baseline[0]
+    dropped = max(0, seen - (frames_received[interface] - baseline[1]))
+    return dropped, (dropped * 100.0 / seen) if seen else 0.0
+
+def open_reader_bus(interface, backend='python-can'):
+    """Opens a socketcan bus for reading and registers it in active_buses. Returns None on failure."""
     try:
-        bus = can.interface.Bus(channel=interface, interface='socketcan')
+        if backend == 'raw':
+            # Batched recvmmsg() reader; also sends, so it doubles as the command bus
+            from rvc_socketcan import RawCanBus
+            bus = RawCanBus(interface, batch_size=READER_BATCH_SIZE)
+        else:
+            bus = python_can().interface.Bus(channel=interface, interface='socketcan')
         logging.info(f"Successfully opened CAN interface {interface}")
+        if kernel_filters:
+            # Unwanted frames are dropped in the kernel and never wake the reader
+            from rvc_socketcan import interface_rx_packets
+            bus.set_filters(kernel_filters)
+            filter_baseline[interface] = (interface_rx_packets(interface), frames_received[interface])
         # Store the active bus object
         with active_buses_lock:
             active_buses[interface] = bus
+        return bus
     except Exception as e:
         logging.error(f"Error opening CAN interface {interface}: {e}")
         # Ensure bus is removed if opening failed but object was partially created
         with active_buses_lock:
             if interface in active_buses:
                 del active_buses[interface]
-        return # Exit thread if CAN interface fails
+        return None
+
+def close_reader_bus(interface, bus):
+    """Shuts down a reader bus and removes it from active_buses."""
+    with active_buses_lock:
+        if interface in active_buses:
+            if bus: # Check if bus object exists before trying to shut down
+                try:
+                    bus.shutdown()
+                    logging.info(f"Closed CAN interface {interface}")
+                except Exception as e:
+                    logging.error(f"Error shutting down CAN interface {interface}: {e}")
+            del active_buses[interface] # Remove from active list regardless of shutdown success
+
+def stop_readers():
+    """Signals all readers to stop and wakes the event-loop reader immediately."""
+    stop_event.set()
+    if reader_wake_fds:
+        try:
+            os.write(reader_wake_fds[1], b'\0')
+        except OSError:
+            pass # Pipe full or already closed; the reader is waking up anyway
+
+def process_frame(interface, arbitration_id, extended, data):
+    """
+    Counts and records one received frame, then decodes it (and any transfer it
+    completes). extended is the frame's own 29-bit flag, never guessed from the ID.
+    """
+    frames_received[interface] += 1
+    frames_by_id[interface][arbitration_id | CAN_EFF_FLAG if extended else arbitration_id] += 1
+    now = time.time()
+    payload = bytes(data) # data may view a reused receive buffer
+    if frame_recorder is not None:
+        frame_recorder.record(now, interface, arbitration_id, extended, payload)
+    if extended and (arbitration_id >> 16) & 0x1FF in TP_PFS:
+        # TP.CM / TP.DT: the frame itself is shown as usual, a completed transfer is decoded too
+        message = transports[interface].feed(arbitration_id, payload, now)
+        if message is not None:
+            process_message(interface, message[0], message[1], now)
+    process_message(interface, arbitration_id, payload, now)
+
+def process_message(interface, arbitration_id, payload, now):
+    """Decodes one message (a frame or a reassembled transfer) and updates raw records and light states."""
+    cfg = config_snapshot # One read per frame; a reload swaps in a new snapshot, never edits this one
+    if change_detection:
+        cached = last_payloads[interface].get(arbitration_id)
+        if cached is not None and cached[0] == payload and cached[3] is cfg:
+            # Same bytes as last time: only the receive time moves
+            payload_hits[interface] += 1
+            if cached[1] is not None:
+                cached[1]['last_received'] = now # Single item store, no lock needed
+                raw_orders[interface].touch(cached[2]) # Still the newest for sorting
+            return
+        payload_misses[interface] += 1
+    rec = None
+    name = None
+    # Exact ID first, then PGN so every source address on the coach decodes
+    decoder, exact = cfg.decoder_map.lookup(arbitration_id)
+    source_address = arbitration_id & 0xFF
+
+    # --- Update Raw Records ---
+    if decoder and not decoder.name.startswith('UNKNOWN'):
+        entry = decoder.spec
+        # Frames matched through the PGN fallback get their own row per node
+        name = decoder.name if exact else f"{decoder.name}@{source_address:02X}"
+        with raw_records_lock:
+            rec = latest_raw_records[interface].get(name, {})
+            rec.setdefault('first_received', now)
+            rec['last_received'] = now
+
+            # decode all signals
+            decoded_data, raw_values = decode_payload(decoder, payload)
+
+            # override state/brightness based on operating_status
+            op = raw_values.get('operating_status', 0)
+            decoded_data['brightness'] = op // 2
+            decoded_data['state']      = 'ON' if op > 0 else 'OFF'
+
+            rec.update({
+                'raw_id':    f"0x{arbitration_id:08X}",
+                'source_address': f"0x{source_address:02X}",
+                'raw_data':  payload.hex().upper(),
+                'decoded':   decoded_data,
+                'spec':      entry,
+                'interface': interface
+            })
+            latest_raw_records[interface][name] = rec
+            raw_orders[interface].touch(name, rec)
+        mark_dirty(interface)
+    # --- End Update Raw Records ---
+
+        # --- Update Light State Only (if applicable) --- START
+        dgn_hex = entry.get('dgn_hex')
+        instance_raw = raw_values.get('instance') # Get raw instance value
+
+        if dgn_hex and instance_raw is not None:
+            instance_str = str(instance_raw)
+            # --- Use status_lookup instead of device_lookup --- START
+            lookup_key = (dgn_hex.upper(), instance_str)
+            mapped_config = cfg.status_lookup.get(lookup_key)
+            # Optional: Fallback to default instance for the status DGN if specific instance not found
+            if not mapped_config:
+                default_key = (dgn_hex.upper(), 'default')
+                mapped_config = cfg.status_lookup.get(default_key)
+                # if mapped_config:
+                #     logging.debug(f"Using default status mapping for {lookup_key}")
+            # --- Use status_lookup instead of device_lookup --- END
+
+            # Sampled mapping trace (Logs tab); a single attribute check while off
+            if trace_ring.enabled and trace_ring.should_sample(dgn_hex):
+                trace_ring.record(now, interface, dgn_hex.upper(), instance_str, source_address,
+                                  mapped_config.get('entity_id') if mapped_config else None)
+                mark_dirty('logs')
+
+            if mapped_config:
+                entity_id = mapped_config.get('entity_id')
+                # Update light state if it's a light (using entity_id)
+                if entity_id and entity_id in cfg.light_entity_ids: # Check against light_entity_ids
+                    state_data = {
+                        'entity_id': entity_id,
+                        'friendly_name': mapped_config.get('friendly_name', entity_id),
+                        'suggested_area': mapped_config.get('suggested_area', 'Unknown'),
+                        'last_updated': now,
+                        'last_interface': interface,
+                        'source_address': source_address,
+                        'last_raw_values': raw_values,
+                        'last_decoded_data': decoded_data,
+                        'last_raw_bytes': payload,
+                        'mapping_config': mapped_config,
+                        'dgn_hex': dgn_hex, # Store the DGN the status was RECEIVED on
+                        'instance': instance_str
+                    }
+                    with light_states_lock:
+                        light_state_entry = light_device_states.get(entity_id, {})
+                        light_state_entry.update(state_data)
+                        light_device_states[entity_id] = light_state_entry
+                    light_order.touch(entity_id, light_state_entry)
+                    mark_dirty('lights')
+        # --- Update Light State Only --- END
+
+    # --- End Update Mapped Device State ---
+
+    if change_detection:
+        last_payloads[interface][arbitration_id] = (payload, rec, name, cfg)
+
+def event_loop_reader(interfaces, backend='python-can'):
+    """Reads all CAN interfaces from one thread, multiplexing their sockets with selectors."""
+    global reader_wake_fds
+    sel = selectors.DefaultSelector()
+    reader_wake_fds = os.pipe()
+    os.set_blocking(reader_wake_fds[0], False)
+    os.set_blocking(reader_wake_fds[1], False)
+    sel.register(reader_wake_fds[0], selectors.EVENT_READ, None)
+
+    buses = {}
+    unopened = {interface: 0 for interface in interfaces} # interface -> time of the next open attempt
+    suspended = {} # interface -> time to re-register after a CAN error
+    errors = bus_errors(backend)
+
+    while not stop_event.is_set():
+        # Interfaces that were down (e.g. not yet up at boot) are retried until they open
+        now = time.time()
+        for interface in [i for i, t in unopened.items() if t <= now]:
+            bus = open_reader_bus(interface, backend)
+            if bus:
+                del unopened[interface]
+                buses[interface] = bus
+                sel.register(bus.fileno(), selectors.EVENT_READ, (interface, bus))
+            else:
+                unopened[interface] = now + BUS_RETRY_INTERVAL
+        timeout = None
+        if suspended or unopened:
+            timeout = max(0, min(itertools.chain(suspended.values(), unopened.values())) - time.time())
+        for key, _ in sel.select(timeout):
+            if key.data is None: # Wake-up pipe
+                try:
+                    os.read(reader_wake_fds[0], 64)
+                except OSError:
+                    pass
+                continue
+            interface, bus = key.data
+            try:
+                # Drain this socket in a batch before moving on
+                if backend == 'raw':
+                    for _, arbitration_id, extended, data in bus.recv_batch():
+                        process_frame(interface, arbitration_id, extended, data)
+                else:
+                    for _ in range(READER_BATCH_SIZE):
+                        msg = bus.recv(0)
+                        if msg is None:
+                            break
+                        process_frame(interface, msg.arbitration_id, msg.is_extended_id, msg.data)
+            except errors as e:
+                logging.error(f"CAN Error on {interface}: {e}")
+                # Back off this interface only; the others keep reading
+                sel.unregister(key.fd)
+                suspended[interface] = time.time() + 5
+            except Exception as e:
+                logging.exception(f"Unhandled error in event-loop reader for {interface}") # Log traceback
+
+        now = time.time()
+        for interface in [i for i, t in suspended.items() if t <= now]:
+            del suspended[interface]
+            sel.register(buses[interface].fileno(), selectors.EVENT_READ, (interface, buses[interface]))
+
+    # Cleanup: Shutdown buses and the wake-up pipe
+    sel.close()
+    for interface, bus in buses.items():
+        close_reader_bus(interface, bus)
+    wake_fds, reader_wake_fds = reader_wake_fds, None
+    for fd in wake_fds:
+        os.close(fd)
+
+def reader_thread(interface, backend='python-can'):
+    """Reads one CAN interface with blocking recv() (the original one-thread-per-interface model)."""
+    bus = open_reader_bus(interface, backend)
+    while not bus: # Interface down or missing; keep trying until it comes up
+        if stop_event.wait(BUS_RETRY_INTERVAL):
+            return
+        bus = open_reader_bus(interface, backend)
+    errors = bus_errors(backend)
 
     while not stop_event.is_set():
         try:
+            if backend == 'raw':
+                for _, arbitration_id, extended, data in bus.recv_batch(timeout=1):
+                    process_frame(interface, arbitration_id, extended, data)
+                continue
             msg = bus.recv(1) # Timeout of 1 second
             if not msg:
                 continue
-
-            now = time.time()
-            entry = decoder_map.get(msg.arbitration_id)
-
-            # --- Update Raw Records ---
-            if entry and not entry.get('name','').startswith('UNKNOWN'):
-                name = entry['name']
-                with raw_records_lock:
-                    rec = latest_raw_records[interface].get(name, {})
-                    rec.setdefault('first_received', now)
-                    rec['last_received'] = now
-
-                    # decode all signals
-                    decoded_data, raw_values = decode_payload(entry, msg.data)
-
-                    # override state/brightness based on operating_status
-                    op = raw_values.get('operating_status', 0)
-                    decoded_data['brightness'] = op // 2
-                    decoded_data['state']      = 'ON' if op > 0 else 'OFF'
-
-                    rec.update({
-                        'raw_id':    f"0x{msg.arbitration_id:08X}",
-                        'raw_data':  msg.data.hex().upper(),
-                        'decoded':   decoded_data,
-                        'spec':      entry,
-                        'interface': interface
-                    })
-                    latest_raw_records[interface][name] = rec
-            # --- End Update Raw Records ---
-
-                # --- Update Light State Only (if applicable) --- START
-                dgn_hex = entry.get('dgn_hex')
-                instance_raw = raw_values.get('instance') # Get raw instance value
-
-                if dgn_hex and instance_raw is not None:
-                    instance_str = str(instance_raw)
-                    # DEBUG → enqueue into the ListLogHandler so it only shows in the Logs tab
-                    try:
-                        list_handler.log_queue.put_nowait(
-                            f"{time.strftime('%H:%M:%S')} - DEBUG - reader:{interface} - "
-                            f"Got PGN={dgn_hex.upper()}, inst={instance_str}; looking for keys={list(status_lookup.keys())}"
-                        )
-                    except queue.Full:
-                        # drop it if the queue is full
-                        pass
-                    # --- Use status_lookup instead of device_lookup --- START
-                    lookup_key = (dgn_hex.upper(), instance_str)
-                    mapped_config = status_lookup.get(lookup_key)
-                    # Optional: Fallback to default instance for the status DGN if specific instance not found
-                    if not mapped_config:
-                        default_key = (dgn_hex.upper(), 'default')
-                        mapped_config = status_lookup.get(default_key)
-                        # if mapped_config:
-                        #     logging.debug(f"Using default status mapping for {lookup_key}")
-                    # --- Use status_lookup instead of device_lookup --- END
-
-                    if mapped_config:
-                        entity_id = mapped_config.get('entity_id')
-                        # Update light state if it's a light (using entity_id)
-                        if entity_id and entity_id in light_entity_ids: # Check against light_entity_ids
-                            state_data = {
-                                'entity_id': entity_id,
-                                'friendly_name': mapped_config.get('friendly_name', entity_id),
-                                'suggested_area': mapped_config.get('suggested_area', 'Unknown'),
-                                'last_updated': now,
-                                'last_interface': interface,
-                                'last_raw_values': raw_values,
-                                'last_decoded_data': decoded_data,
-                                'last_raw_bytes': msg.data,
-                                'mapping_config': mapped_config,
-                                'dgn_hex': dgn_hex, # Store the DGN the status was RECEIVED on
-                                'instance': instance_str
-                            }
-                            with light_states_lock:
-                                light_state_entry = light_device_states.get(entity_id, {})
-                                light_state_entry.update(state_data)
-                                light_device_states[entity_id] = light_state_entry
-                # --- Update Light State Only --- END
-
-            # --- End Update Mapped Device State ---
-
-        except can.CanError as e:
+            process_frame(interface, msg.arbitration_id, msg.is_extended_id, msg.data)
+        except errors as e:
             logging.error(f"CAN Error on {interface}: {e}")
             time.sleep(5) # Avoid spamming errors if bus goes down
         except Exception as e:
@@ -513,20 +1440,319 @@ def reader_thread(interface):
             time.sleep(1) # Prevent tight loop on unexpected errors
 
     # Cleanup: Shutdown bus and remove from active list
-    with active_buses_lock:
-        if interface in active_buses:
-            if bus: # Check if bus object exists before trying to shut down
-                try:
-                    bus.shutdown()
-                    logging.info(f"Closed CAN interface {interface}")
-                except Exception as e:
-                    logging.error(f"Error shutting down CAN interface {interface}: {e}")
-            del active_buses[interface] # Remove from active list regardless of shutdown success
+    close_reader_bus(interface, bus)
+
+# --- Replay ---
+# candump -L:           (1700000000.123456) can0 19FEDA9F#0102030405060708
+# candump (-t a or no timestamp): (1700000000.123456)  can0  19FEDA9F   [8]  01 02 03 04 05 06 07 08
+CANDUMP_LOG_LINE = re.compile(r'\((\d+\.\d+)\)\s+(\S+)\s+([0-9A-Fa-f]{1,8})#([0-9A-Fa-f]*)\s*$')
+CANDUMP_TEXT_LINE = re.compile(r'\s*(?:\((\d+\.\d+)\)\s+)?(\S+)\s+([0-9A-Fa-f]{1,8})\s+\[(\d)\]\s*((?:[0-9A-Fa-f]{2}\s*)*)$')
+CAN_ERR_FLAG = 0x20000000
+
+def iter_replay(path, warn=True):
+    """
+    Yields (timestamp or None, interface, arbitration_id, extended, data) for every frame
+    of a candump log (-L or the default text format) or a --record recording,
+    reading as it goes so hours of capture never sit in memory at once.
+    Remote, error and CAN FD frames are skipped.
+    """
+    from rvc_recorder import MAGIC as RECORDING_MAGIC, iter_frames as iter_recording
+    with open(path, 'rb') as f:
+        is_recording = f.read(len(RECORDING_MAGIC)) == RECORDING_MAGIC
+    if is_recording:
+        for ts, interface, can_id, extended, data in iter_recording(path):
+            yield ts, interface, can_id, extended, bytes(data)
+        return
+    skipped = 0
+    with open(path) as f:
+        for line in f:
+            m = CANDUMP_LOG_LINE.match(line)
+            if m:
+                ts, interface, ident, hexdata = m.groups()
+            else:
+                m = CANDUMP_TEXT_LINE.match(line)
+                if not m:
+                    skipped += bool(line.strip())
+                    continue
+                ts, interface, ident, _, hexdata = m.groups()
+            can_id = int(ident, 16)
+            if len(ident) == 8 and can_id & CAN_ERR_FLAG:
+                skipped += 1
+                continue
+            # candump writes 29-bit IDs with 8 hex digits and 11-bit ones with 3
+            yield float(ts) if ts else None, interface, can_id & 0x1FFFFFFF, len(ident) == 8, bytes.fromhex(hexdata)
+    if skipped and warn:
+        logging.warning(f"Replay: skipped {skipped} unparsable, remote, error or CAN FD lines in {path}")
+
+def replay_interfaces(path):
+    """Every interface named in a replay log, in one streaming pass (for when -i is not given)."""
+    return sorted({frame[1] for frame in iter_replay(path, warn=False)})
+
+def replay_reader(frames, interfaces, speed=1.0):
+    """
+    Feeds recorded frames (any iterable, e.g. iter_replay()) through
+    process_frame, the same path as a live reader. speed is the playback rate
+    relative to the capture (1 = real time, 10 = 10x); 0 replays as fast as
+    possible and logs the achieved frames/s. Frames on interfaces not being
+    shown are skipped.
+    """
+    wanted = set(interfaces)
+    first_ts = None # Capture time the pacing counts from: that of the first timestamped frame
+    paced = speed > 0
+    logging.info("Replaying " + (f"at {speed:g}x" if paced else "as fast as possible"))
+    count = 0
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        for ts, interface, arbitration_id, extended, data in frames:
+            if stop_event.is_set():
+                break
+            if interface not in wanted:
+                continue
+            if paced and ts is not None:
+                if first_ts is None:
+                    first_ts = ts - (time.perf_counter() - start) * speed
+                delay = (ts - first_ts) / speed - (time.perf_counter() - start)
+                if delay > 0.001 and stop_event.wait(delay):
+                    break
+            try:
+                process_frame(interface, arbitration_id, extended, data)
+            except Exception:
+                logging.exception(f"Unhandled error replaying frame {arbitration_id:08X} on {interface}")
+            count += 1
+    except (OSError, ValueError) as e:
+        logging.error(f"Replay stopped after {count} frames: {e}")
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    logging.info(f"Replay finished: {count} frames in {elapsed:.3f} s ({rate:.0f} frames/s, "
+                 f"{cpu / count * 1e6 if count else 0:.1f} us CPU/frame)")
+    return count, elapsed
+
+# --- Bus Statistics ---
+BITRATE = 250000 # Nominal CAN bitrate for the bus load estimate (--bitrate); RV-C uses 250 kbit/s
+STAT_COUNTERS = ('rx_packets', 'tx_packets', 'rx_errors', 'tx_errors', 'rx_dropped') # From sysfs
+
+def frame_bits(extended, dlc):
+    """Bits a data frame occupies on the wire, including interframe space but not stuff bits."""
+    return (67 if extended else 47) + 8 * dlc
+
+class BusStats:
+    """ Windowed per-interface and per-DGN/source rates for the Stats tab.
+
+    The reader only increments the cumulative frames_by_id counters. sample()
+    copies them, together with the kernel's interface counters, at most once
+    per interval; a rate is the difference between the newest sample and the
+    oldest one in the window divided by the time between them.
+    """
+    def __init__(self, window=10.0, interval=1.0):
+        self.window = window
+        self.interval = interval
+        self.samples = defaultdict(deque) # interface -> (monotonic time, {id: frames}, {counter: value})
+
+    def sample(self, interfaces):
+        from rvc_socketcan import interface_statistic
+        now = time.monotonic()
+        for interface in interfaces:
+            samples = self.samples[interface]
+            if samples and now - samples[-1][0] < self.interval:
+                continue
+            counters = {name: interface_statistic(interface, name) for name in STAT_COUNTERS}
+            samples.append((now, dict(frames_by_id[interface]), counters)) # dict() copies without releasing the GIL
+            while len(samples) > 2 and now - samples[1][0] >= self.window:
+                samples.popleft()
+
+    def report(self, interfaces):
+        """
+        Returns (summaries, rows): one dict per interface, and (frames/s, interface,
+        pgn, source address, name, share %) for every DGN/source seen in the
+        window, busiest first.
+        """
+        summaries = []
+        rows = []
+        for interface in interfaces:
+            summary = {'interface': interface, 'frames': frames_received[interface], 'span': 0.0,
+                       'fps': None, 'bus_fps': None, 'load': None, 'counters': {}, 'deltas': {}}
+            summaries.append(summary)
+            samples = self.samples.get(interface)
+            if not samples or len(samples) < 2:
+                continue # Needs two samples for a rate
+            (t0, counts0, stats0), (t1, counts1, stats1) = samples[0], samples[-1]
+            span = t1 - t0
+            payloads = last_payloads[interface]
+            seen = 0
+            bits = 0
+            groups = defaultdict(int)
+            for key, count in counts1.items():
+                delta = count - counts0.get(key, 0)
+                if not delta:
+                    continue
+                seen += delta
+                extended = bool(key & CAN_EFF_FLAG)
+                can_id = key & CAN_EFF_MASK
+                cached = payloads.get(can_id)
+                bits += delta * frame_bits(extended, len(cached[0]) if cached else 8)
+                groups[(pgn_of(can_id), can_id & 0xFF) if extended else (None, can_id)] += delta
+            summary['span'] = span
+            summary['fps'] = seen / span
+            summary['counters'] = stats1
+            summary['deltas'] = {name: stats1[name] - stats0[name] for name in STAT_COUNTERS
+                                 if stats1[name] is not None and stats0[name] is not None}
+            # The kernel counts frames the socket filter dropped too, so prefer it for the whole bus
+            deltas = summary['deltas']
+            on_bus = deltas['rx_packets'] + deltas.get('tx_packets', 0) if 'rx_packets' in deltas else seen
+            summary['bus_fps'] = on_bus / span
+            avg_bits = bits / seen if seen else frame_bits(True, 8)
+            summary['load'] = on_bus * avg_bits / span / BITRATE * 100
+            for (pgn, source), count in groups.items():
+                if pgn is None:
+                    name = ''
+                else:
+                    decoder = decoder_map.by_pgn.get(pgn) if decoder_map else None
+                    name = decoder.name if decoder else ''
+                rows.append((count / span, interface, pgn, source, name, count * 100.0 / seen))
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return summaries, rows
+
+bus_stats = BusStats()
+
+# --- Profiler ---
+PROFILE_WINDOW = 10.0 # Seconds sampled per profiler run (--profile-window)
+PROFILE_DIR = None # Where .folded/.pstats results go (--profile-dir); None = the system temp directory
+profiler = None # SamplingProfiler, created by the first toggle_profiler()
+profile_toggle_requested = False # Set by the SIGUSR1 handler, acted on by the main loop
+
+def toggle_profiler(source):
+    """Starts a profiling window, or ends the running one early. Results are logged when it ends."""
+    global profiler
+    if profiler is not None and profiler.running:
+        profiler.stop()
+        logging.info(f"Profiler stopped early ({source}); writing results...")
+        return "Profiler stopping"
+    if profiler is None:
+        from rvc_profiler import SamplingProfiler
+        profiler = SamplingProfiler() # No thread and no hooks until started
+    if PROFILE_DIR:
+        profile_dir = PROFILE_DIR
+    else:
+        import tempfile
+        profile_dir = tempfile.gettempdir()
+    prefix = os.path.join(profile_dir, f"rvc-profile-{time.strftime('%Y%m%d-%H%M%S')}")
+    profiler.start(PROFILE_WINDOW, prefix, report_profile)
+    logging.info(f"Profiling all threads for {PROFILE_WINDOW:g}s ({source}); F or SIGUSR1 again stops early")
+    return f"Profiling for {PROFILE_WINDOW:g}s"
+
+def report_profile(lines):
+    for line in lines:
+        logging.info(line)
+
+def request_profile_toggle(signum, frame):
+    """SIGUSR1 handler: only flags the request (logging here could deadlock on the queue's lock)."""
+    global profile_toggle_requested
+    profile_toggle_requested = True
+    if ui_wake_fds:
+        try:
+            os.write(ui_wake_fds[1], b'\0')
+        except OSError:
+            pass
+
+def take_profile_request():
+    """True once per SIGUSR1 received since the last call."""
+    global profile_toggle_requested
+    requested, profile_toggle_requested = profile_toggle_requested, False
+    return requested
+
+# --- Row Renderer ---
+def process_bytes_written():
+    """Bytes this process has passed to write() so far (terminal output dominates), or None."""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+class RowRenderer:
+    """ Buffers one frame of curses output per row and repaints only rows that changed.
+
+    Draw functions call the usual addnstr/addstr/addch/hline methods on it.
+    flush() compares each row's (x, text, n, attr) segments with what is already
+    on screen and clears and repaints just the rows that differ. invalidate()
+    forces a full repaint (resize, tab switch, or anything drawn around it).
+    """
+    def __init__(self, stdscr):
+        self.stdscr = stdscr
+        self.size = None
+        self.rows = defaultdict(list) # y -> segments drawn this frame
+        self.shown = {} # y -> segments currently on screen
+        self.rows_painted = 0
+        self.chars_painted = 0 # Fallback for the byte counter when /proc is unavailable
+        self._rate_start = (time.monotonic(), self._bytes_written())
+        self.bytes_per_sec = 0.0
+
+    def _bytes_written(self):
+        written = process_bytes_written()
+        return self.chars_painted if written is None else written
+
+    def begin(self, h, w):
+        """Starts a frame; a changed terminal size repaints everything."""
+        if (h, w) != self.size:
+            self.size = (h, w)
+            self.invalidate()
+        self.rows = defaultdict(list)
+
+    def invalidate(self):
+        self.shown = {}
+        self.stdscr.clear() # Also repaints the physical terminal on the next doupdate()
+
+    def addnstr(self, y, x, text, n, attr=0):
+        self.rows[y].append((x, text, n, attr))
+
+    def addstr(self, y, x, text, attr=0):
+        self.rows[y].append((x, text, len(text), attr))
+
+    def addch(self, y, x, ch, attr=0):
+        self.rows[y].append((x, ch, 1, attr))
+
+    def hline(self, y, x, ch, n):
+        self.rows[y].append((x, ch * n, n, 0))
+
+    def flush(self):
+        """Writes changed rows to stdscr; the caller still does noutrefresh()/doupdate()."""
+        stdscr = self.stdscr
+        w = self.size[1]
+        for y in set(self.shown) | set(self.rows):
+            segments = tuple(self.rows.get(y, ()))
+            if self.shown.get(y) == segments:
+                continue
+            try:
+                stdscr.move(y, 0)
+                stdscr.clrtoeol()
+                for x, text, n, attr in segments:
+                    # Clip at the right edge: curses would wrap the rest onto the
+                    # next row, which is not repainted if it did not change itself
+                    n = min(n, w - x)
+                    if n <= 0:
+                        continue
+                    stdscr.addnstr(y, x, text, n, attr)
+                    self.chars_painted += min(n, len(text))
+                self.shown[y] = segments # Only a fully written row counts as on screen
+            except curses.error:
+                self.shown.pop(y, None) # Row partly off screen (e.g. mid-resize); it is repainted next frame
+            self.rows_painted += 1
+        now = time.monotonic()
+        start_time, start_bytes = self._rate_start
+        if now - start_time >= 1.0:
+            written = self._bytes_written()
+            self.bytes_per_sec = (written - start_bytes) / (now - start_time)
+            self._rate_start = (now, written)
 
 # --- Main UI Drawing ---
 # Modify draw_screen to accept list_handler
 def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces list and handler
-    global copy_msg, copy_time, is_paused, last_draw_data, log_filter, log_wrap
+    global copy_msg, copy_time, is_paused, last_draw_data, log_filter, log_wrap, ui_wake_fds, visible_view
     curses.curs_set(0)
     curses.start_color()
     curses.use_default_colors()
@@ -539,10 +1765,15 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
     curses.init_pair(6, curses.COLOR_MAGENTA, -1) # Area / Secondary info
     curses.init_pair(7, curses.COLOR_RED, -1)    # Error / Action Hint
 
-    # Make getch non-blocking
+    # Make getch non-blocking; the loop sleeps in wait_for_ui_event() instead
     stdscr.nodelay(1)
-    stdscr.timeout(500) # Increased timeout to 500ms
+    stdscr.timeout(0)
     stdscr.keypad(True)
+    ui_wake_fds = os.pipe()
+    os.set_blocking(ui_wake_fds[0], False)
+    os.set_blocking(ui_wake_fds[1], False)
+    screen = RowRenderer(stdscr) # Row-level diffing on top of curses
+    drawn_tab_index = None
 
     # --- Add the ListLogHandler HERE --- # MOVED FROM MAIN
     # logging.info("Adding ListLogHandler inside draw_screen...")
@@ -551,7 +1782,7 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
     # --- End Add Handler ---
 
     # Restore "Logs" tab
-    tabs = ["Lights", "Logs"] + [f"{iface.upper()} Raw" for iface in interfaces]
+    tabs = ["Lights", "Logs"] + [f"{iface.upper()} Raw" for iface in interfaces] + ["Stats"]
     # Restore original tab keys
     tab_keys = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '0'][:len(tabs)]
     current_tab_index = 0
@@ -562,12 +1793,25 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
     if "Logs" in tab_state:
         del tab_state["Logs"]['sort_mode']
 
-    # Local deque to store log messages retrieved from the handler's queue
-    displayed_log_records = deque(maxlen=500)
+    # Log entries retrieved from the handler's queue, with the filtered view kept alongside
+    log_view = LogView(max_entries=500)
+    log_view.set_filter(log_filter)
+    trace_view = LogView(max_entries=trace_ring.size) # The trace ring's records, filtered and wrapped as they arrive
+    trace_seen = 0 # trace_ring.total already in trace_view
 
+    last_draw = 0.0
+    need_wait = False # Set after each redraw; key handlers that skip the redraw leave it clear
     while True:
         # --- Input Handling ---
         c = stdscr.getch()
+        if c == curses.ERR and need_wait:
+            # Nothing buffered: sleep until a key, a change to the visible tab or the idle tick
+            wait_for_ui_event(last_draw)
+            c = stdscr.getch()
+        need_wait = False
+        if take_profile_request():
+            copy_msg = toggle_profiler('SIGUSR1')
+            copy_time = time.time()
         # --- 1) immediate toggle on Enter when in Lights tab ---
         active_tab_name = tabs[current_tab_index]
         if c in (curses.KEY_ENTER, ord('\n'), ord('\r')) and active_tab_name == "Lights":
@@ -580,7 +1824,7 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
 
         if c != curses.ERR:
             if c in (ord('q'), ord('Q')):
-                stop_event.set()
+                stop_readers()
                 break
             elif c == ord('/'):  # enter log-filter mode
                 # temporarily switch off non-blocking so we can finish typing
@@ -590,18 +1834,25 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
                 h, w = stdscr.getmaxyx()
                 stdscr.move(h-2, 0)
                 stdscr.clrtoeol()
-                stdscr.addstr(h-2, 0, "Filter: ")
+                prompt = "Filter (text, /regex/, level:warning, thread:name): "
+                stdscr.addnstr(h-2, 0, prompt, w - 1)
                 stdscr.refresh()
-                s = stdscr.getstr(h-2, 8, w-8).decode('utf-8')
+                s = stdscr.getstr(h-2, min(len(prompt), w - 1), max(1, w - len(prompt))).decode('utf-8')
                 curses.noecho()
                 # restore non-blocking input
                 stdscr.nodelay(True)
-                stdscr.timeout(100)
+                stdscr.timeout(0)
                 stdscr.keypad(True)
-                log_filter = s
-                displayed_log_records.clear()
-                last_draw_data["logs"] = []
-                copy_msg = f"Log filter set to '{log_filter}'"
+                screen.invalidate() # The prompt was drawn behind the renderer's back
+                try:
+                    log_view.set_filter(s) # Re-filters the buffer once; new lines are tested as they arrive
+                    log_filter = s
+                    copy_msg = f"Log filter set to '{log_filter}'"
+                except (re.error, ValueError) as e:
+                    copy_msg = f"Invalid log filter '{s}': {e}"
+                last_draw_data["logs"] = log_view.matches
+                tab_state["Logs"]['selected_idx'] = 0
+                tab_state["Logs"]['v_offset'] = 0
                 copy_time = time.time()
                 continue           # skip the rest of this loop so we don’t immediately redraw
 
@@ -612,10 +1863,11 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
                     is_paused = not is_paused
                 if not is_paused:
                     # On unpause, clear logs buffer & reset scroll
-                    displayed_log_records.clear()
+                    log_view.clear()
                     last_draw_data = {
                         "lights": [],
                         "logs": [],
+                        "stats": None,
                         **{f"raw{i}": ([], {}) for i in range(len(interfaces))}
                     }
                     tab_state["Logs"]['selected_idx'] = 0
@@ -632,6 +1884,28 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
                 copy_msg = f"Log wrap {'ON' if log_wrap else 'OFF'}"
                 copy_time = time.time()
                 continue
+
+            # Profiler toggle; the summary lands in the Logs tab when the window ends
+            elif c in (ord('f'), ord('F')):
+                copy_msg = toggle_profiler('F key')
+                copy_time = time.time()
+                continue
+            # Mapping trace toggle (Logs tab shows the trace ring while it is on)
+            elif c in (ord('t'), ord('T')):
+                if not trace_ring.enabled:
+                    trace_ring.clear()
+                    trace_view.clear()
+                    trace_seen = 0
+                trace_ring.enabled = not trace_ring.enabled
+                last_draw_data["logs"] = []
+                tab_state["Logs"]['selected_idx'] = 0
+                tab_state["Logs"]['v_offset'] = 0
+                if trace_ring.enabled:
+                    copy_msg = f"Mapping trace ON (1 in {trace_ring.sample_every} per PGN)"
+                else:
+                    copy_msg = "Mapping trace OFF"
+                copy_time = time.time()
+                continue
             # Tab switching # Ensure this try block is at the same level as the elif
             try:
                 key_char = chr(c)
@@ -652,19 +1926,23 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
                                          state,
                                          interfaces,
                                          current_tab_index)
-                # …and for the Logs tab, make sure the window scrolls with the selection
-                if active_tab_name == "Logs" and c in (curses.KEY_DOWN, curses.KEY_UP,
-                                                    curses.KEY_NPAGE, curses.KEY_PPAGE,
-                                                    curses.KEY_HOME, curses.KEY_END):
-                    # Re-call handle_input specifically for scrolling logs (already handled above for other keys)
-                    # This ensures scrolling happens even if the main call was skipped
-                    handle_input_for_tab(c, active_tab_name, state, interfaces, current_tab_index)
 
         # --- Data Fetching (Conditional based on Pause) ---
         with pause_lock:
             paused_now = is_paused # Read pause state under lock
 
         active_tab_name = tabs[current_tab_index]
+        # Tell the reader which view to wake us for (nothing while paused)
+        if paused_now:
+            visible_view = None
+        elif active_tab_name == "Lights":
+            visible_view = 'lights'
+        elif active_tab_name == "Logs":
+            visible_view = 'logs'
+        elif " Raw" in active_tab_name and 0 <= current_tab_index - 2 < len(interfaces):
+            visible_view = interfaces[current_tab_index - 2]
+        elif active_tab_name == "Stats":
+            visible_view = 'stats' # Never marked dirty: redrawn by the idle timer once a second
         # Check if active_tab_name exists in tab_state before accessing
         state = tab_state.get(active_tab_name) # Use .get for safety
         if not state:
@@ -683,21 +1961,35 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
             # Fetch fresh data
             # Ensure the following block is correctly indented under 'if not paused_now:'
             if active_tab_name == "Lights":
-                with light_states_lock:
-                    # Make a copy
-                    light_items_to_draw = list(light_device_states.values())
-                last_draw_data["lights"] = light_items_to_draw # Cache fresh data
+                dirty_views.discard('lights')
+                # Rebuild only when the order changed (entries are shared, so in-place updates still show)
+                light_ids = light_order.ids(state['sort_mode'])
+                if light_ids is not state.get('_order_ids') or not last_draw_data["lights"]:
+                    with light_states_lock:
+                        last_draw_data["lights"] = [light_device_states[e] for e in light_ids if e in light_device_states]
+                    state['_order_ids'] = light_ids
+                    state['_order_mode'] = state['sort_mode']
+                light_items_to_draw = last_draw_data["lights"]
             # --- Restore Fetching for Logs Tab ---
             elif active_tab_name == "Logs": # Ensure this elif aligns with the 'if' above
+                dirty_views.discard('logs')
                 # Retrieve messages from the handler's queue
                 new_log_records = list_handler_instance.get_records()
                 if new_log_records:
-                    displayed_log_records.extend(new_log_records)
-                    # If not paused and on the Logs tab, scroll to the bottom
-                    if not is_paused and current_tab_index == 1:
-                        log_scroll_pos = max(0, len(displayed_log_records) - (h - 5))
-                log_items_to_draw = list(displayed_log_records) # Use the local deque
+                    log_view.extend(new_log_records) # Only the new entries are run through the filter
+                if trace_ring.enabled:
+                    # Page through the sampled trace instead; only records new since the last frame are added
+                    if trace_view.filter is not log_view.filter:
+                        trace_view.apply_filter(log_view.filter)
+                    new_trace, trace_seen = trace_ring.entries_since(trace_seen)
+                    trace_view.extend(new_trace)
+                    log_items_to_draw = trace_view.matches
+                else:
+                    log_items_to_draw = log_view.matches # Already filtered
                 last_draw_data["logs"] = log_items_to_draw # Cache fresh data
+            elif active_tab_name == "Stats":
+                bus_stats.sample(interfaces)
+                last_draw_data["stats"] = bus_stats.report(interfaces)
             elif " Raw" in active_tab_name: # Ensure this elif aligns with the 'if' above
                 try:
                     # Determine interface based on tab name/index relative to "Lights"
@@ -705,12 +1997,18 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
                     iface_index = current_tab_index - 2
                     if 0 <= iface_index < len(interfaces):
                         interface_for_raw_tab = interfaces[iface_index]
-                        with raw_records_lock:
-                             # Make copies
-                             raw_recs_to_draw = latest_raw_records[interface_for_raw_tab].copy()
-                        raw_names_to_draw = list(raw_recs_to_draw.keys()) # Get names from the copy
-                        # Cache fresh data (use index for key robustness)
-                        last_draw_data[f"raw{iface_index}"] = (raw_names_to_draw, raw_recs_to_draw)
+                        dirty_views.discard(interface_for_raw_tab)
+                        raw_names_to_draw, raw_recs_to_draw = last_draw_data.get(f"raw{iface_index}", ([], {}))
+                        # Names come pre-sorted from the reader-maintained order; re-copy records only when it changed
+                        names = raw_orders[interface_for_raw_tab].ids(state['sort_mode'])
+                        if names is not raw_names_to_draw or not raw_recs_to_draw:
+                            with raw_records_lock:
+                                 # Make copies
+                                 raw_recs_to_draw = latest_raw_records[interface_for_raw_tab].copy()
+                            raw_names_to_draw = names
+                            state['_order_mode'] = state['sort_mode']
+                            # Cache fresh data (use index for key robustness)
+                            last_draw_data[f"raw{iface_index}"] = (raw_names_to_draw, raw_recs_to_draw)
                     else: # Should not happen if tabs/keys are correct
                          logging.warning(f"Could not determine interface for tab: {active_tab_name}")
 
@@ -720,9 +2018,17 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
         else: # Use cached data if paused - Ensure this 'else' aligns with 'if not paused_now:'
             if active_tab_name == "Lights":
                 light_items_to_draw = last_draw_data["lights"]
+                if state['sort_mode'] != state.get('_order_mode'):
+                    # Sort changed while paused: put the frozen entries in the new order
+                    by_id = {item.get('entity_id'): item for item in light_items_to_draw}
+                    light_items_to_draw = [by_id[e] for e in light_order.ids(state['sort_mode']) if e in by_id]
+                    last_draw_data["lights"] = light_items_to_draw
+                    state['_order_mode'] = state['sort_mode']
             # --- Restore Cache Retrieval for Logs Tab ---
             elif active_tab_name == "Logs":
                 log_items_to_draw = last_draw_data["logs"]
+            elif active_tab_name == "Stats" and not last_draw_data.get("stats"):
+                last_draw_data["stats"] = bus_stats.report(interfaces)
             elif " Raw" in active_tab_name:
                 # Restore original index calculation
                 iface_index = current_tab_index - 2
@@ -730,19 +2036,27 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
                     interface_for_raw_tab = interfaces[iface_index]
                     # Retrieve cached data
                     raw_names_to_draw, raw_recs_to_draw = last_draw_data.get(f"raw{iface_index}", ([], {}))
+                    if state['sort_mode'] != state.get('_order_mode'):
+                        # Sort changed while paused: put the frozen records in the new order
+                        raw_names_to_draw = [n for n in raw_orders[interface_for_raw_tab].ids(state['sort_mode']) if n in raw_recs_to_draw]
+                        last_draw_data[f"raw{iface_index}"] = (raw_names_to_draw, raw_recs_to_draw)
+                        state['_order_mode'] = state['sort_mode']
 
         # --- Drawing ---
-        stdscr.erase()
         h, w = stdscr.getmaxyx()
+        screen.begin(h, w) # Full repaint on resize
+        if current_tab_index != drawn_tab_index:
+            screen.invalidate() # Full repaint on tab switch
+            drawn_tab_index = current_tab_index
 
         # --- Header ---
-        # Clear the line first
-        stdscr.move(0, 0)
-        stdscr.clrtoeol()
         header_text = ""
         # Pause indicator
         if paused_now:
              header_text += "[PAUSED] "
+        # Trace indicator
+        if trace_ring.enabled:
+             header_text += "[TRACE] "
         # Filter indicator
         if log_filter:
             header_text += f"[Filter='{log_filter}'] "
@@ -769,10 +2083,8 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
             header_text += f"[S] Sort:{sort_label}  "
         # Other actions
         header_text += "[C] Copy  [P] Pause  [Q] Quit"
-        stdscr.attron(curses.color_pair(1) | curses.A_BOLD)
-        stdscr.addnstr(0, 0, header_text.ljust(w), w)
-        stdscr.attroff(curses.color_pair(1) | curses.A_BOLD)
-        stdscr.hline(1, 0, '-', w)
+        screen.addnstr(0, 0, header_text.ljust(w), w, curses.color_pair(1) | curses.A_BOLD)
+        screen.hline(1, 0, '-', w)
 
         # --- Main Content Area ---
         max_rows = h - 5 # Rows available for content list
@@ -781,60 +2093,75 @@ def draw_screen(stdscr, interfaces, list_handler_instance): # Accept interfaces
         if state:
             if active_tab_name == "Lights":
                 # Pass fetched/cached light data
-                draw_lights_tab(stdscr, h, w, max_rows, state, light_items_to_draw)
+                draw_lights_tab(screen, h, w, max_rows, state, light_items_to_draw)
             # --- Restore Drawing Call for Logs Tab ---
             elif active_tab_name == "Logs":
-                draw_logs_tab(stdscr, h, w, max_rows, state, log_items_to_draw, wrap=log_wrap)
+                # Wrapped rows of the buffered lines are laid out once per width (resizing re-lays them)
+                view = trace_view if log_items_to_draw is trace_view.matches else log_view
+                view.set_wrap_width(w - 2 if log_wrap else None)
+                layout = view.layout if log_items_to_draw is view.matches else None
+                draw_logs_tab(screen, h, w, max_rows, state, log_items_to_draw, wrap=log_wrap, layout=layout)
             elif " Raw" in active_tab_name and interface_for_raw_tab:
                 # Pass fetched/cached data and interface name
-                draw_raw_can_tab(stdscr, h, w, max_rows, state, interface_for_raw_tab, raw_names_to_draw, raw_recs_to_draw)
+                draw_raw_can_tab(screen, h, w, max_rows, state, interface_for_raw_tab, raw_names_to_draw, raw_recs_to_draw)
+            elif active_tab_name == "Stats":
+                draw_stats_tab(screen, h, w, max_rows, state, *last_draw_data["stats"])
 
         # --- Copy/Action Notification ---
         if copy_msg and time.time() - copy_time < 3:
             # Use yellow for copy, red for action hint
             msg_color = curses.color_pair(5) if "copied" in copy_msg else curses.color_pair(7)
-            stdscr.attron(msg_color | curses.A_BOLD)
-            stdscr.addnstr(h - 2, 0, copy_msg[:w - 1].ljust(w - 1), w - 1)
-            stdscr.attroff(msg_color | curses.A_BOLD)
+            screen.addnstr(h - 2, 0, copy_msg[:w - 1].ljust(w - 1), w - 1, msg_color | curses.A_BOLD)
 
         # --- Footer ---
-        # Clear the line first
-        stdscr.move(h - 1, 0)
-        stdscr.clrtoeol()
-        footer = "Arrows: Navigate | "
+        footer = f"TX {screen.bytes_per_sec:.0f} B/s | " # Terminal output rate, to check the row diffing
+        if frame_recorder is not None:
+            footer += f"REC {frame_recorder.recorded} ({frame_recorder.dropped} lost) | "
+        footer += "Arrows: Navigate | "
         if active_tab_name == "Lights":
              footer += "Enter: Control | " # Add hint for lights tab
         # Restore hint for logs tab
         elif active_tab_name == "Logs":
-             footer += "C: Copy Line | "
+             footer += "C: Copy Line | T: Trace | F: Profile | "
         # Update tab names in footer hint
         footer += " ".join([f"{key}:{name}" for key, name in zip(tab_keys, tabs)])
         footer += " | S: Sort (where avail) | C: Copy | P: Pause | Q: Quit"
-        stdscr.attron(curses.color_pair(1) | curses.A_BOLD)
-        stdscr.addnstr(h - 1, 0, footer[:w-1].ljust(w-1), w - 1)
-        stdscr.attroff(curses.color_pair(1) | curses.A_BOLD)
+        screen.addnstr(h - 1, 0, footer[:w-1].ljust(w-1), w - 1, curses.color_pair(1) | curses.A_BOLD)
 
+        screen.flush()       # Repaint only the rows that changed
         stdscr.noutrefresh() # Mark stdscr for refresh
         curses.doupdate()    # Update physical screen efficiently
+        last_draw = time.monotonic()
+        need_wait = True
+
+    # Cleanup: stop waking a UI that is gone
+    visible_view = None
+    wake_fds, ui_wake_fds = ui_wake_fds, None
+    for fd in wake_fds:
+        os.close(fd)
 
 
 # --- Drawing Functions ---
 
 # --- Restore Drawing Function for Logs Tab ---
-def draw_logs_tab(stdscr, h, w, max_rows, state, items, wrap=False):
-    """Draws the 'Logs' tab content."""
+def draw_logs_tab(screen, h, w, max_rows, state, items, wrap=False, layout=None):
+    """
+    Draws the 'Logs' tab content from LogEntry items that already passed the filter.
+    With wrap, layout is a WrapLayout of items at width w - 2 (built here if not given).
+    """
     global copy_msg, copy_time, log_filter
     pad = 1
-
-    # apply filter
-    if log_filter:
-        filtered = [line for line in items if log_filter in line]
-    else:
-        filtered = list(items)
+    filtered = items # Filtered incrementally by LogView; only the visible window is read below
+    if wrap and (layout is None or layout.width != w - pad*2):
+        layout = WrapLayout() # Items without a maintained layout are wrapped from scratch
+        layout.rebuild(filtered, w - pad*2)
+    if not wrap:
+        layout = None
+    state['_layout'] = layout # Lets Page Up/Down move by screen rows
 
     # if filter hides everything, show a hint and return
     if log_filter and not filtered:
-        stdscr.addstr(3, pad, f"-- no log lines matching '{log_filter}' --", curses.A_DIM)
+        screen.addstr(3, pad, f"-- no log lines matching '{log_filter}' --", curses.A_DIM)
         return
 
     # No titles needed, just list the logs
@@ -849,6 +2176,14 @@ def draw_logs_tab(stdscr, h, w, max_rows, state, items, wrap=False):
         selected_idx = max(0, min(selected_idx, total - 1))
         if selected_idx < v_offset:
             v_offset = selected_idx
+        elif layout:
+            # Scroll by screen rows until the whole selected entry fits
+            first_row = layout.end_row(selected_idx) - max_rows
+            if layout.start_row(v_offset) < first_row:
+                v_offset = layout.entry_at_row(first_row)
+                if layout.start_row(v_offset) < first_row:
+                    v_offset += 1
+                v_offset = min(v_offset, selected_idx)
         elif selected_idx >= v_offset + max_rows:
             v_offset = selected_idx - max_rows + 1
         state['selected_idx'] = selected_idx
@@ -858,33 +2193,24 @@ def draw_logs_tab(stdscr, h, w, max_rows, state, items, wrap=False):
 
     # --- Scroll Indicators ---
     if v_offset > 0:
-        stdscr.addstr(2, w - 1, "↑", curses.A_DIM) # Start drawing from row 2
-    if v_offset + max_rows < total:
-        stdscr.addstr(h - 3, w - 1, "↓", curses.A_DIM)
+        screen.addstr(2, w - 1, "↑", curses.A_DIM) # Start drawing from row 2
+    if (layout.start_row(v_offset) + max_rows < layout.total_rows()) if layout and total else (v_offset + max_rows < total):
+        screen.addstr(h - 3, w - 1, "↓", curses.A_DIM)
 
     # Draw list items, with optional wrapping
     row = 2
-    for idx in range(v_offset, min(v_offset + max_rows, total)):
-        item = filtered[idx]
-        # pick the colour once based on the original line
-        if "ERROR" in item:
-            base_attr = curses.color_pair(7)
-        elif "WARNING" in item:
-            base_attr = curses.color_pair(5)
-        elif "DEBUG" in item:
-            base_attr = curses.color_pair(6)
-        else:
-            base_attr = curses.color_pair(3)
+    for idx, item in enumerate(itertools.islice(filtered, v_offset, min(v_offset + max_rows, total)), v_offset):
+        base_attr = curses.color_pair(item.color) # Chosen from the level when the entry was created
 
         is_sel = (idx == selected_idx)
         if is_sel:
             base_attr |= curses.A_REVERSE
 
-        lines = textwrap.wrap(item, w - pad*2) if wrap else [item]
+        lines = layout.lines(item) if layout else [item.text] # Wrapped once per width, see WrapLayout
         for sub in lines:
             if row > h - 3:
                 break
-            stdscr.addnstr(row, pad, sub.ljust(w - pad*2), w - pad*2, base_attr)
+            screen.addnstr(row, pad, sub.ljust(w - pad*2), w - pad*2, base_attr)
             row += 1
         if row > h - 3:
             break
@@ -893,13 +2219,13 @@ def draw_logs_tab(stdscr, h, w, max_rows, state, items, wrap=False):
     if state.get('_copy_action', False):
         if total:
             item_to_copy = filtered[selected_idx]
-            copy_to_clipboard(item_to_copy)
+            copy_to_clipboard(item_to_copy.text)
             copy_msg = f"Log line copied."
             copy_time = time.time()
         state['_copy_action'] = False # Reset flag
 
 
-def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
+def draw_lights_tab(screen, h, w, max_rows, state, items): # Accept items
     """Draws the 'Lights' tab content."""
     global copy_msg, copy_time
     # Column setup (similar to mapped devices)
@@ -912,23 +2238,16 @@ def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
     state_start = name_start + col_name_w + 1 + pad
 
     # Titles
-    stdscr.addnstr(2, area_start, "Area".ljust(col_area_w), col_area_w, curses.A_BOLD)
-    stdscr.addnstr(2, name_start, "Light Name".ljust(col_name_w), col_name_w, curses.A_BOLD)
-    stdscr.addnstr(2, state_start, "Status / Control".ljust(col_state_w), col_state_w, curses.A_BOLD)
-    stdscr.hline(3, 0, '-', w)
+    screen.addnstr(2, area_start, "Area".ljust(col_area_w), col_area_w, curses.A_BOLD)
+    screen.addnstr(2, name_start, "Light Name".ljust(col_name_w), col_name_w, curses.A_BOLD)
+    screen.addnstr(2, state_start, "Status / Control".ljust(col_state_w), col_state_w, curses.A_BOLD)
+    screen.hline(3, 0, '-', w)
     # Vertical separators
     for y in range(2, h - 2):
-        stdscr.addch(y, area_start + col_area_w, '|')
-        stdscr.addch(y, name_start + col_name_w, '|')
-
-    # Sort the passed-in items list using light_sort_labels
-    sort_mode = state['sort_mode']
-    if sort_mode == 0: # Area -> Name
-        items.sort(key=lambda x: (x.get('suggested_area', 'zzz').lower(), x.get('friendly_name', 'zzz').lower()))
-    elif sort_mode == 1: # Name
-        items.sort(key=lambda x: x.get('friendly_name', 'zzz').lower())
-    elif sort_mode == 2: # Newest
-        items.sort(key=lambda x: x.get('last_updated', 0), reverse=True)
+        screen.addch(y, area_start + col_area_w, '|')
+        screen.addch(y, name_start + col_name_w, '|')
+
+    # Items arrive in light_sort_labels order (see RecordOrder); no sorting here
 
     total = len(items)
     selected_idx = state['selected_idx']
@@ -948,9 +2267,9 @@ def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
 
     # --- Scroll Indicators ---
     if v_offset > 0:
-        stdscr.addstr(4, w - 1, "↑", curses.A_DIM)
+        screen.addstr(4, w - 1, "↑", curses.A_DIM)
     if v_offset + max_rows < total:
-        stdscr.addstr(h - 3, w - 1, "↓", curses.A_DIM)
+        screen.addstr(h - 3, w - 1, "↓", curses.A_DIM)
 
     # Draw list items
     for idx in range(v_offset, min(v_offset + max_rows, total)):
@@ -960,8 +2279,8 @@ def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
         attr = curses.color_pair(2) | curses.A_BOLD if is_selected else curses.color_pair(3)
         area_attr = curses.color_pair(6) if not is_selected else attr # Different color for area
 
-        stdscr.addnstr(row, area_start, item.get('suggested_area', 'N/A').ljust(col_area_w), col_area_w, area_attr)
-        stdscr.addnstr(row, name_start, item.get('friendly_name', 'N/A').ljust(col_name_w), col_name_w, attr)
+        screen.addnstr(row, area_start, item.get('suggested_area', 'N/A').ljust(col_area_w), col_area_w, area_attr)
+        screen.addnstr(row, name_start, item.get('friendly_name', 'N/A').ljust(col_name_w), col_name_w, attr)
 
         # --- Modified State Display Logic ---
         decoded = item.get('last_decoded_data', {})
@@ -1009,7 +2328,7 @@ def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
         elif state_str in ("[No Data]", "[State Missing]"):
              pass # Already set above based on the error condition
 
-        stdscr.addnstr(row, state_start, state_str.ljust(col_state_w), col_state_w, state_attr)
+        screen.addnstr(row, state_start, state_str.ljust(col_state_w), col_state_w, state_attr)
         # --- End Modified State Display Logic ---
 
     # --- Copy Action for Lights Tab ---
@@ -1026,6 +2345,7 @@ def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
                 "instance": item_to_copy.get('instance'),
                 "entity_id": item_to_copy.get('entity_id') # Add entity_id
             }
+            import json
             txt = json.dumps(copy_data, indent=2)
             copy_to_clipboard(txt)
             copy_msg = f"Light '{item_to_copy.get('friendly_name')}' data copied."
@@ -1033,7 +2353,7 @@ def draw_lights_tab(stdscr, h, w, max_rows, state, items): # Accept items
         state['_copy_action'] = False # Reset flag
 
 
-def draw_raw_can_tab(stdscr, h, w, max_rows, state, interface, names, recs): # Accept names, recs
+def draw_raw_can_tab(screen, h, w, max_rows, state, interface, names, recs): # Accept names, recs
     """Draws the content for a Raw CAN tab."""
     global copy_msg, copy_time
     # Column setup (similar to original)
@@ -1048,23 +2368,16 @@ def draw_raw_can_tab(stdscr, h, w, max_rows, state, interface, names, recs): # A
     spec_cw = spec_w - spec_pad * 2
 
     # Titles
-    stdscr.addnstr(2, left_pad, 'Message Name'.center(left_cw), left_cw, curses.A_BOLD)
-    stdscr.addnstr(2, mid_start, 'Raw & Decoded'.center(mid_cw), mid_cw, curses.A_BOLD)
-    stdscr.addnstr(2, spec_start, 'Spec JSON'.center(spec_cw), spec_cw, curses.A_BOLD)
-    stdscr.hline(3, 0, '-', w)
+    screen.addnstr(2, left_pad, 'Message Name'.center(left_cw), left_cw, curses.A_BOLD)
+    screen.addnstr(2, mid_start, 'Raw & Decoded'.center(mid_cw), mid_cw, curses.A_BOLD)
+    screen.addnstr(2, spec_start, 'Spec JSON'.center(spec_cw), spec_cw, curses.A_BOLD)
+    screen.hline(3, 0, '-', w)
     # Vertical separators
     for y in range(2, h - 2):
-        stdscr.addch(y, left_w, '|')
-        stdscr.addch(y, left_w + mid_w + 1, '|')
-
-    # Sort the passed-in names list based on the passed-in recs data
-    sort_mode = state['sort_mode']
-    if sort_mode == 0: # A->Z
-        names.sort()
-    elif sort_mode == 1: # Newest
-        names.sort(key=lambda n: recs.get(n, {}).get('last_received', 0), reverse=True)
-    else: # Oldest
-        names.sort(key=lambda n: recs.get(n, {}).get('first_received', 0))
+        screen.addch(y, left_w, '|')
+        screen.addch(y, left_w + mid_w + 1, '|')
+
+    # Names arrive in sort_labels order (see RecordOrder); no sorting here
 
     total = len(names)
     selected_idx = state['selected_idx']
@@ -1084,9 +2397,9 @@ def draw_raw_can_tab(stdscr, h, w, max_rows, state, interface, names, recs): # A
 
     # --- Scroll Indicators ---
     if v_offset > 0:
-        stdscr.addstr(4, w - 1, "↑", curses.A_DIM)
+        screen.addstr(4, w - 1, "↑", curses.A_DIM)
     if v_offset + max_rows < total:
-        stdscr.addstr(h - 3, w - 1, "↓", curses.A_DIM)
+        screen.addstr(h - 3, w - 1, "↓", curses.A_DIM)
 
     # Left pane: names
     for idx in range(v_offset, min(v_offset + max_rows, total)):
@@ -1099,157 +2412,194 @@ def draw_raw_can_tab(stdscr, h, w, max_rows, state, interface, names, recs): # A
         time_since = time.time() - rec_data.get('last_received', time.time())
         time_str = f" ({time_since:.1f}s)" if time_since < 600 else "" # Show if < 10 mins
         display_name = (name + time_str).ljust(left_cw)
-        stdscr.addnstr(row, left_pad, display_name, left_cw, attr)
+        screen.addnstr(row, left_pad, display_name, left_cw, attr)
+
+    # Reader efficiency for this interface: unchanged-payload hits and kernel filter savings
+    stats_str = f"Unchanged: {payload_hit_rate(interface):.1f}%" if change_detection else ""
+    if kernel_filters:
+        savings = kernel_filter_savings(interface)
+        if savings:
+            stats_str += f"  Filter '{kernel_filter_mode}' saved {savings[0]} ({savings[1]:.0f}%)"
+        else:
+            stats_str += f"  Filter '{kernel_filter_mode}' active"
+    if stats_str:
+        screen.addnstr(7, mid_start, stats_str.strip().ljust(mid_cw), mid_cw, curses.color_pair(5))
 
     # Right panes: raw/decoded + spec
     if total:
         rec = recs.get(names[selected_idx], {}) # Use .get for safety
         if rec: # Only draw if record exists
             # Raw ID & data
-            stdscr.addnstr(4, mid_start, f"ID  : {rec.get('raw_id', 'N/A')}".ljust(mid_cw), mid_cw, curses.color_pair(4) | curses.A_BOLD)
-            stdscr.addnstr(5, mid_start, f"Data: {rec.get('raw_data', 'N/A')}".ljust(mid_cw), mid_cw, curses.color_pair(4) | curses.A_BOLD)
-            stdscr.addnstr(6, mid_start, f"IFace:{interface}".ljust(mid_cw), mid_cw, curses.color_pair(6))
+            screen.addnstr(4, mid_start, f"ID  : {rec.get('raw_id', 'N/A')}".ljust(mid_cw), mid_cw, curses.color_pair(4) | curses.A_BOLD)
+            screen.addnstr(5, mid_start, f"Data: {rec.get('raw_data', 'N/A')}".ljust(mid_cw), mid_cw, curses.color_pair(4) | curses.A_BOLD)
+            screen.addnstr(6, mid_start, f"IFace:{interface}  SA: {rec.get('source_address', 'N/A')}".ljust(mid_cw), mid_cw, curses.color_pair(6))
             # Decoded signals
             line_offset = 8
             decoded_data = rec.get('decoded', {})
             for i, (s, v) in enumerate(decoded_data.items()):
                 row = line_offset + i
                 if row < h - 2:
-                    stdscr.addnstr(row, mid_start, f"{s}: {v}".ljust(mid_cw), mid_cw)
-            # Full spec JSON
+                    screen.addnstr(row, mid_start, f"{s}: {v}".ljust(mid_cw), mid_cw)
+            # Full spec JSON (rendered once per spec entry, see render_spec)
             try:
-                spec_data = rec.get('spec', {})
-                spec_lines = json.dumps(spec_data, indent=2).splitlines()
-                for i, ln in enumerate(spec_lines):
-                    row = 4 + i
-                    if row < h - 2:
-                        # Highlight DGN if present
-                        spec_attr = curses.color_pair(3)
-                        if '"dgn_hex":' in ln:
-                            spec_attr = curses.color_pair(5) | curses.A_BOLD
-                        stdscr.addnstr(row, spec_start, ln.ljust(spec_cw), spec_cw, spec_attr)
+                _, spec_lines = render_spec(rec.get('spec', {}))
+                for i, (ln, spec_attr) in enumerate(spec_lines[:max(0, h - 6)]):
+                    screen.addnstr(4 + i, spec_start, ln.ljust(spec_cw), spec_cw, spec_attr)
             except Exception as e:
-                 stdscr.addnstr(4, spec_start, f"Error dumping spec: {e}", spec_cw, curses.A_BOLD | curses.color_pair(5))
+                 screen.addnstr(4, spec_start, f"Error dumping spec: {e}", spec_cw, curses.A_BOLD | curses.color_pair(5))
 
 
     # --- Copy Action for Raw Tab ---
     if state.get('_copy_action', False):
         if total:
             rec_to_copy = recs.get(names[selected_idx], {})
-            txt = json.dumps(rec_to_copy.get('spec', {}), indent=2)
+            txt, _ = render_spec(rec_to_copy.get('spec', {}))
             copy_to_clipboard(txt)
             copy_msg = f"Spec for '{names[selected_idx]}' copied."
             copy_time = time.time()
         state['_copy_action'] = False # Reset flag
 
+def draw_stats_tab(screen, h, w, max_rows, state, summaries, rows):
+    """Draws the 'Stats' tab: bus rates and load per interface, then DGN/source addresses by rate."""
+    # Per-interface summary
+    screen.addnstr(2, 1, f"{'Interface':<10} {'Frames/s':>9} {'Bus fr/s':>9} {'Bus load':>9} {'Frames':>11} "
+                         f"{'RX err':>8} {'TX err':>8} {'Dropped':>8}", w - 2, curses.A_BOLD)
+    row = 3
+    for summary in summaries:
+        if summary['fps'] is None:
+            line = f"{summary['interface']:<10} {'...':>9}"
+            attr = curses.A_DIM
+        else:
+            counters = summary['counters']
+            def counter(name):
+                value = counters.get(name)
+                return '-' if value is None else str(value)
+            line = (f"{summary['interface']:<10} {summary['fps']:>9.0f} {summary['bus_fps']:>9.0f} "
+                    f"{summary['load']:>8.1f}% {summary['frames']:>11} "
+                    f"{counter('rx_errors'):>8} {counter('tx_errors'):>8} {counter('rx_dropped'):>8}")
+            attr = curses.color_pair(3)
+            load = summary['load']
+            if load >= 70 or summary['deltas'].get('rx_errors') or summary['deltas'].get('tx_errors'):
+                attr = curses.color_pair(7) | curses.A_BOLD # Saturated or errors in the window
+            elif load >= 40:
+                attr = curses.color_pair(5)
+        screen.addnstr(row, 1, line, w - 2, attr)
+        row += 1
+    span = max((s['span'] for s in summaries), default=0)
+    screen.addnstr(row, 1, f"Rates over the last {span:.0f}s; load assumes {BITRATE // 1000} kbit/s without stuff bits. "
+                           f"Errors are kernel interface counters (red when they grew in the window).", w - 2, curses.A_DIM)
+    row += 1
+    if transports:
+        totals = transport_totals()
+        lost = totals['aborted'] + totals['timed_out'] + totals['no_memory']
+        screen.addnstr(row, 1, format_transport(totals).capitalize(), w - 2, curses.color_pair(5) if lost else curses.A_DIM)
+        row += 1
+    if tx_queues:
+        totals = tx_totals()
+        lost = totals['failed'] + totals['dropped']
+        screen.addnstr(row, 1, format_tx(totals).capitalize(), w - 2, curses.color_pair(5) if lost else curses.A_DIM)
+        row += 1
+    screen.hline(row, 0, '-', w)
+    row += 1
+
+    # Busiest DGN / source address pairs
+    screen.addnstr(row, 1, f"{'Frames/s':>9} {'Share':>6}  {'Interface':<10} {'DGN':<6} {'SA':<4} Name", w - 2, curses.A_BOLD)
+    top = row + 1
+    visible = max(1, h - 2 - top)
+    total = len(rows)
+    selected_idx = max(0, min(state['selected_idx'], total - 1)) if total else 0
+    v_offset = state['v_offset']
+    if selected_idx < v_offset:
+        v_offset = selected_idx
+    elif selected_idx >= v_offset + visible:
+        v_offset = selected_idx - visible + 1
+    v_offset = max(0, min(v_offset, max(0, total - visible)))
+    state['selected_idx'], state['v_offset'] = selected_idx, v_offset
+
+    if not total:
+        screen.addnstr(top, 1, "Waiting for traffic...", w - 2, curses.A_DIM)
+    if v_offset > 0:
+        screen.addstr(top, w - 1, "↑", curses.A_DIM)
+    if v_offset + visible < total:
+        screen.addstr(h - 3, w - 1, "↓", curses.A_DIM)
+    for idx in range(v_offset, min(v_offset + visible, total)):
+        rate, interface, pgn, source, name, share = rows[idx]
+        dgn = f"{pgn:05X}" if pgn is not None else "std"
+        sa = f"{source:02X}" if pgn is not None else f"{source:03X}"
+        line = f"{rate:>9.1f} {share:>5.1f}%  {interface:<10} {dgn:<6} {sa:<4} {name}"
+        attr = curses.color_pair(2) | curses.A_BOLD if idx == selected_idx else curses.color_pair(3)
+        screen.addnstr(top + idx - v_offset, 1, line.ljust(w - 2), w - 2, attr)
+
+def set_light_optimistic(entity_id, brightness_ui):
+    """Shows a commanded level right away; the next status frame corrects it if the light disagrees."""
+    with light_states_lock:
+        ent = light_device_states.get(entity_id)
+        if ent:
+            ent.setdefault('last_decoded_data', {})
+            ent['last_decoded_data']['state'] = 'ON' if brightness_ui > 0 else 'OFF'
+            ent['last_decoded_data']['brightness'] = brightness_ui
+            ent['last_updated'] = time.time()
+            light_order.touch(entity_id)
+            if brightness_ui > 0:
+                ent['prev_brightness'] = brightness_ui
+            logging.debug(f"Optimistically updated UI for {entity_id} to {ent['last_decoded_data']['state']} ({brightness_ui}%)")
+    brightness_targets[entity_id] = (brightness_ui, time.monotonic())
+    invalidate_payload_cache() # Let the next status frame correct the optimistic state
+
+def set_level_payload(instance, can_level):
+    """DC_DIMMER_COMMAND_2 SetLevel payload (can_level 0–200 = 0–100%)."""
+    return bytes([
+        instance,   # B0 = instance
+        0x7C,       # B1 = group mask (as observed from status)
+        can_level,  # B2 = desired level
+        0x00,       # B3 = command (0 = SetLevel)
+        0x00,       # B4 = duration (0 = immediate)
+        0xFF, 0xFF, 0xFF  # B5–B7 = reserved
+    ])
+
 def _send_exact_brightness(item, brightness_ui):
     """
-    Send a SetLevel command to put this light at exactly brightness_ui (0–100%).
+    Queue a SetLevel command to put this light at exactly brightness_ui (0–100%).
     That’ll both turn it on and set its level.
     """
     entity_id = item['entity_id']
     cfg       = light_command_info[entity_id]
-    bus       = active_buses.get(cfg['interface'])
-    if not bus:
-        copy_msg = f"Error: no bus for {entity_id}"
+    if cfg['interface'] not in active_buses:
+        notify(f"Error: no bus for {entity_id}")
         return
 
     # Scale 0–100% to 0–200 CAN units (capped at 0xC8)
-    can_level = min(brightness_ui * 2, 0xC8)
-
-    # Reconstruct ID exactly like your toggle logic
-    dgn      = cfg['dgn']
-    prio, sa, da = 6, 0xF9, 0xFF
-    dp = (dgn >> 16) & 1
-    pf = (dgn >> 8) & 0xFF
-    if pf < 0xF0:
-        can_id = (prio<<26)|(dp<<24)|(pf<<16)|(da<<8)|sa
-    else:
-        ps     = dgn & 0xFF
-        can_id = (prio<<26)|(dp<<24)|(pf<<16)|(ps<<8)|sa
-
-    # Build the “SetLevel” payload
-    data = bytes([
-        cfg['instance'],  # B0 = instance
-        0x7C,             # B1 = group mask
-        can_level,        # B2 = desired level
-        0x00,             # B3 = command (0 = SetLevel)
-        0x00,             # B4 = duration
-        0xFF, 0xFF, 0xFF  # B5–B7 = reserved
-    ])
-
-    # Send it twice (per your pattern) and optimistically update UI
-    ok1 = send_can_command(bus, can_id, data)
-    time.sleep(0.05)
-    ok2 = send_can_command(bus, can_id, data)
-
-    # Optimistic UI update
-    with light_states_lock:
-        ent = light_device_states.get(entity_id)
-        if ent:
-            ent['last_decoded_data']['state'] = 'ON' if brightness_ui > 0 else 'OFF'
-            ent['last_decoded_data']['brightness'] = brightness_ui
-            ent['last_updated'] = time.time()
-    if brightness_ui > 0:
-        ent['prev_brightness'] = brightness_ui
-
-    # Clipboard/notification
-    status = "2/2" if ok1 and ok2 else "1/2" if ok1 else "failed"
-    copy_msg = f"{item['friendly_name']}: set to {brightness_ui}% ({status})"
-    copy_time = time.time()
+    data = set_level_payload(cfg['instance'], min(brightness_ui * 2, 0xC8))
+    # Keyed by entity so it replaces a pending +/- adjustment; a digit is deliberate, so no delay
+    if queue_command(cfg['interface'], command_can_id(cfg['dgn']), data, f"{item['friendly_name']}: set to {brightness_ui}%",
+                     key=entity_id):
+        set_light_optimistic(entity_id, brightness_ui)
 
 def _send_new_brightness(item, delta_pct):
     """
     Adjust brightness by delta_pct (e.g. +10 or -10), clamp 0–100,
-    send the CAN frame twice, and optimistically update the UI.
+    queue the CAN frame (sent twice), and optimistically update the UI.
+    Presses within COALESCE_WINDOW of each other only move the pending
+    target, so a held key sends one SetLevel for where it stopped.
     """
     entity_id = item['entity_id']
     cfg       = light_command_info[entity_id]
-    interface = cfg['interface']
-    bus       = active_buses.get(interface)
-    if not bus:
-        copy_msg = f"Error: no bus for {entity_id}"
+    if cfg['interface'] not in active_buses:
+        notify(f"Error: no bus for {entity_id}")
         return
 
-    # compute new UI brightness
-    with light_states_lock:
-        current = item['last_decoded_data'].get('brightness', 0)
-    new_ui  = max(0, min(100, current + delta_pct))
-    new_can = min(0xC8, new_ui * 2)  # scale to 0–200
-
-    # rebuild the CAN ID (same as your ON/OFF logic)
-    dgn = cfg['dgn']; inst = cfg['instance']
-    prio=6; sa=0xF9; da=0xFF
-    dp=(dgn>>16)&1; pf=(dgn>>8)&0xFF
-    if pf<0xF0:
-        can_id=(prio<<26)|(dp<<24)|(pf<<16)|(da<<8)|sa
+    # compute new UI brightness, stepping from the level we last asked for while the status may still lag behind it
+    target = brightness_targets.get(entity_id)
+    if target and time.monotonic() - target[1] < BRIGHTNESS_TARGET_HOLD:
+        current = target[0]
     else:
-        ps=dgn&0xFF
-        can_id=(prio<<26)|(dp<<24)|(pf<<16)|(ps<<8)|sa
-
-    # build the brightness‐set payload
-    data = bytes([inst, 0x7C, new_can, 0x00, 0x00, 0xFF, 0xFF, 0xFF])
-
-    # --- Send it twice like your ON/OFF ---
-    first_ok = send_can_command(bus, can_id, data)
-    if first_ok:
-        # optimistic UI update
         with light_states_lock:
-            ent = light_device_states.get(entity_id)
-            if ent:
-                ent['last_decoded_data']['brightness'] = new_ui
-                ent['last_decoded_data']['state'] = 'ON' if new_ui > 0 else 'OFF'
-                ent['last_updated'] = time.time()
-
-        time.sleep(0.05)
-        second_ok = send_can_command(bus, can_id, data)
-        if second_ok:
-            copy_msg = f"{item['friendly_name']}: set to {new_ui}% (2/2)"
-        else:
-            copy_msg = f"{item['friendly_name']}: set to {new_ui}% (1/2 failed)"
-    else:
-        copy_msg = f"{item['friendly_name']}: brightness cmd failed"
-    copy_time = time.time()
+            current = item['last_decoded_data'].get('brightness', 0)
+    new_ui  = max(0, min(100, current + delta_pct))
+    data = set_level_payload(cfg['instance'], min(0xC8, new_ui * 2)) # scale to 0–200
+    if queue_command(cfg['interface'], command_can_id(cfg['dgn']), data, f"{item['friendly_name']}: set to {new_ui}%",
+                     key=entity_id, delay=COALESCE_WINDOW):
+        set_light_optimistic(entity_id, new_ui)
 
 # Modify handle_input to use active_buses
 def handle_input_for_tab(key, tab_name, state, interfaces, current_tab_index): # Added interfaces and current_tab_index
@@ -1290,6 +2640,8 @@ def handle_input_for_tab(key, tab_name, state, interfaces, current_tab_index): #
         # # if we moved past the bottom of the window
         # elif sel >= vof + max_rows:
         #     state['v_offset'] = sel - max_rows + 1
+    elif tab_name == "Stats":
+        total = len((last_draw_data.get("stats") or ([], []))[1])
     elif " Raw" in tab_name:
         iface_index = -1
         try: # Find interface index based on tab name
@@ -1325,6 +2677,17 @@ def handle_input_for_tab(key, tab_name, state, interfaces, current_tab_index): #
         if state['selected_idx'] < state['v_offset']:
             state['v_offset'] = state['selected_idx']
 
+    elif key == curses.KEY_NPAGE and total and state.get('_layout'):  # Page Down through wrapped logs
+        # jump down one screen of rows rather than one screen of entries
+        layout = state['_layout']
+        state['selected_idx'] = min(layout.entry_at_row(layout.start_row(min(state['selected_idx'], total - 1)) + max_rows), total - 1)
+
+    elif key == curses.KEY_PPAGE and total and state.get('_layout'):  # Page Up through wrapped logs
+        layout = state['_layout']
+        state['selected_idx'] = layout.entry_at_row(max(0, layout.start_row(min(state['selected_idx'], total - 1)) - max_rows))
+        if state['selected_idx'] < state['v_offset']:
+            state['v_offset'] = state['selected_idx']
+
     elif key == curses.KEY_NPAGE and total:  # Page Down
         # jump down one page
         state['selected_idx'] = min(state['selected_idx'] + max_rows, total - 1)
@@ -1353,40 +2716,16 @@ def handle_input_for_tab(key, tab_name, state, interfaces, current_tab_index): #
         # current_id was determined above using cached data
         state['sort_mode'] = (state['sort_mode'] + 1) % num_sort_modes
 
-        # Re-find the selected item's index AFTER sorting (using cached data again)
+        # Re-find the selected item in the new order through its id -> position map
         if current_id is not None: # Check if we have a valid ID
-            new_items_sorted = [] # This will be a list of IDs (entity_id or message name)
+            order = None
             if tab_name == "Lights":
-                items_list = last_draw_data["lights"] # Use cached light data
-                sm = state['sort_mode']
-                items_list_copy = list(items_list)
-                if sm == 0: items_list_copy.sort(key=lambda x: (x.get('suggested_area', 'zzz').lower(), x.get('friendly_name', 'zzz').lower()))
-                elif sm == 1: items_list_copy.sort(key=lambda x: x.get('friendly_name', 'zzz').lower())
-                elif sm == 2: items_list_copy.sort(key=lambda x: x.get('last_updated', 0), reverse=True)
-                new_items_sorted = [item.get('entity_id') for item in items_list_copy]
-
-            elif " Raw" in tab_name:
-                iface_index = -1
-                try:
-                    iface_name_part = tab_name.split(" ")[0].lower()
-                    # Restore original index calculation
-                    iface_index = current_tab_index - 2
-                except (ValueError, IndexError): pass
-
-                if iface_index != -1:
-                    # Use correct cache key
-                    names_list, recs_dict = last_draw_data.get(f"raw{iface_index}", ([], {})) # Use cached
-                    sm = state['sort_mode']
-                    names_list_copy = list(names_list)
-                    if sm == 0: new_items_sorted = sorted(names_list_copy)
-                    elif sm == 1: new_items_sorted = sorted(names_list_copy, key=lambda n: recs_dict.get(n, {}).get('last_received', 0), reverse=True)
-                    else: new_items_sorted = sorted(names_list_copy, key=lambda n: recs_dict.get(n, {}).get('first_received', 0))
-
-            try:
-                # Find index of the original ID in the newly sorted list of IDs
-                state['selected_idx'] = new_items_sorted.index(current_id)
-            except (ValueError, IndexError): # Handle cases where ID might not be found (e.g., data changed rapidly)
-                state['selected_idx'] = 0 # Fallback
+                order = light_order
+            elif " Raw" in tab_name and 0 <= current_tab_index - 2 < len(interfaces):
+                order = raw_orders[interfaces[current_tab_index - 2]]
+            position = order.position(state['sort_mode'], current_id) if order else None
+            # Fall back to the top if the ID is gone (e.g., data changed rapidly)
+            state['selected_idx'] = position if position is not None else 0
         else:
              state['selected_idx'] = 0 # Fallback if no current_id
 
@@ -1517,116 +2856,160 @@ def handle_input_for_tab(key, tab_name, state, interfaces, current_tab_index): #
 
             # --- Determine Command, Brightness, Duration --- END
 
-            # --- Construct CAN ID --- START (Corrected Logic)
-            priority = 6
-            sa = 0xF9
-            da = 0xFF # Broadcast DA for PDU1
-
-            # Extract PGN components
-            dp = (dgn >> 16) & 1 # Data Page bit
-            pf = (dgn >> 8) & 0xFF # PDU Format
-
-            if pf < 0xF0: # PDU1 Format (uses DA) PF 0-239
-                 # Build PDU1 ID: Prio | DP | PF | DA | SA
-                 can_id = (priority << 26) | (dp << 24) | (pf << 16) | (da << 8) | sa
-            else: # PDU2 Format (uses PS) PF 240-255
-                 # Build PDU2 ID: Prio | DP | PF | PS | SA
-                 ps = dgn & 0xFF # PDU Specific
-                 can_id = (priority << 26) | (dp << 24) | (pf << 16) | (ps << 8) | sa
-
-            # --- Construct CAN ID --- END
-
-            # --- Construct Data Payload according to 1FEDB (DC_DIMMER_COMMAND_2)
-            # B0: instance
-            # B1: group mask (Using 7C as observed from status)
-            # B2: desired level (0–200 => 0–100%)
-            # B3: command (0=SetLevel)
-            # B4: duration (0=immediate)
-            # B5–B7: all reserved => must be 0xFF
+            # --- Queue Command (sent twice by the interface's TX thread) ---
             try:
-                # Use the determined action, scaled brightness (0-200), and duration
-                data = bytes([
-                    instance,   # B0: Instance
-                    0x7C,       # B1: Group Mask (Using 7C as observed)
-                    brightness, # B2: Desired Level (0-200)
-                    0x00,       # B3: Command (0 = SetLevel)
-                    0x00,       # B4: Duration (0 = immediate)
-                    0xFF,       # B5: Reserved
-                    0xFF,       # B6: Reserved
-                    0xFF        # B7: Reserved
-                ])
-
-                logging.debug(f"→ Sending CAN ID 0x{can_id:08X}: {data.hex().upper()} on {target_interface_name}")
-
-                # --- Send Command Twice --- START
-                first_send_success = send_can_command(target_bus, can_id, data)
-                if first_send_success:
-                    copy_msg = f"Sent command to {light_name}: {action_desc} (1/2)" # Indicate first send
-                    copy_time = time.time() # Update time for first message
-
-                    # --- Optimistic UI Update (after first successful send) ---
-                    with light_states_lock:
-                        if entity_id in light_device_states:
-                            # Determine expected state based on action
-                            expected_state = 'ON' if action_desc.startswith("Turn ON") else 'OFF'
-                            # Use the brightness value *before* scaling (0-100) for UI
-                            expected_brightness_ui = brightness_ui if expected_state == 'ON' else 0
-
-                            # Update the last decoded data optimistically
-                            # Ensure 'last_decoded_data' exists before trying to update nested keys
-                            if 'last_decoded_data' not in light_device_states[entity_id]:
-                                light_device_states[entity_id]['last_decoded_data'] = {} # Initialize if missing
-
-                            light_device_states[entity_id]['last_decoded_data']['state'] = expected_state
-                            light_device_states[entity_id]['last_decoded_data']['brightness'] = expected_brightness_ui # Store 0-100
-                            light_device_states[entity_id]['last_updated'] = time.time()
-                            logging.debug(f"Optimistically updated UI for {entity_id} to {expected_state} ({expected_brightness_ui}%)")
-                        else:
-                            logging.warning(f"Cannot optimistically update UI: {entity_id} not found in light_device_states")
-                    # --- End Optimistic UI Update ---
-
-                    # Wait briefly before sending again
-                    time.sleep(0.05) # 50 milliseconds delay
-
-                    logging.debug(f"→ Resending CAN ID 0x{can_id:08X}: {data.hex().upper()} on {target_interface_name}")
-                    second_send_success = send_can_command(target_bus, can_id, data)
-
-                    if second_send_success:
-                        copy_msg = f"Sent command to {light_name}: {action_desc} (2/2)" # Update message for second send
-                        copy_time = time.time() # Update time again
-                    else:
-                        copy_msg = f"Sent first command, but second send failed for {light_name}"
-                        copy_time = time.time()
-                        # Log the second failure specifically
-                        logging.error(f"Second send attempt failed for {light_name} (ID: 0x{can_id:08X})")
-
-                else: # First send failed
-                    copy_msg = f"Failed to send command to {light_name} (1/2)"
-                    copy_time = time.time()
-                # --- Send Command Twice --- END
-
+                can_id = command_can_id(dgn)
+                data = set_level_payload(instance, brightness) # DC_DIMMER_COMMAND_2 SetLevel, immediate
+                # Keyed like brightness changes, so it supersedes a pending one and goes out at once
+                if queue_command(target_interface_name, can_id, data, f"Sent command to {light_name}: {action_desc}", key=entity_id):
+                    set_light_optimistic(entity_id, brightness_ui) # brightness_ui is 0 for Turn OFF
             except Exception as e:
                 logging.error(f"Error constructing or sending CAN command for {light_name}: {e}")
                 copy_msg = f"Error sending command to {light_name}"
                 copy_time = time.time()
 
 
+# --- Headless Mode ---
+def headless_summary(interfaces, previous, elapsed, live=True):
+    """
+    Builds one summary dict of throughput and state. previous maps interface ->
+    frames_received at the last summary and is updated in place. live=False
+    (replay) leaves out the bus state.
+    """
+    summary = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'interfaces': {}}
+    for interface in interfaces:
+        frames = frames_received[interface]
+        stats = {
+            'frames': frames,
+            'frames_per_sec': round((frames - previous.get(interface, 0)) / elapsed, 1) if elapsed > 0 else 0.0,
+            'payload_hit_pct': round(payload_hit_rate(interface), 1),
+            'messages': len(latest_raw_records.get(interface, ())),
+        }
+        if live:
+            stats['bus'] = 'open' if interface in active_buses else 'closed'
+        savings = kernel_filter_savings(interface)
+        if savings:
+            stats['kernel_filtered'] = savings[0]
+        summary['interfaces'][interface] = stats
+        previous[interface] = frames
+    with light_states_lock:
+        lights = list(light_device_states.values())
+    summary['lights'] = len(lights)
+    summary['lights_on'] = sum(1 for l in lights if str(l.get('last_decoded_data', {}).get('state', '')).upper() == 'ON')
+    if frame_recorder is not None:
+        summary['recorded'] = frame_recorder.recorded
+        summary['record_lost'] = frame_recorder.dropped
+    if transports:
+        summary['transport'] = transport_totals()
+    if tx_queues:
+        summary['tx'] = tx_totals()
+    return summary
+
+def format_summary(summary):
+    """One human-readable line for a headless summary."""
+    parts = [summary['time']]
+    for interface, stats in summary['interfaces'].items():
+        part = (f"{interface}: {stats['frames_per_sec']:.0f} fps, {stats['frames']} frames, "
+                f"{stats['messages']} msgs, {stats['payload_hit_pct']:.0f}% repeat")
+        if stats.get('bus') == 'closed':
+            part += ", bus closed"
+        if 'kernel_filtered' in stats:
+            part += f", {stats['kernel_filtered']} filtered"
+        parts.append(part)
+    parts.append(f"lights {summary['lights_on']}/{summary['lights']} on")
+    if 'recorded' in summary:
+        parts.append(f"recorded {summary['recorded']} ({summary['record_lost']} lost)")
+    if 'transport' in summary:
+        parts.append(format_transport(summary['transport']))
+    if 'tx' in summary:
+        parts.append(format_tx(summary['tx']))
+    return " | ".join(parts)
+
+def run_headless(interfaces, threads, interval, out, as_json=False, live=True):
+    """
+    Runs without curses until SIGTERM/SIGINT or until every reader thread has
+    ended (e.g. a replay finished), writing a summary to out every interval
+    seconds and once more on shutdown. Returns True if the readers ended on
+    their own rather than being asked to stop.
+    """
+    import json
+    shutdown = threading.Event()
+    def request_shutdown(signum, frame):
+        logging.info(f"Received {signal.Signals(signum).name}, shutting down...")
+        shutdown.set()
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    previous = {}
+    last = time.monotonic()
+    while True:
+        deadline = last + interval
+        while not shutdown.is_set() and any(t.is_alive() for t in threads) and time.monotonic() < deadline:
+            shutdown.wait(min(0.5, deadline - time.monotonic()))
+            if take_profile_request():
+                toggle_profiler('SIGUSR1')
+        stopping = time.monotonic() < deadline # Woken early: signal or readers gone
+        now = time.monotonic()
+        summary = headless_summary(interfaces, previous, now - last, live)
+        last = now
+        out.write((json.dumps(summary) if as_json else format_summary(summary)) + "\n")
+        out.flush()
+        if stopping:
+            return not shutdown.is_set()
+
 # --- Entry Point ---
 if __name__ == '__main__':
     # Argument Parsing
     parser = argparse.ArgumentParser(description='RV-C CAN Bus Monitor')
-    parser.add_argument('-i', '--interfaces', nargs='+', default=DEFAULT_INTERFACES, help='CAN interface names (e.g., can0 can1)')
+    parser.add_argument('-i', '--interfaces', nargs='+', help=f"CAN interface names (e.g., can0 can1; default {' '.join(DEFAULT_INTERFACES)}, or those in the --replay log)")
     parser.add_argument('-d', '--definitions', default=DEFAULT_RVC_SPEC_PATH, help='Path to the RVC definitions JSON file') # Use constant
     parser.add_argument('-m', '--mapping', default=DEFAULT_DEVICE_MAPPING_PATH, help='Path to the device mapping YAML file') # Use constant
+    parser.add_argument('--config-cache-dir', default=CONFIG_CACHE_DIR, help='Where processed spec/mapping tables are cached between runs')
+    parser.add_argument('--no-config-cache', action='store_true', help='Always parse the spec and mapping files')
+    parser.add_argument('--no-reload', action='store_true', help="Don't watch the spec and mapping files and reload them when they change")
+    parser.add_argument('--reader', choices=['loop', 'threads'], default='loop', help='Reader model: one event loop for all interfaces, or one thread per interface')
+    parser.add_argument('--backend', choices=['python-can', 'raw'], default='python-can', help='Receive path: python-can Bus.recv(), or batched recvmmsg() on a raw AF_CAN socket')
+    parser.add_argument('--kernel-filter', choices=['all', 'decoded', 'mapped'], default='all', help='Drop frames in the kernel: keep everything, only DGNs in the spec, or only mapped device status DGNs; multi-packet transport (TP.CM/TP.DT) frames are always let through')
+    parser.add_argument('--no-change-detection', action='store_true', help='Decode every frame even if its payload repeats the previous one')
+    parser.add_argument('--bitrate', type=int, default=BITRATE, help='CAN bitrate in bit/s, for the Stats tab bus load estimate')
+    parser.add_argument('--max-fps', type=float, default=MAX_FPS, help='Maximum redraws per second caused by bus traffic (keys always redraw immediately)')
+    parser.add_argument('--trace', action='store_true', help='Start with the sampled mapping trace enabled (toggle with T)')
+    parser.add_argument('--trace-sample', type=int, default=10, help='Keep 1 in N frames per PGN in the mapping trace')
+    parser.add_argument('--headless', action='store_true', help='Run without the curses UI (e.g. as a service), logging to stderr and printing periodic summaries')
+    parser.add_argument('--summary-interval', type=float, default=10.0, help='Seconds between headless summaries')
+    parser.add_argument('--summary-file', metavar='PATH', help='Append headless summaries to PATH instead of stdout')
+    parser.add_argument('--summary-json', action='store_true', help='Write headless summaries as JSON lines')
+    parser.add_argument('--profile-window', type=float, default=PROFILE_WINDOW, help='Seconds each profiler run (F key or SIGUSR1) samples for')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR, help='Directory for profiler .folded/.pstats output (default: the system temp directory)')
+    parser.add_argument('--replay', metavar='LOG', help='Replay a candump log or --record recording instead of reading the bus')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='Replay speed relative to the capture (1 = real time, 0 = as fast as possible)')
+    parser.add_argument('--record', metavar='PATH', help='Record every received frame to a binary ring of files at PATH (read back with rvc_recorder.py)')
+    parser.add_argument('--record-size', type=int, default=16, help='Size of each recording segment in MB')
+    parser.add_argument('--record-keep', type=int, default=4, help='Number of recording segments to keep, including the active one')
+    parser.add_argument('--tp-sessions', type=int, default=TRANSPORT_SESSIONS, help='Multi-packet (TP.CM/TP.DT) transfers reassembled at once per interface; buffers are allocated up front')
+    parser.add_argument('--tx-queue-depth', type=int, default=TX_QUEUE_DEPTH, help='Transmissions (retransmits included) queued per interface before further commands are refused')
+    parser.add_argument('--coalesce-window', type=float, default=COALESCE_WINDOW, help='Seconds a +/- brightness change waits for further presses before its SetLevel is sent (0 sends every press)')
     args = parser.parse_args()
+    trace_ring.sample_every = max(1, args.trace_sample)
+    trace_ring.enabled = args.trace
+    if args.headless:
+        # No Logs tab to feed: log to stderr (the journal under systemd) instead
+        logging.getLogger().removeHandler(list_handler)
+        logging.getLogger().addHandler(console_handler)
+        logging.getLogger().setLevel(logging.INFO)
 
     # --- Load Definitions & Mapping ---
     logging.info(f"Attempting to load RVC spec from: {args.definitions}")
     sys.stderr.flush() # Force flush after first log
     logging.info(f"Attempting to load device mapping from: {args.mapping}")
     sys.stderr.flush() # Force flush after second log
-    # Call the renamed function with both paths and unpack all return values, including status_lookup
-    decoder_map, device_mapping, device_lookup, status_lookup, light_entity_ids, entity_id_lookup, light_command_info = load_config_data(args.definitions, args.mapping)
+    # Load all tables as one snapshot; a hot reload later swaps in a new one the same way
+    config_sources = (args.definitions, args.mapping, None if args.no_config_cache else args.config_cache_dir)
+    apply_config(ConfigSnapshot(*load_config_cached(*config_sources)))
+    try:
+        config_key = config_cache_key(config_sources[:2])
+    except OSError:
+        pass # Mapping missing; the first reload after it appears is never skipped
 
     # Check if decoder_map loaded successfully (load_config_data now handles sys.exit)
     # No need for explicit check here if sys.exit is used on critical load errors
@@ -1635,42 +3018,55 @@ if __name__ == '__main__':
 
     # Initialize global state dependent on args
     logging.info("Initializing global state...") # Added log
-    INTERFACES = args.interfaces # Set global interfaces list
+    replay_frames = None # Frame iterator when replaying instead of reading buses
+    if args.replay:
+        try:
+            if args.interfaces:
+                open(args.replay, 'rb').close() # Report an unreadable file now rather than from the replay thread
+            else:
+                INTERFACES = replay_interfaces(args.replay) # Show every interface in the log
+            replay_frames = iter_replay(args.replay)
+        except (OSError, ValueError) as e:
+            logging.critical(f"Cannot read replay log {args.replay}: {e}")
+            sys.exit(1)
+    if args.interfaces:
+        INTERFACES = args.interfaces # Set global interfaces list
+    elif not INTERFACES: # Not already taken from the replay log above
+        INTERFACES = DEFAULT_INTERFACES
     latest_raw_records = {iface: {} for iface in INTERFACES}
+    for iface in INTERFACES:
+        raw_orders[iface] = RecordOrder(RAW_ORDER_MODES) # Created up front so the UI and reader share it
     light_device_states = {} # Initialize light state dict (keyed by entity_id)
     # light_entity_ids and light_command_info are already populated by load_config_data
     last_draw_data = { # Initialize cache structure based on interfaces and new tabs
          "lights": [],
          "logs": [], # <-- Ensure logs cache is initialized
+         "stats": None,
          **{f"raw{i}": ([], {}) for i in range(len(INTERFACES))}
     }
+    kernel_filter_mode = args.kernel_filter
+    change_detection = not args.no_change_detection
+    MAX_FPS = max(1.0, args.max_fps)
+    BITRATE = max(1, args.bitrate)
+    TRANSPORT_SESSIONS = max(1, args.tp_sessions)
+    TX_QUEUE_DEPTH = max(COMMAND_REPEATS, args.tx_queue_depth)
+    COALESCE_WINDOW = max(0.0, args.coalesce_window)
+    PROFILE_WINDOW = max(0.1, args.profile_window)
+    PROFILE_DIR = args.profile_dir
+    signal.signal(signal.SIGUSR1, request_profile_toggle)
+    kernel_filters = build_kernel_filters(kernel_filter_mode)
+    if args.record:
+        from rvc_recorder import FrameRecorder
+        try:
+            frame_recorder = FrameRecorder(args.record, INTERFACES, args.record_size << 20, args.record_keep)
+            logging.info(f"Recording frames to {args.record} ({args.record_keep} x {args.record_size} MB)")
+        except OSError as e:
+            logging.error(f"Cannot record to {args.record}: {e}")
     logging.info("Global state initialized.") # Added log
 
     # --- Pre-populate light_device_states --- START
     logging.info("Pre-populating light states...") # Added log
-    # Iterate over the entity_id_lookup created during loading
-    for entity_id, config in entity_id_lookup.items():
-        # Check if this entity was identified as a light
-        if entity_id in light_entity_ids:
-            # Add placeholder state using the config from entity_id_lookup
-            with light_states_lock:
-                light_device_states[entity_id] = {
-                    'entity_id': entity_id,
-                    'friendly_name': config.get('friendly_name', entity_id),
-                    'suggested_area': config.get('suggested_area', 'Unknown'),
-                    'last_updated': 0,
-                    'last_interface': 'N/A',
-                    'last_raw_values': {},
-                    'last_decoded_data': {
-                        'state': 'OFF',        # start OFF
-                        'brightness': 0        # zero brightness
-                    },
-                    'mapping_config': config,
-                    # DGN/Instance might not be directly in this config if template was used,
-                    # but command info is in light_command_info. We can add them if needed for display.
-                    # 'dgn_hex': config.get('dgn'), # Example if needed
-                    # 'instance': config.get('instance'), # Example if needed
-                }
+    sync_light_states(config_snapshot)
     logging.info(f"Pre-populated {len(light_device_states)} light entities.") # Log count based on populated states
     # --- Pre-populate light_device_states --- END
 
@@ -1678,12 +3074,55 @@ if __name__ == '__main__':
     # Note: decoder_map check is implicitly true if we reached here
     logging.info("Starting CAN reader threads...") # Log before starting threads
     threads = []
-    for interface in INTERFACES:
-        thread = threading.Thread(target=reader_thread, args=(interface,), name=f"Reader-{interface}")
+    if replay_frames is not None:
+        # Replay stands in for the bus readers; nothing is opened, so commands are not sent
+        thread = threading.Thread(target=replay_reader, args=(replay_frames, INTERFACES, args.replay_speed), name="Replay")
+        thread.daemon = True
+        threads.append(thread)
+        thread.start()
+    elif args.reader == 'loop':
+        # One thread multiplexes every interface socket
+        thread = threading.Thread(target=event_loop_reader, args=(INTERFACES, args.backend), name="Reader")
         thread.daemon = True
         threads.append(thread)
         thread.start()
-        logging.info(f"Started reader thread for {interface}.") # Log after each thread start
+        logging.info(f"Started event-loop reader for {', '.join(INTERFACES)}.")
+    else:
+        for interface in INTERFACES:
+            thread = threading.Thread(target=reader_thread, args=(interface, args.backend), name=f"Reader-{interface}")
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+            logging.info(f"Started reader thread for {interface}.") # Log after each thread start
+
+    if not args.no_reload:
+        start_config_watcher(args.definitions, args.mapping)
+
+    if args.headless:
+        summary_out = open(args.summary_file, 'a') if args.summary_file else sys.stdout
+        readers_ended = False
+        try:
+            readers_ended = run_headless(INTERFACES, threads, max(0.1, args.summary_interval), summary_out,
+                                         args.summary_json, live=replay_frames is None)
+        finally:
+            logging.info("Requesting threads to stop...")
+            if config_watcher is not None:
+                config_watcher.stop()
+            stop_tx_queues()
+            stop_readers()
+            for t in threads:
+                t.join(timeout=1.0)
+            if frame_recorder is not None:
+                frame_recorder.close()
+                logging.info(f"Recorded {frame_recorder.recorded} frames to {args.record} ({frame_recorder.dropped} lost)")
+            if summary_out is not sys.stdout:
+                summary_out.close()
+            logging.info("Threads stopped. Exiting.")
+        if readers_ended and replay_frames is None:
+            # A live reader only ends by crashing; fail so systemd restarts the service
+            logging.error("All CAN readers stopped unexpectedly.")
+            sys.exit(1)
+        sys.exit(0)
 
     # --- Start Curses UI ---
     # REMOVE Add the ListLogHandler *just before* starting curses
@@ -1693,6 +3132,7 @@ if __name__ == '__main__':
     logging.info("Attempting to start curses UI...") # Log before curses
     # Remove the console handler *just before* starting curses
     logging.getLogger().removeHandler(console_handler)
+    import curses # Sets the module-level name the draw functions use
     try:
         # Pass the list_handler instance to curses.wrapper
         curses.wrapper(draw_screen, INTERFACES, list_handler) # Pass interfaces list and handler
@@ -1708,7 +3148,13 @@ if __name__ == '__main__':
         logging.info("Removing ListLogHandler...")
         logging.getLogger().removeHandler(list_handler)
         logging.info("Requesting threads to stop...")
-        stop_event.set()
+        if config_watcher is not None:
+            config_watcher.stop()
+        stop_tx_queues()
+        stop_readers()
         for t in threads:
             t.join(timeout=1.0) # Add a timeout to prevent hanging
+        if frame_recorder is not None:
+            frame_recorder.close()
+            logging.info(f"Recorded {frame_recorder.recorded} frames to {args.record} ({frame_recorder.dropped} lost)")
         logging.info("Threads stopped. Exiting.")
@@ -13,21 +13,75 @@ let
     pyperclip
   ]);
 
+  # The scripts with their bytecode compiled at build time. /etc/nixos/files is
+  # read-only, so Python would otherwise recompile every module on each start,
+  # and a script run as __main__ is never cached at all (~45 ms for
+  # rvc-console.py). The main scripts get a runnable .pyc next to them and the
+  # shared modules a __pycache__; unchecked-hash pycs are never checked against
+  # the source mtime, which the store resets anyway. This is the only copy the
+  # wrappers and the service run; nothing is deployed to /etc/nixos/files.
+  rvcScripts = pkgs.runCommand "rvc-scripts" { } ''
+    mkdir -p $out
+    cp ${./rvc-console.py} $out/rvc-console.py
+    cp ${./live_can_decoder.py} $out/live_can_decoder.py
+    # Decode engine shared by rvc-console.py and live_can_decoder.py
+    cp ${./rvc_decoder.py} $out/rvc_decoder.py
+    # Batched raw AF_CAN receive backend (--backend raw / --raw)
+    cp ${./rvc_socketcan.py} $out/rvc_socketcan.py
+    # mmap frame recorder (--record) and its candump-format reader
+    cp ${./rvc_recorder.py} $out/rvc_recorder.py
+    # Sampling profiler behind rvc-console's F key / SIGUSR1
+    cp ${./rvc_profiler.py} $out/rvc_profiler.py
+    # inotify watcher behind rvc-console's spec/mapping hot reload
+    cp ${./rvc_watch.py} $out/rvc_watch.py
+    # TP.CM/TP.DT multi-packet reassembly in front of rvc-console's decoder
+    cp ${./rvc_transport.py} $out/rvc_transport.py
+    # Per-interface transmit queue behind rvc-console's light commands
+    cp ${./rvc_tx.py} $out/rvc_tx.py
+    ${consolePythonEnv}/bin/python -m compileall -q --invalidation-mode unchecked-hash $out
+    ${consolePythonEnv}/bin/python - <<'EOF'
+    import os, py_compile
+    out = os.environ['out']
+    for name in ('rvc-console', 'live_can_decoder'):
+        py_compile.compile(f'{out}/{name}.py', cfile=f'{out}/{name}.pyc', doraise=True,
+                           invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+    EOF
+  '';
+
+  # The headless service starts once its CAN links exist and stops with them;
+  # a link that is down is retried by the reader
+  headlessCanDevices = map (i: "sys-subsystem-net-devices-${i}.device") config.services.rvc.headless.interfaces;
+
 in
 {
   options.services.rvc = {
     console.enable = lib.mkEnableOption "Enable the RVC Console application";
     debugTools.enable = lib.mkEnableOption "Enable RVC CANbus debugging tools";
+    headless = {
+      enable = lib.mkEnableOption "Run rvc-console without its UI as a systemd service (--headless)";
+      interfaces = lib.mkOption {
+        type = lib.types.listOf lib.types.str;
+        default = [ "can0" "can1" ];
+        description = "CAN interfaces the headless console reads.";
+      };
+      extraArgs = lib.mkOption {
+        type = lib.types.listOf lib.types.str;
+        default = [ ];
+        example = [ "--summary-interval" "60" "--record" "/var/lib/rvc-console/rvc.rec" ];
+        description = "Additional rvc-console.py arguments.";
+      };
+    };
   };
 
   # No need to define rvc2api options here - they're defined in the proper rvc2api NixOS module
 
   config = lib.mkMerge [
     # --- Shared Config Deployment (rvc-config.nix content) ---
-    (lib.mkIf (config.services.rvc.console.enable || config.services.rvc.debugTools.enable) {
+    (lib.mkIf (config.services.rvc.console.enable || config.services.rvc.debugTools.enable || config.services.rvc.headless.enable) {
       environment.etc."nixos/files/rvc.json".source = ../config/rvc/rvc.json;
       # Ensure the destination file is device_mapping.yml, matching the source and other references
       environment.etc."nixos/files/device_mapping.yml".source = ../config/rvc/device_mapping.yml;
+      # The scripts themselves run from rvcScripts
     })
 
     # --- Console Configuration (rvc-console.nix content) ---
@@ -36,7 +90,7 @@ in
         (pkgs.writeShellScriptBin "rvc-console" ''
           #!${pkgs.runtimeShell}
           set -euo pipefail
-          SCRIPT_PATH="/etc/nixos/files/rvc-console.py"
+          SCRIPT_PATH="${rvcScripts}/rvc-console.pyc"
           RVC_SPEC="/etc/nixos/files/rvc.json"
           # Updated to use .yml extension for consistency
           DEVICE_MAP="/etc/nixos/files/device_mapping.yml"
@@ -46,7 +100,32 @@ in
           exec "${consolePythonEnv}/bin/python" "$SCRIPT_PATH" "$@"
         '')
       ];
-      environment.etc."nixos/files/rvc-console.py".source = ./rvc-console.py;
+    })
+
+    # --- Headless Console Service ---
+    (lib.mkIf config.services.rvc.headless.enable {
+      systemd.services.rvc-console-headless = {
+        description = "RV-C console (headless)";
+        wantedBy = [ "multi-user.target" ];
+        bindsTo = headlessCanDevices;
+        after = [ "network.target" ] ++ headlessCanDevices;
+        serviceConfig = {
+          # Summaries go to stdout and logs to stderr, both end up in the journal
+          ExecStart = lib.escapeShellArgs ([
+            "${consolePythonEnv}/bin/python" "${rvcScripts}/rvc-console.pyc" "--headless"
+            "-d" "/etc/nixos/files/rvc.json" "-m" "/etc/nixos/files/device_mapping.yml"
+            "--profile-dir" "/var/lib/rvc-console"
+            "-i" ] ++ config.services.rvc.headless.interfaces ++ config.services.rvc.headless.extraArgs);
+          # Exits non-zero if every reader dies
+          Restart = "on-failure";
+          RestartSec = 5;
+          # Reading CAN_RAW sockets needs no privileges
+          DynamicUser = true;
+          StateDirectory = "rvc-console";
+          CacheDirectory = "rvc-console"; # Processed spec/mapping tables ($XDG_CACHE_HOME/rvc-console)
+          Environment = [ "PYTHONUNBUFFERED=1" "XDG_CACHE_HOME=/var/cache" ];
+        };
+      };
     })
 
     # --- Debug Tools Configuration (rvc-debug-tools.nix content) ---
@@ -59,11 +138,20 @@ in
           set -euo pipefail
           INTERFACE=''${1:-can0}
           JSON_PATH=''${2:-/etc/nixos/files/rvc.json}
-          SCRIPT="/etc/nixos/files/live_can_decoder.py"
+          SCRIPT="${rvcScripts}/live_can_decoder.pyc"
+          # Anything after the interface and JSON path (e.g. --raw) goes to the decoder
+          shift $(( $# < 2 ? $# : 2 ))
           if [ ! -f "$JSON_PATH" ]; then echo "❌ JSON file not found at $JSON_PATH"; exit 1; fi
           if [ ! -f "$SCRIPT" ]; then echo "❌ Python script not found at $SCRIPT"; exit 1; fi
           echo "▶️ Running decoder on interface $INTERFACE with JSON defs $JSON_PATH"
-          "${debugPythonEnv}/bin/python" "$SCRIPT" --interface "$INTERFACE" --json "$JSON_PATH"
+          exec "${debugPythonEnv}/bin/python" "$SCRIPT" --interface "$INTERFACE" --json "$JSON_PATH" "$@"
+        '')
+        (pkgs.writeShellScriptBin "rvc-rec-dump" ''
+          #!/usr/bin/env bash
+          set -euo pipefail
+          # Print a --record recording (all rotated segments) as candump -L lines
+          if [ $# -lt 1 ]; then echo "Usage: rvc-rec-dump RECORDING..." >&2; exit 1; fi
+          exec "${debugPythonEnv}/bin/python" ${rvcScripts}/rvc_recorder.py "$@"
         '')
         (pkgs.writeShellScriptBin "rvc-json-validate" ''
           #!/usr/bin/env bash
@@ -74,8 +162,6 @@ in
           if jq empty "$JSON_PATH"; then echo "✅ JSON syntax is valid."; else echo "❌ JSON syntax error in $JSON_PATH"; exit 1; fi
         '')
       ];
-      # Deploy the live decoder script needed by rvc-can-test
-      environment.etc."nixos/files/live_can_decoder.py".source = ./live_can_decoder.py;
     })
     # Note: rvc2api service is now fully managed by the rvc2api NixOS module
     # Additional customizations can be done in the main configuration
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Shared RV-C decode engine used by rvc-console.py and live_can_decoder.py."""
+
+# --- Compiled Message Decoders ---
+class MessageDecoder:
+    """ A spec entry from rvc.json compiled once into shift/mask tuples.
+
+    Signals are split by how they are formatted (plain, scaled, enum) so the
+    per-frame path never re-reads scale/offset/unit/enum from the spec dicts,
+    and the payload is converted to an integer exactly once per frame.
+    """
+    __slots__ = ('spec', 'name', '_names', '_plain', '_scaled', '_enum', '_values')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.get('name', '')
+        names = []
+        plain = []   # (name, shift, mask, unit_suffix)
+        scaled = []  # (name, shift, mask, scale, offset, unit_suffix)
+        enum = []    # (name, shift, mask, enum_map)
+        values = []  # (name, shift, mask, scale, offset) for numeric values
+        for sig in spec.get('signals', []):
+            name = sig['name']
+            shift = sig['start_bit']
+            mask = (1 << sig['length']) - 1
+            # Treat explicit nulls in rvc.json the same as a missing key
+            scale = sig.get('scale')
+            scale = 1 if scale is None else scale
+            offset = sig.get('offset')
+            offset = 0 if offset is None else offset
+            unit = f"{sig.get('unit', '')}"
+            names.append(name)
+            values.append((name, shift, mask, scale, offset))
+            if 'enum' in sig:
+                enum.append((name, shift, mask, sig['enum']))
+            elif scale != 1 or offset != 0 or isinstance(scale, float) or isinstance(offset, float):
+                scaled.append((name, shift, mask, scale, offset, unit))
+            else:
+                plain.append((name, shift, mask, unit))
+        self._names = tuple(names)
+        self._plain = tuple(plain)
+        self._scaled = tuple(scaled)
+        self._enum = tuple(enum)
+        self._values = tuple(values)
+
+    def decode(self, data_bytes):
+        """Return (formatted, raw_values) dicts, keyed in spec signal order."""
+        raw_int = int.from_bytes(data_bytes, byteorder='little')
+        # Pre-seed keys so the three passes below keep the spec's signal order
+        decoded = dict.fromkeys(self._names)
+        raw_values = dict.fromkeys(self._names)
+        for name, shift, mask, unit in self._plain:
+            raw = (raw_int >> shift) & mask
+            raw_values[name] = raw
+            decoded[name] = f"{raw}{unit}"
+        for name, shift, mask, scale, offset, unit in self._scaled:
+            raw = (raw_int >> shift) & mask
+            raw_values[name] = raw
+            decoded[name] = f"{raw * scale + offset:.2f}{unit}"
+        for name, shift, mask, enum_map in self._enum:
+            raw = (raw_int >> shift) & mask
+            raw_values[name] = raw
+            decoded[name] = enum_map.get(str(raw), f"UNKNOWN ({raw})")
+        return decoded, raw_values
+
+    def values(self, data_bytes):
+        """Return {signal: raw * scale + offset} without any string formatting."""
+        raw_int = int.from_bytes(data_bytes, byteorder='little')
+        return {name: ((raw_int >> shift) & mask) * scale + offset
+                for name, shift, mask, scale, offset in self._values}
+
+# --- Message Index ---
+def pgn_of(can_id):
+    """Full 18-bit PGN (DP+PF+PS) of a 29-bit identifier, matching 'dgn_hex'."""
+    return (can_id >> 8) & 0x3FFFF
+
+class DecoderIndex:
+    """ Exact-ID, then PGN lookup from a 29-bit CAN ID to a MessageDecoder.
+
+    The exact-ID table is tried first. Frames whose priority or source
+    address differ from every spec entry fall back to the (PGN, SA) table and
+    then to the PGN table, so one definition decodes every node sending that
+    DGN. All three levels are plain dict lookups.
+    """
+    __slots__ = ('by_id', 'by_pgn_sa', 'by_pgn')
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_pgn_sa = {}
+        self.by_pgn = {}
+
+    def add(self, can_id, decoder):
+        self.by_id[can_id] = decoder
+        pgn = pgn_of(can_id)
+        self.by_pgn_sa.setdefault((pgn, can_id & 0xFF), decoder)
+        # Prefer a named definition over an UNKNOWN_* placeholder for the PGN fallback
+        current = self.by_pgn.get(pgn)
+        if current is None or (current.name.startswith('UNKNOWN') and not decoder.name.startswith('UNKNOWN')):
+            self.by_pgn[pgn] = decoder
+
+    def lookup(self, can_id):
+        """Return (decoder, exact); decoder is None if the PGN is unknown."""
+        decoder = self.by_id.get(can_id)
+        if decoder is not None:
+            return decoder, True
+        pgn = (can_id >> 8) & 0x3FFFF
+        decoder = self.by_pgn_sa.get((pgn, can_id & 0xFF)) or self.by_pgn.get(pgn)
+        return decoder, False
+
+    def get(self, can_id, default=None):
+        """Exact-ID lookup only, for callers that want the old dict behaviour."""
+        return self.by_id.get(can_id, default)
+
+    def __len__(self):
+        return len(self.by_id)
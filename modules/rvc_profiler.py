@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""On-demand sampling profiler for rvc-console.py's reader and UI threads.
+
+Started from the console ('F' key or SIGUSR1) for a fixed window. A single
+background thread samples the Python stacks of every other thread with
+sys._current_frames() at a fixed interval, so nothing is hooked into the
+profiled code and there is no cost at all while it is stopped.
+
+When the window ends it writes two files:
+  - PREFIX.folded: collapsed stacks ("thread;outer;...;inner count"), for
+    flamegraph.pl, speedscope or inferno.
+  - PREFIX.pstats: the same samples in marshal'd pstats form for
+    `python3 -m pstats` or snakeviz. Times are sample counts x interval and
+    call counts are sample counts.
+"""
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+class SamplingProfiler:
+    """ Samples all other threads' stacks for `duration` seconds, then writes and summarises them. """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration, prefix, on_done):
+        """
+        Starts sampling in a background thread. After duration seconds (or stop())
+        the results are written to prefix.folded / prefix.pstats and
+        on_done(report_lines) is called from the profiler thread.
+        """
+        if self.running:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration, prefix, on_done), name="Profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Ends the current window early; results are still written."""
+        self._stop.set()
+
+    def _run(self, duration, prefix, on_done):
+        me = threading.get_ident()
+        stacks = Counter() # (thread name, (code key, ...) outermost first) -> samples
+        samples = 0
+        start = time.monotonic()
+        end = start + duration
+        interval = self.interval
+        while not self._stop.wait(interval) and time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stacks[(names.get(ident, str(ident)), tuple(reversed(stack)))] += 1
+            samples += 1
+        elapsed = time.monotonic() - start
+        try:
+            write_folded(stacks, f"{prefix}.folded")
+            write_pstats(stacks, interval, f"{prefix}.pstats")
+            report = summarize(stacks, samples, elapsed, prefix)
+        except OSError as e:
+            report = [f"Profiler: could not write {prefix}.*: {e}"]
+        on_done(report)
+
+# --- Output ---
+def _label(key):
+    filename, lineno, name = key
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+def write_folded(stacks, path):
+    with open(path, 'w') as f:
+        for (thread, stack), count in stacks.items():
+            f.write(";".join([thread.replace(';', ':')] + [_label(k).replace(';', ':') for k in stack]) + f" {count}\n")
+
+def write_pstats(stacks, interval, path):
+    """Writes samples as a pstats dump: {func: (cc, nc, tt, ct, {caller: count})}."""
+    stats = {}
+    for (_, stack), count in stacks.items():
+        if not stack:
+            continue
+        for func in set(stack): # Recursive frames count once per sample
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            entry[0] += count
+            entry[1] += count
+            entry[3] += count * interval
+        stats[stack[-1]][2] += count * interval
+        for caller, callee in zip(stack, stack[1:]):
+            callers = stats[callee][4]
+            callers[caller] = callers.get(caller, 0) + count
+    with open(path, 'wb') as f:
+        marshal.dump({func: tuple(entry) for func, entry in stats.items()}, f)
+
+def summarize(stacks, samples, elapsed, prefix, top=10):
+    """Report lines: where the samples went per thread, and the top functions by self time."""
+    per_thread = Counter()
+    self_counts = Counter()
+    total_counts = Counter()
+    for (thread, stack), count in stacks.items():
+        per_thread[thread] += count
+        if stack:
+            self_counts[stack[-1]] += count
+        for func in set(stack):
+            total_counts[func] += count
+    total = sum(per_thread.values()) or 1
+    lines = [f"Profile: {samples} samples over {elapsed:.1f}s -> {prefix}.folded / .pstats",
+             "Profile threads: " + ", ".join(f"{t} {n * 100 / total:.0f}%" for t, n in per_thread.most_common())]
+    for func, count in self_counts.most_common(top):
+        lines.append(f"Profile {count * 100 / total:5.1f}% self {total_counts[func] * 100 / total:5.1f}% total  {_label(func)}")
+    return lines
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Compact binary CAN frame recorder writing through memory-mapped segment files.
+
+Used by rvc-console.py and live_can_decoder.py (--record PATH). Each received
+frame becomes one fixed 24-byte record (timestamp, interface, id, dlc, data)
+packed straight into a memory-mapped segment, with no write() per frame. When
+the active segment is full the reader switches to a spare segment prepared in
+the background, and a helper thread flushes the full one and rotates it to
+PATH.1, PATH.2, ... keeping `keep` segments in total, so disk use is bounded.
+If no spare is ready yet the frame is counted as dropped rather than waited on.
+
+Run this file directly to print a recording in candump -L format:
+
+    python3 rvc_recorder.py /var/tmp/rvc.rec > capture.log
+"""
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+
+MAGIC = b'RVCREC01'
+HEADER_SIZE = 256
+MAX_INTERFACES = 8
+# Header: magic, record size, capacity, records written, interface names (16 bytes each, NUL padded)
+_header = struct.Struct(f'<8sHxxII{MAX_INTERFACES * 16}s')
+_count = struct.Struct('<I')
+COUNT_OFFSET = 16
+NAMES_OFFSET = 20
+# Record: f64 timestamp, u32 can_id (bit 31 = extended), u8 interface index, u8 dlc, 2 pad, 8 data bytes
+_record_head = struct.Struct('<dIBBxx')
+RECORD_SIZE = 24
+RECORD_DATA_OFFSET = 16
+CAN_EFF_FLAG = 0x80000000
+
+def _pack_name(name):
+    return name.encode()[:16].ljust(16, b'\0')
+
+class _Segment:
+    """ One mmap'd segment file and the number of records written to it. """
+    __slots__ = ('path', 'file', 'mm', 'count')
+
+    def __init__(self, path, size, capacity, interfaces):
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.file.truncate(size) # Sparse and zero-filled until written
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.count = 0
+        _header.pack_into(self.mm, 0, MAGIC, RECORD_SIZE, capacity, 0, b''.join(map(_pack_name, interfaces)))
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
+
+class FrameRecorder:
+    """ Records frames into a rotating set of memory-mapped segment files at `path`.
+
+    record() only packs into the mapped buffer under an uncontended lock, so it
+    is safe to call from the reader (or several reader threads); creating,
+    flushing and renaming files all happen on the recorder's own thread.
+    """
+    def __init__(self, path, interfaces=(), segment_size=16 << 20, keep=4):
+        self.path = path
+        self.keep = max(1, keep)
+        self.segment_size = max(HEADER_SIZE + RECORD_SIZE, segment_size)
+        self.capacity = (self.segment_size - HEADER_SIZE) // RECORD_SIZE
+        self.interfaces = list(interfaces)[:MAX_INTERFACES]
+        self.iface_index = {name: i for i, name in enumerate(self.interfaces)}
+        self.recorded = 0
+        self.dropped = 0 # Frames lost because no spare segment was ready, or too many interfaces
+        self._lock = threading.Lock()
+        self._active = _Segment(path, self.segment_size, self.capacity, self.interfaces)
+        self._spare = None
+        self._jobs = queue.Queue() # Full segments to finish; None just prepares a spare, False stops
+        self._thread = threading.Thread(target=self._rotator, name="Recorder", daemon=True)
+        self._thread.start()
+        self._jobs.put(None)
+
+    def record(self, ts, interface, can_id, extended, data):
+        """Appends one frame; extended marks a 29-bit ID, data is any bytes-like object of up to 8 bytes."""
+        index = self.iface_index.get(interface)
+        if index is None:
+            index = self._add_interface(interface)
+            if index is None:
+                self.dropped += 1
+                return
+        if extended:
+            can_id |= CAN_EFF_FLAG
+        dlc = min(len(data), 8)
+        with self._lock:
+            seg = self._active
+            if seg is None: # Closed
+                self.dropped += 1
+                return
+            if seg.count >= self.capacity:
+                if self._spare is None:
+                    self.dropped += 1 # Rotation still catching up; never wait for it here
+                    return
+                self._active, self._spare = self._spare, None
+                self._jobs.put(seg)
+                seg = self._active
+            off = HEADER_SIZE + seg.count * RECORD_SIZE
+            _record_head.pack_into(seg.mm, off, ts, can_id, index, dlc)
+            seg.mm[off + RECORD_DATA_OFFSET:off + RECORD_DATA_OFFSET + dlc] = data[:dlc]
+            seg.count += 1
+            _count.pack_into(seg.mm, COUNT_OFFSET, seg.count) # Published after the record itself
+            self.recorded += 1
+
+    def _add_interface(self, interface):
+        """Registers an interface not given up front; returns its index or None if the table is full."""
+        with self._lock:
+            if interface in self.iface_index:
+                return self.iface_index[interface]
+            if len(self.interfaces) >= MAX_INTERFACES:
+                return None
+            index = len(self.interfaces)
+            self.interfaces.append(interface)
+            self.iface_index[interface] = index
+            off = NAMES_OFFSET + index * 16
+            for seg in (self._active, self._spare):
+                if seg is not None:
+                    seg.mm[off:off + 16] = _pack_name(interface)
+            return index
+
+    def _rotator(self):
+        """Finishes full segments and prepares the next spare, off the reader's path."""
+        while True:
+            full = self._jobs.get()
+            if full is False:
+                return
+            if full is not None:
+                full.close()
+                self._rotate_files(full.path)
+            try:
+                spare = _Segment(f"{self.path}.next", self.segment_size, self.capacity, self.interfaces)
+            except OSError as e:
+                print(f"rvc_recorder: cannot prepare next segment: {e}", file=sys.stderr)
+                continue # Frames are dropped until the next rotation retries
+            with self._lock:
+                self._spare = spare
+
+    def _rotate_files(self, full_path):
+        """Moves the full segment to PATH.1, shifting older ones up and deleting the oldest."""
+        if self.keep == 1:
+            os.remove(full_path)
+        else:
+            oldest = f"{self.path}.{self.keep - 1}"
+            if os.path.exists(oldest):
+                os.remove(oldest)
+            for n in range(self.keep - 2, 0, -1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            os.replace(full_path, f"{self.path}.1")
+        # The segment now being written was created as PATH.next; give it the live name
+        with self._lock:
+            active = self._active
+        if active is not None and active.path != self.path:
+            os.replace(active.path, self.path)
+            active.path = self.path
+
+    def close(self):
+        """Finishes pending rotations, flushes the active segment and stops the recorder thread."""
+        self._jobs.put(False)
+        self._thread.join(timeout=5)
+        with self._lock:
+            active, spare = self._active, self._spare
+            self._active = self._spare = None
+        if active is not None:
+            active.close()
+        if spare is not None:
+            spare.close()
+            os.remove(spare.path)
+
+# --- Reading Recordings ---
+def segment_paths(path):
+    """The segment files of a recording at path, oldest first."""
+    rotated = []
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        rotated.append(f"{path}.{n}")
+        n += 1
+    paths = rotated[::-1]
+    if os.path.exists(path):
+        paths.append(path)
+    return paths
+
+def iter_segment(path):
+    """
+    Yields (timestamp, interface, can_id, extended, data) for every record in one
+    segment file. data is a memoryview into the mapped file, only valid until the
+    generator moves on; copy it with bytes() to keep it.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        magic, record_size, _, count, names = _header.unpack_from(view, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            raise ValueError(f"{path}: not an RV-C frame recording")
+        interfaces = [n.rstrip(b'\0').decode() for n, in struct.iter_unpack('16s', names)]
+        count = min(count, (len(view) - HEADER_SIZE) // RECORD_SIZE)
+        for off in range(HEADER_SIZE, HEADER_SIZE + count * RECORD_SIZE, RECORD_SIZE):
+            ts, can_id, index, dlc = _record_head.unpack_from(view, off)
+            data = view[off + RECORD_DATA_OFFSET:off + RECORD_DATA_OFFSET + dlc]
+            yield ts, interfaces[index], can_id & 0x1FFFFFFF, bool(can_id & CAN_EFF_FLAG), data
+            data.release()
+    finally:
+        view.release()
+        try:
+            mm.close()
+        except BufferError:
+            pass # A caller still holds a record's view; the map is freed with it
+
+def iter_frames(path):
+    """Yields every record of a recording across its rotated segments, oldest first."""
+    for segment in segment_paths(path):
+        yield from iter_segment(segment)
+
+def _dump(paths):
+    """Prints recordings in candump -L format."""
+    write = sys.stdout.write
+    for path in paths:
+        for ts, interface, can_id, extended, data in iter_frames(path):
+            ident = f"{can_id:08X}" if extended else f"{can_id:03X}"
+            write(f"({ts:.6f}) {interface} {ident}#{data.hex().upper()}\n")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: {sys.argv[0]} RECORDING...")
+    try:
+        _dump(sys.argv[1:])
+    except BrokenPipeError:
+        pass
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Raw AF_CAN socket backend that receives many frames per syscall.
+
+Used by rvc-console.py (--backend raw) and live_can_decoder.py (--raw) in
+place of python-can's Bus.recv(): frames are read with recvmmsg(2) into one
+reusable buffer and handed on as (timestamp, can_id, extended, data) tuples,
+where data is a memoryview into that buffer. No can.Message objects are created.
+
+Run this file directly to loop frames through an interface as a self-test:
+
+    python3 rvc_socketcan.py vcan0
+"""
+import ctypes
+import errno
+import select
+import socket
+import struct
+import sys
+import time
+
+# struct can_frame: u32 can_id, u8 len, 3 pad/reserved bytes, u8 data[8]
+CAN_FRAME_SIZE = 16
+CAN_DATA_OFFSET = 8
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x000007FF
+_frame_header = struct.Struct('=IB')
+_frame = struct.Struct('=IB3x8s')
+_filter = struct.Struct('=II') # struct can_filter: can_id, can_mask
+SOL_CAN_RAW = getattr(socket, 'SOL_CAN_RAW', 101)
+CAN_RAW_FILTER = getattr(socket, 'CAN_RAW_FILTER', 1)
+PGN_ID_MASK = 0x3FFFF << 8 # DP+PF+PS bits of a 29-bit ID, matching 'dgn_hex'
+PF_ID_MASK = 0x1FF << 16 # DP+PF bits only: any destination (PS) and source
+
+# --- recvmmsg(2) via ctypes ---
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IoVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+def _load_recvmmsg():
+    # The interpreter is already linked against libc, so look there first;
+    # ctypes.util.find_library() runs ldconfig/gcc and costs ~20 ms at startup.
+    try:
+        fn = ctypes.CDLL(None, use_errno=True).recvmmsg
+    except (OSError, AttributeError):
+        try:
+            from ctypes.util import find_library
+            fn = ctypes.CDLL(find_library('c'), use_errno=True).recvmmsg
+        except (OSError, AttributeError, TypeError):
+            return None # Not Linux/glibc; fall back to recv_into() per frame
+    fn.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    fn.restype = ctypes.c_int
+    return fn
+
+_recvmmsg = None
+_recvmmsg_loaded = False
+
+def _get_recvmmsg():
+    """recvmmsg() from libc, looked up on first use so importing this module stays cheap."""
+    global _recvmmsg, _recvmmsg_loaded
+    if not _recvmmsg_loaded:
+        _recvmmsg = _load_recvmmsg()
+        _recvmmsg_loaded = True
+    return _recvmmsg
+
+class RawFrame:
+    """ The can.Message fields RawCanBus.send() reads, so sending never needs python-can. """
+    __slots__ = ('arbitration_id', 'data', 'is_extended_id')
+
+    def __init__(self, arbitration_id, data, is_extended_id=True):
+        self.arbitration_id = arbitration_id
+        self.data = data
+        self.is_extended_id = is_extended_id
+
+class RawCanBus:
+    """ A raw CAN_RAW socket with batched receive into a reusable buffer.
+
+    Also implements send(msg), shutdown(), fileno() and channel_info so it can
+    stand in for a python-can Bus in active_buses when sending commands.
+    """
+    def __init__(self, interface, batch_size=64):
+        self.channel_info = interface
+        self.batch_size = batch_size
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        self.sock.bind((interface,))
+        self.sock.setblocking(False)
+        self._recvmmsg = _get_recvmmsg()
+        # One preallocated buffer holds a whole batch of can_frame structs
+        self._buf = (ctypes.c_char * (batch_size * CAN_FRAME_SIZE))()
+        self._view = memoryview(self._buf).cast('B')
+        self._iov = (_IoVec * batch_size)()
+        self._msgs = (_MMsgHdr * batch_size)()
+        base = ctypes.addressof(self._buf)
+        for i in range(batch_size):
+            self._iov[i].iov_base = base + i * CAN_FRAME_SIZE
+            self._iov[i].iov_len = CAN_FRAME_SIZE
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iov[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _fill(self):
+        """Reads up to batch_size frames into the buffer; returns how many."""
+        if self._recvmmsg is not None:
+            n = self._recvmmsg(self.sock.fileno(), self._msgs, self.batch_size, socket.MSG_DONTWAIT, None)
+            if n < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return 0
+                raise OSError(err, f"recvmmsg on {self.channel_info}: {errno.errorcode.get(err, err)}")
+            return n
+        n = 0
+        while n < self.batch_size:
+            try:
+                self.sock.recv_into(self._view[n * CAN_FRAME_SIZE:(n + 1) * CAN_FRAME_SIZE], CAN_FRAME_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            n += 1
+        return n
+
+    def recv_batch(self, timeout=0):
+        """
+        Returns a list of (timestamp, can_id, extended, data) tuples, empty if nothing arrived
+        within timeout seconds (None blocks). data views the shared buffer and is only
+        valid until the next call; copy it with bytes() to keep it. All frames in a
+        batch share one receive timestamp.
+        """
+        if timeout != 0:
+            ready, _, _ = select.select([self.sock], [], [], timeout)
+            if not ready:
+                return []
+        n = self._fill()
+        if not n:
+            return []
+        now = time.time()
+        view = self._view
+        frames = []
+        for off in range(0, n * CAN_FRAME_SIZE, CAN_FRAME_SIZE):
+            can_id, dlc = _frame_header.unpack_from(view, off)
+            if can_id & (CAN_RTR_FLAG | CAN_ERR_FLAG):
+                continue # Remote and error frames carry no signal data
+            # The EFF flag is the only reliable way to tell the formats apart: 29-bit IDs can be <= 0x7FF too
+            extended = bool(can_id & CAN_EFF_FLAG)
+            can_id &= CAN_EFF_MASK if extended else CAN_SFF_MASK
+            frames.append((now, can_id, extended, view[off + CAN_DATA_OFFSET:off + CAN_DATA_OFFSET + min(dlc, 8)]))
+        return frames
+
+    def send(self, msg, timeout=None):
+        """Sends a can.Message-like object (arbitration_id, data, is_extended_id)."""
+        can_id = msg.arbitration_id
+        if getattr(msg, 'is_extended_id', True):
+            can_id |= CAN_EFF_FLAG
+        data = bytes(msg.data)
+        self.sock.send(_frame.pack(can_id, len(data), data))
+
+    def set_filters(self, filters=None):
+        """Installs python-can style filter dicts as a kernel CAN_RAW_FILTER; None receives everything."""
+        if filters is None:
+            filters = [{'can_id': 0, 'can_mask': 0}]
+        packed = b''.join(_filter.pack(*_kernel_filter(f)) for f in filters)
+        self.sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, packed)
+
+    def shutdown(self):
+        self.sock.close()
+
+# --- Kernel Filters ---
+def _kernel_filter(f):
+    """Applies the 'extended' key the same way python-can's socketcan backend does."""
+    can_id, can_mask = f['can_id'], f['can_mask']
+    if 'extended' in f:
+        can_mask |= CAN_EFF_FLAG
+        if f['extended']:
+            can_id |= CAN_EFF_FLAG
+    return can_id, can_mask
+
+def compact_filters(pairs):
+    """
+    Merges (can_id, can_mask) pairs that differ in exactly one masked bit into one
+    pair with that bit cleared from the mask, until no more merges apply. The
+    result accepts exactly the same set of IDs with fewer kernel filter entries.
+    """
+    current = {(can_id & can_mask, can_mask) for can_id, can_mask in pairs}
+    while True:
+        merged = set()
+        used = set()
+        for can_id, can_mask in sorted(current):
+            if (can_id, can_mask) in used:
+                continue
+            bit = 1
+            while bit <= can_mask:
+                partner = (can_id ^ bit, can_mask)
+                if can_mask & bit and partner in current and partner not in used:
+                    used.add((can_id, can_mask))
+                    used.add(partner)
+                    merged.add((can_id & ~bit, can_mask & ~bit))
+                    break
+                bit <<= 1
+        if not merged:
+            return sorted(current)
+        current = (current - used) | merged
+
+def pgn_filters(pgns):
+    """Returns compact python-can filter dicts accepting extended frames of the given PGNs from any priority/SA."""
+    pairs = compact_filters((pgn << 8, PGN_ID_MASK) for pgn in pgns)
+    return [{'can_id': can_id, 'can_mask': can_mask, 'extended': True} for can_id, can_mask in pairs]
+
+def pf_filters(pfs):
+    """Python-can filter dicts accepting extended frames with the given PDU formats (DP 0), whatever their PS and SA."""
+    return [{'can_id': pf << 16, 'can_mask': PF_ID_MASK, 'extended': True} for pf in sorted(pfs)]
+
+def interface_statistic(interface, name):
+    """One counter from /sys/class/net/<interface>/statistics (e.g. rx_errors), or None if unavailable."""
+    try:
+        with open(f"/sys/class/net/{interface}/statistics/{name}") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+def interface_rx_packets(interface):
+    """Frames the interface has received in total (from sysfs), or None if unavailable."""
+    return interface_statistic(interface, 'rx_packets')
+
+# --- Self-test ---
+def _self_test(interface, count=10000):
+    """Loops frames through interface with two raw sockets and checks they arrive intact."""
+    tx = RawCanBus(interface)
+    rx = RawCanBus(interface)
+    received = 0
+    mismatches = 0
+    start = time.perf_counter()
+    for i in range(count):
+        can_id = 0x19FEDA00 | (i & 0xFF)
+        payload = i.to_bytes(4, 'little') * 2
+        while True:
+            try:
+                tx.send(RawFrame(can_id, payload))
+                break
+            except OSError: # TX queue full; drain the receiver and retry
+                for _, rid, _, data in rx.recv_batch():
+                    mismatches += (rid & 0xFF) != (int.from_bytes(data[:4], 'little') & 0xFF)
+                    received += 1
+    while received < count:
+        frames = rx.recv_batch(timeout=1.0)
+        if not frames:
+            break
+        for _, rid, _, data in frames:
+            mismatches += (rid & 0xFF) != (int.from_bytes(data[:4], 'little') & 0xFF)
+            received += 1
+    elapsed = time.perf_counter() - start
+    tx.shutdown()
+    rx.shutdown()
+    print(f"{interface}: sent {count}, received {received}, mismatches {mismatches}, "
+          f"{received / elapsed:.0f} frames/s (recvmmsg={'yes' if rx._recvmmsg else 'no'})")
+    return received == count and mismatches == 0
+
+if __name__ == '__main__':
+    sys.exit(0 if _self_test(sys.argv[1] if len(sys.argv) > 1 else 'vcan0') else 1)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""J1939 multi-packet transport (TP.CM / TP.DT) reassembly for RV-C.
+
+DGNs longer than 8 bytes (product identification, long DM_RV lists) are
+sent with the J1939-21 transport protocol: a connection management frame
+(TP.CM, PF 0xEC) announces the size and the DGN, then numbered data frames
+(TP.DT, PF 0xEB) carry 7 bytes each. Broadcasts use BAM; addressed
+transfers use RTS/CTS, where the receiver paces the sender with CTS and we
+only listen in on both sides.
+
+TransportReassembler tracks one session per (source, destination) on one
+interface, in buffers from a pool allocated up front, so a bus full of
+transfers cannot grow memory: when the pool is empty a new session is
+refused and counted. Sessions that stall are dropped after the J1939
+timeouts. Used by rvc-console.py in front of its decode path.
+"""
+
+TP_CM_PF = 0xEC
+TP_DT_PF = 0xEB
+TP_PFS = frozenset((TP_CM_PF, TP_DT_PF)) # Matched against (can_id >> 16) & 0x1FF, so DP must be 0
+CM_RTS = 16
+CM_CTS = 17
+CM_EOM_ACK = 19
+CM_BAM = 32
+CM_ABORT = 255
+MAX_PACKETS = 255
+MAX_SIZE = MAX_PACKETS * 7 # 1785 bytes
+BAM_TIMEOUT = 0.75 # T1: longest gap between BAM data packets
+RTS_TIMEOUT = 1.25 # T2/T3: longest wait for data after a CTS, or for a CTS after data
+EXPIRY_INTERVAL = 0.25 # Seconds between sweeps for stalled sessions
+STAT_NAMES = ('started', 'completed', 'aborted', 'timed_out', 'no_memory', 'invalid')
+_ZEROS = bytes(MAX_PACKETS + 1)
+
+class _Session:
+    """ One transfer in progress; the buffers are reused by later sessions. """
+    __slots__ = ('buffer', 'seen', 'pgn', 'priority', 'size', 'packets', 'received', 'bam', 'deadline')
+
+    def __init__(self):
+        self.buffer = bytearray(MAX_SIZE)
+        self.seen = bytearray(MAX_PACKETS + 1) # 1 per sequence number received, so repeats count once
+
+    def start(self, pgn, priority, size, packets, bam, deadline):
+        self.pgn = pgn
+        self.priority = priority
+        self.size = size
+        self.packets = packets
+        self.received = 0
+        self.bam = bam
+        self.deadline = deadline
+        self.seen[:packets + 1] = _ZEROS[:packets + 1]
+
+class TransportReassembler:
+    """ Reassembles BAM and RTS/CTS transfers seen on one interface.
+
+    feed() takes every TP.CM/TP.DT frame and returns (can_id, payload) when a
+    transfer completes, with can_id rebuilt from the announced DGN, priority
+    and sender so the payload decodes like a single frame. Not thread-safe:
+    use one per interface, fed by that interface's reader.
+    """
+    def __init__(self, max_sessions=32):
+        self.max_sessions = max_sessions
+        self._free = [_Session() for _ in range(max_sessions)]
+        self._sessions = {} # (source, destination) -> _Session
+        self._next_expiry = 0.0
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+
+    @property
+    def active(self):
+        return len(self._sessions)
+
+    def feed(self, can_id, data, now):
+        """Handles one TP.CM or TP.DT frame; returns (can_id, payload bytes) when it completes a message."""
+        if now >= self._next_expiry:
+            self.expire(now)
+        pf = (can_id >> 16) & 0xFF
+        destination = (can_id >> 8) & 0xFF
+        source = can_id & 0xFF
+        if pf == TP_DT_PF:
+            return self._data(source, destination, data, now)
+        if pf != TP_CM_PF or len(data) < 8:
+            return None
+        control = data[0]
+        if control == CM_BAM or control == CM_RTS:
+            self._open(can_id, source, destination, data, now)
+        elif control == CM_CTS:
+            # Sent by the receiver back to the sender: the session is keyed the other way round
+            session = self._sessions.get((destination, source))
+            if session is not None:
+                session.deadline = now + RTS_TIMEOUT
+        elif control == CM_ABORT:
+            # Either side may abort an RTS/CTS transfer; BAM cannot be aborted
+            for key in ((source, destination), (destination, source)):
+                session = self._sessions.get(key)
+                if session is not None and not session.bam:
+                    self._close(key, 'aborted')
+        elif control == CM_EOM_ACK:
+            pass # Needs nothing: the last data packet already completed the session
+        else:
+            self.stats['invalid'] += 1 # Not a J1939-21 control byte
+        return None
+
+    def _open(self, can_id, source, destination, data, now):
+        size = data[1] | data[2] << 8
+        packets = data[3]
+        bam = data[0] == CM_BAM
+        if not 9 <= size <= MAX_SIZE or packets != (size + 6) // 7 or (bam and destination != 0xFF):
+            self.stats['invalid'] += 1
+            return
+        key = (source, destination)
+        if key in self._sessions:
+            self._close(key, 'aborted') # A new announcement replaces an unfinished transfer
+        if not self._free:
+            self.stats['no_memory'] += 1
+            return
+        session = self._free.pop()
+        pgn = data[5] | data[6] << 8 | (data[7] & 0x03) << 16
+        session.start(pgn, (can_id >> 26) & 0x7, size, packets, bam, now + (BAM_TIMEOUT if bam else RTS_TIMEOUT))
+        self._sessions[key] = session
+        self.stats['started'] += 1
+
+    def _data(self, source, destination, data, now):
+        key = (source, destination)
+        session = self._sessions.get(key)
+        if session is None or not data:
+            return None # Not announced, or already given up on
+        seq = data[0]
+        if not 1 <= seq <= session.packets:
+            self.stats['invalid'] += 1
+            return None
+        offset = (seq - 1) * 7
+        chunk = data[1:8]
+        session.buffer[offset:offset + len(chunk)] = chunk
+        if not session.seen[seq]: # CTS may ask for packets again
+            session.seen[seq] = 1
+            session.received += 1
+        session.deadline = now + (BAM_TIMEOUT if session.bam else RTS_TIMEOUT)
+        if session.received < session.packets:
+            return None
+        payload = bytes(session.buffer[:session.size])
+        pgn = session.pgn
+        if (pgn >> 8) & 0xFF < 0xF0:
+            pgn = (pgn & 0x3FF00) | destination # PDU1: the destination goes in the PS byte of the ID
+        message_id = session.priority << 26 | pgn << 8 | source
+        self._close(key, 'completed')
+        return message_id, payload
+
+    def _close(self, key, outcome):
+        self._free.append(self._sessions.pop(key))
+        self.stats[outcome] += 1
+
+    def expire(self, now):
+        """Drops sessions whose sender or receiver has gone quiet for longer than the J1939 timeouts."""
+        self._next_expiry = now + EXPIRY_INTERVAL
+        for key, session in list(self._sessions.items()):
+            if session.deadline <= now:
+                self._close(key, 'timed_out')
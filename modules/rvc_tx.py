@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Per-interface transmit queue for commands sent by rvc-console.py.
+
+RV-C commands are customarily sent twice, a short interval apart. Doing that
+inline meant the curses thread slept between the two sends and the UI froze
+for every keypress. A TxQueue owns one interface's transmissions on its own
+thread instead: submit() only schedules a job and returns, the retransmits
+are kept in a heap ordered by due time rather than slept for, and callbacks
+report each send or failure back to the caller.
+
+The queue is bounded so a stuck bus cannot pile up commands; submit() refuses
+the job when it would not fit. Every job records when it was queued and when
+each of its frames went out, and the queue keeps the recent queue-to-wire
+latencies and its deepest backlog for the Stats tab.
+
+Jobs submitted with a key and a delay are coalesced: until the first frame of
+a keyed job goes out, another submit with the same key replaces its frame and
+pushes it back, so a held arrow key ends up as one command for the final level
+instead of a pair of frames per key repeat.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+STAT_NAMES = ('queued', 'sent', 'failed', 'dropped', 'coalesced') # coalesced = frames never sent because a newer submit replaced them
+LATENCY_SAMPLES = 256 # Recent first-send latencies kept for the average/maximum
+
+class TxJob:
+    """ One command: the frame, how often to send it, and what happened so far. """
+    __slots__ = ('can_id', 'data', 'repeats', 'interval', 'on_sent', 'on_failed', 'key', 'queued_at', 'due',
+                 'generation', 'merged', 'sent_at', 'failures')
+
+    def __init__(self, can_id, data, repeats, interval, on_sent, on_failed, key, queued_at, due):
+        self.can_id = can_id
+        self.data = data
+        self.repeats = repeats
+        self.interval = interval
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.key = key
+        self.queued_at = queued_at # time.monotonic() at the first submit()
+        self.due = due # When the first frame is scheduled
+        self.generation = 0 # Bumped when coalescing reschedules; older heap entries are skipped
+        self.merged = 0 # Later submits folded into this job
+        self.sent_at = [] # time.monotonic() of each successful send
+        self.failures = 0
+
+class TxQueue:
+    """ Sends submitted jobs on a background thread, retransmits included.
+
+    send(can_id, data) does the actual write and returns True on success; it
+    runs on the queue's thread only. on_sent(job, attempt) and
+    on_failed(job, attempt) are called there too, after each transmission, with
+    attempt counting from 0. A failed send does not cancel the retransmits.
+    """
+    def __init__(self, name, send, max_depth=64):
+        self.name = name
+        self.send = send
+        self.max_depth = max_depth
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES) # Seconds from a job falling due to its first send
+        self.press_latencies = deque(maxlen=LATENCY_SAMPLES) # Keyed jobs: seconds from the first submit() to the first send
+        self.peak_depth = 0
+        self._depth = 0
+        self._heap = [] # (due, seq, job, attempt, generation)
+        self._pending = {} # key -> keyed job whose first frame has not gone out yet
+        self._seq = itertools.count() # Keeps jobs due at the same time in submission order
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"TX-{name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Transmissions scheduled but not yet made, retransmits included."""
+        return self._depth
+
+    def submit(self, can_id, data, repeats=1, interval=0.05, on_sent=None, on_failed=None, key=None, delay=0.0, max_delay=None):
+        """
+        Schedules data to be sent repeats times, interval seconds apart, starting
+        delay seconds from now; returns the TxJob, or None if the queue is full.
+        With a key, a pending job of the same key is updated instead (frame,
+        callbacks and start time), but never started later than max_delay after
+        its first submit.
+        """
+        with self._cond:
+            if self._stopping:
+                self.stats['dropped'] += 1
+                return None
+            now = time.monotonic()
+            job = self._pending.get(key) if key is not None else None
+            if job is not None:
+                self.stats['coalesced'] += job.repeats
+                job.merged += 1
+                job.can_id, job.data = can_id, bytes(data)
+                job.on_sent, job.on_failed = on_sent, on_failed
+                due = now + delay
+                if max_delay is not None:
+                    due = max(now, min(due, job.queued_at + max_delay))
+                self._schedule(job, due) # Replaces the old entries, so the depth is unchanged
+                return job
+            if self._depth + repeats > self.max_depth:
+                self.stats['dropped'] += 1
+                return None
+            job = TxJob(can_id, bytes(data), repeats, interval, on_sent, on_failed, key, now, now + delay)
+            if key is not None:
+                self._pending[key] = job
+            self._schedule(job, job.due)
+            self._depth += repeats
+            self.stats['queued'] += 1
+            self.peak_depth = max(self.peak_depth, self._depth)
+        return job
+
+    def _schedule(self, job, due):
+        job.due = due
+        job.generation += 1
+        for attempt in range(job.repeats):
+            heapq.heappush(self._heap, (due + attempt * job.interval, next(self._seq), job, attempt, job.generation))
+        self._cond.notify()
+
+    def stop(self, timeout=1.0):
+        """Stops the thread; transmissions still waiting are discarded."""
+        with self._cond:
+            self._stopping = True
+            self._heap.clear()
+            self._pending.clear()
+            self._depth = 0
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+
+    def _next(self):
+        """Blocks until a transmission is due and pops it, or returns None when stopping."""
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, job, attempt, generation = self._heap[0]
+                if generation != job.generation:
+                    heapq.heappop(self._heap) # Superseded by a coalescing submit
+                    continue
+                wait = due - time.monotonic()
+                if wait <= 0:
+                    heapq.heappop(self._heap)
+                    self._depth -= 1
+                    if attempt == 0 and job.key is not None and self._pending.get(job.key) is job:
+                        del self._pending[job.key] # Sending now; later submits start a new job
+                    return job, attempt
+                self._cond.wait(wait) # Woken early if an earlier job is submitted
+            return None
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            job, attempt = item
+            try:
+                ok = self.send(job.can_id, job.data)
+            except Exception:
+                logging.exception(f"TX send failed on {self.name}")
+                ok = False
+            now = time.monotonic()
+            if ok:
+                if not job.sent_at:
+                    self.latencies.append(now - job.due)
+                    if job.key is not None:
+                        self.press_latencies.append(now - job.queued_at)
+                job.sent_at.append(now)
+                self.stats['sent'] += 1
+                callback = job.on_sent
+            else:
+                job.failures += 1
+                self.stats['failed'] += 1
+                callback = job.on_failed
+            if callback is not None:
+                try:
+                    callback(job, attempt)
+                except Exception:
+                    logging.exception(f"TX callback failed on {self.name}")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Watches files for changes with inotify, for rvc-console.py's config hot reload.
+
+Each file is watched through its directory, since editors and nixos-rebuild
+replace files by renaming over them and a watch on the file itself would be
+lost. The directory of every symlink on the way to the file is watched too,
+so a NixOS switch that only repoints /etc/static is seen. Bursts of events
+are debounced into one callback on the watcher's own thread. Where inotify is
+unavailable (not Linux, or out of watches) the files are polled with stat().
+
+Run this file directly to print a line whenever the given files change:
+
+    python3 rvc_watch.py /etc/nixos/files/rvc.json
+"""
+import ctypes
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+# struct inotify_event: int wd, u32 mask, u32 cookie, u32 len, char name[len]
+_event = struct.Struct('iIII')
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None # Not Linux; FileWatcher polls instead
+
+def watch_targets(path, _depth=0):
+    """
+    (directory, name) entries whose change can change what path reads: the file
+    itself plus every symlink on the way to it.
+    """
+    path = os.path.abspath(path)
+    parts = [part for part in path.split('/') if part]
+    current = '/'
+    for i, part in enumerate(parts):
+        step = os.path.join(current, part)
+        if _depth < 16 and os.path.islink(step):
+            try:
+                link = os.readlink(step)
+            except OSError:
+                break
+            return {(current, part)} | watch_targets(os.path.join(current, link, *parts[i + 1:]), _depth + 1)
+        current = step
+    # No symlinks left, so watching the directory really watches where the file lives
+    return {(os.path.dirname(path), os.path.basename(path))}
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+class FileWatcher:
+    """ Calls on_change() from a background thread after any of paths has changed.
+
+    on_change runs once per burst of changes, debounce seconds after the last
+    event, so a file written in several steps is only read when complete.
+    Exceptions from on_change are printed and watching continues.
+    """
+    def __init__(self, paths, on_change, debounce=0.5, poll_interval=2.0):
+        self.paths = list(paths)
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.mode = None # 'inotify' or 'poll' once started
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="Watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _targets(self):
+        targets = set()
+        for path in self.paths:
+            targets |= watch_targets(path)
+        return targets
+
+    def _changed(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"rvc_watch: change handler failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+    def _run(self):
+        funcs = _load_inotify()
+        fd = funcs[0](os.O_NONBLOCK | os.O_CLOEXEC) if funcs else -1
+        if fd < 0:
+            self.mode = 'poll'
+            self._poll()
+            return
+        self.mode = 'inotify'
+        try:
+            self._watch(fd, funcs[1], funcs[2])
+        finally:
+            os.close(fd)
+
+    def _watch(self, fd, add_watch, rm_watch):
+        watches = {} # wd -> directory
+        targets = set()
+
+        def rewatch():
+            nonlocal targets
+            targets = self._targets()
+            wanted = {directory for directory, _ in targets}
+            for wd, directory in list(watches.items()):
+                if directory not in wanted:
+                    rm_watch(fd, wd)
+                    del watches[wd]
+            for directory in wanted - set(watches.values()):
+                wd = add_watch(fd, os.fsencode(directory), WATCH_MASK)
+                if wd >= 0: # A missing directory is picked up on a later rewatch
+                    watches[wd] = directory
+
+        rewatch()
+        due = None # Monotonic time the pending change is delivered
+        while not self._stop.is_set():
+            timeout = 0.5 if due is None else max(0.0, min(0.5, due - time.monotonic()))
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if ready:
+                try:
+                    buf = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    buf = b''
+                off = 0
+                while off + _event.size <= len(buf):
+                    wd, mask, _, length = _event.unpack_from(buf, off)
+                    name = buf[off + _event.size:off + _event.size + length].rstrip(b'\0')
+                    off += _event.size + length
+                    if mask & IN_IGNORED:
+                        # Our own rm_watch, or the directory went away (then rewatch after the change)
+                        if watches.pop(wd, None) is not None:
+                            due = time.monotonic() + self.debounce
+                    elif mask & IN_Q_OVERFLOW or (watches.get(wd), os.fsdecode(name)) in targets:
+                        due = time.monotonic() + self.debounce
+            if due is not None and time.monotonic() >= due:
+                due = None
+                self._changed()
+                rewatch() # Symlinks may point somewhere new now
+
+    def _poll(self):
+        signatures = [_signature(path) for path in self.paths]
+        while not self._stop.wait(self.poll_interval):
+            current = [_signature(path) for path in self.paths]
+            if current != signatures:
+                signatures = current
+                self._changed()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: {sys.argv[0]} FILE...")
+    watcher = FileWatcher(sys.argv[1:], lambda: print(f"{time.strftime('%H:%M:%S')} changed", flush=True))
+    watcher.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()